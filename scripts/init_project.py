@@ -53,6 +53,12 @@ output:
   rendered: feedback_rendered
   feedback: feedback
 
+# Pre-review stages (wmf extract / render / run)
+pipeline:
+  jobs: null          # extraction workers; null = one per CPU core
+  render_jobs: 2      # concurrent LibreOffice processes
+  renderer: auto      # auto, libreoffice, excel or quicklook
+
 # Optional: Turnitin reports
 turnitin: turnitin
 
@@ -86,18 +92,15 @@ Settings: See `wmf-config.yaml`
 
 **Check dependencies:**
 ```bash
-python {framework}/skills/feedback/scripts/check_dependencies.py
+python {framework}/skills/feedback/scripts/wmf.py check
 ```
 
-**Extract text from submissions:**
+**Extract text and render Excel charts:**
 ```bash
-python {framework}/skills/feedback/scripts/extract_submission_text.py --input submissions --out feedback_extracted
+python {framework}/skills/feedback/scripts/wmf.py run
 ```
 
-**Render Excel charts:**
-```bash
-python {framework}/skills/feedback/scripts/render_xlsx_quicklook.py --input submissions --out feedback_rendered
-```
+Folders, worker counts and the chart renderer come from `wmf-config.yaml`; `wmf.py extract` and `wmf.py render` run one stage.
 
 ## Review Workflow
 
@@ -279,7 +282,7 @@ When this skill is invoked:
 
 2. **Check dependencies** by running:
    ```bash
-   python {framework}/skills/feedback/scripts/check_dependencies.py
+   python {framework}/skills/feedback/scripts/wmf.py check
    ```
    If dependencies are missing, prompt the user to install them before continuing.
 
@@ -290,36 +293,34 @@ When this skill is invoked:
 
    If any are missing, tell the user what's needed and stop.
 
-4. **Extract text from submissions**:
-   ```bash
-   python {framework}/skills/feedback/scripts/extract_submission_text.py --input submissions --out feedback_extracted
-   ```
-
-5. **Render Excel charts** (if any .xlsx files exist):
+4. **Extract text and render Excel charts** in one run:
    ```bash
-   python {framework}/skills/feedback/scripts/render_xlsx_quicklook.py --input submissions --out feedback_rendered
+   python {framework}/skills/feedback/scripts/wmf.py run
    ```
+   Folders, worker counts and the chart renderer come from `wmf-config.yaml`. For rounds, add `--round N`.
 
-6. **Read the framework instructions** from `{framework}/skills/feedback/SKILL.md`
+5. **Read the framework instructions** from `{framework}/skills/feedback/SKILL.md`
 
-7. **Read reference materials**:
+6. **Read reference materials**:
    - `assignment.md`
    - `rubric.md`
    - `{framework}/skills/feedback/references/economical_writing_principles.md`
    - `course_concepts.md` (if present)
 
-8. **Enumerate submissions** by parsing filenames. Group by username (Canvas format: `username_assignmentID_submissionID_filename`).
+7. **Enumerate submissions** by parsing filenames. Group by username (Canvas format: `username_assignmentID_submissionID_filename`).
 
-9. **Read parallelism setting** from `wmf-config.yaml`: `review.max_parallel_agents` (default: 3)
+8. **Read parallelism setting** from `wmf-config.yaml`: `review.max_parallel_agents` (default: 3)
 
-10. **Process submissions in parallel batches**:
-    - For each batch of N submissions (where N = max_parallel_agents):
-      - Spawn N Task agents **in a single message** with `subagent_type: "general-purpose"`
-      - Each agent follows the isolated review workflow from the framework SKILL.md
-      - **Wait for all N to complete** before starting the next batch
+9. **Review submissions from a longest-first queue**:
+    - Get the queue: `python {framework}/skills/feedback/scripts/dispatch.py plan --input submissions` (largest extracted text first; writers that already have `feedback/{{username}}.md` are left out, so an interrupted run picks up where it stopped)
+    - Spawn the first N Task agents (N = max_parallel_agents) **in a single message** with `subagent_type: "general-purpose"`
+    - **As soon as any agent finishes, spawn one for the next writer in the queue** — do not wait for the others, so one long submission never leaves the other slots idle
+    - If an agent fails on a rate limit, put its writer back at the front of the queue and halve N (minimum 1); after N reviews in a row succeed, raise N by one, up to max_parallel_agents
+    - Each agent follows the isolated review workflow from the framework SKILL.md
     - Each agent writes to `feedback/{{username}}.md`
+    - For unattended runs with a command-line reviewer, `dispatch.py run --input submissions --slots N --command '...'` does the same scheduling itself
 
-11. **Report completion** with summary of submissions reviewed.
+10. **Report completion** with summary of submissions reviewed.
 
 **Parallelism settings** (in `wmf-config.yaml`):
 - `max_parallel_agents: 3` — Default, good balance of speed and reliability
@@ -333,6 +334,7 @@ If using rounds (`submissions/round1/`, `submissions/round2/`):
 1. Check `wmf-config.yaml` for `submissions.rounds.enabled`
 2. Use round-specific folders: `feedback_extracted_round{{N}}/`, `feedback_round{{N}}/`
 3. For resubmissions, compare to prior round feedback per `review.compare_to_round` config setting
+4. Diff each writer against the previous round first: `python {framework}/skills/feedback/scripts/round_diff.py --prev submissions/round{{N-1}} --curr submissions/round{{N}} --out feedback_diff_round{{N}}`, and review only the changes it lists
 
 ## Output
 
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Which PDF text, OCR and chart rendering backends this machine has, and which to use.
+
+Candidates per stage, in their fallback order (ORDER):
+
+    pdf_text   pymupdf, pypdfium2 (in process), pdftotext (poppler), pypdf (in process)
+    ocr        tesseract (pages rasterized with pdftoppm)
+    render     libreoffice, quicklook, excel; quicklook first on macOS
+
+The first use on a machine probes them all: tool paths and versions, and
+for PDF text the time each backend takes on a synthetic 10-page PDF (one
+that gets the text wrong is marked unavailable). The result is cached in
+~/.cache/wmf/backends.json (WMF_BACKENDS overrides the path) and probed
+again when a tool or library appears, disappears or changes. Render
+speeds are learned from real runs (record_speed), or timed on a sample
+workbook with --measure-render.
+
+choose(stage) returns the fastest working backend: measured ones by
+speed, then the others in ORDER, so the choice is deterministic. When a
+stage has nothing that works it raises RuntimeError naming what is
+missing, so a batch fails before it starts instead of file by file.
+
+Usage:
+    python backends.py                    # what each stage has, fastest first
+    python backends.py --refresh          # probe again
+    python backends.py --measure-render   # also time each renderer on a sample workbook
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from importlib import metadata
+from pathlib import Path
+
+from metrics import run, stage
+from ooxml import REL_NS, S_NS
+
+REGISTRY_VERSION = 1
+ORDER = {
+    'pdf_text': ('pymupdf', 'pypdfium2', 'pdftotext', 'pypdf'),
+    'ocr': ('tesseract',),
+    'render': ('quicklook', 'libreoffice', 'excel') if sys.platform == 'darwin' else ('libreoffice', 'quicklook', 'excel'),
+}
+LABELS = {'pdf_text': 'PDF text', 'ocr': 'OCR', 'render': 'chart rendering'}
+
+# Watched for changes: a different path or modification time means probe again
+TOOLS = ('pdftotext', 'pdftoppm', 'tesseract', 'qlmanage', 'osascript')
+MODULES = {'pymupdf': ('pymupdf', 'fitz'), 'pypdfium2': ('pypdfium2',), 'pypdf': ('pypdf',)}
+DISTRIBUTIONS = {'pymupdf': 'PyMuPDF', 'pypdfium2': 'pypdfium2', 'pypdf': 'pypdf'}
+SOFFICE_FALLBACKS = [
+    '/Applications/LibreOffice.app/Contents/MacOS/soffice',
+    '/usr/lib/libreoffice/program/soffice',
+    '/opt/libreoffice/program/soffice',
+]
+EXCEL_APP = Path('/Applications/Microsoft Excel.app')
+SAMPLE_LINE = "Sample page {page}, line {line}: the quick brown fox jumps over the lazy dog."
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+C_NS = 'http://schemas.openxmlformats.org/drawingml/2006/chart'
+XDR_NS = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+_registry = None
+
+
+def find_soffice():
+    """Locate LibreOffice: PATH first, then the usual install locations."""
+    for name in ('soffice', 'libreoffice'):
+        found = shutil.which(name)
+        if found:
+            return found
+    for candidate in SOFFICE_FALLBACKS:
+        if Path(candidate).exists():
+            return candidate
+    raise RuntimeError("LibreOffice not found. Install it and make sure `soffice` is on PATH.")
+
+
+def registry_path():
+    if os.environ.get('WMF_BACKENDS'):
+        return Path(os.environ['WMF_BACKENDS'])
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'wmf' / 'backends.json'
+
+
+def _found():
+    """{tool or module: [path, mtime]} for everything the probe depends on."""
+    paths = {tool: shutil.which(tool) for tool in TOOLS}
+    try:
+        paths['soffice'] = find_soffice()
+    except RuntimeError:
+        paths['soffice'] = None
+    paths['excel'] = str(EXCEL_APP) if sys.platform == 'darwin' and EXCEL_APP.exists() else None
+    for name, modules in MODULES.items():
+        specs = [importlib.util.find_spec(module) for module in modules]
+        paths[name] = next((spec.origin for spec in specs if spec is not None and spec.origin), None)
+    found = {}
+    for name, path in paths.items():
+        try:
+            found[name] = [path, os.stat(path).st_mtime_ns] if path else None
+        except OSError:
+            found[name] = None
+    return found
+
+
+def _fingerprint(found):
+    key = [REGISTRY_VERSION, sys.platform, platform.node(), sys.executable, found]
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _version(cmd):
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r'(\d+(?:\.\d+)+)', result.stdout + result.stderr)
+    return match.group(1) if match else None
+
+
+def _module_version(name):
+    try:
+        return metadata.version(DISTRIBUTIONS[name])
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _excel_version():
+    import plistlib
+
+    try:
+        with (EXCEL_APP / 'Contents' / 'Info.plist').open('rb') as f:
+            return plistlib.load(f).get('CFBundleShortVersionString')
+    except (OSError, ValueError):
+        return None
+
+
+def _pages_pdftotext(path, tool):
+    text = run([tool, str(path), '-'], name='pdftotext').stdout
+    pages = text.split('\f')
+    if pages and not pages[-1].strip():
+        pages.pop()  # pdftotext ends every page, including the last, with \f
+    return pages
+
+
+def _pages_pymupdf(path):
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    with pymupdf.open(str(path)) as doc:
+        return [page.get_text() for page in doc]
+
+
+def _pages_pypdfium2(path):
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(str(path))
+    try:
+        pages = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_range().replace('\r\n', '\n'))
+            textpage.close()
+            page.close()
+        return pages
+    finally:
+        pdf.close()
+
+
+def _pages_pypdf(path):
+    from pypdf import PdfReader
+
+    return [page.extract_text() or '' for page in PdfReader(str(path)).pages]
+
+
+PDF_TEXT = {'pymupdf': _pages_pymupdf, 'pypdfium2': _pages_pypdfium2, 'pypdf': _pages_pypdf}
+
+
+def pdf_pages(path, backend=None):
+    """Text of each page of a PDF, read with `backend` (default: the one choose() picks)."""
+    backend = backend or choose('pdf_text')
+    if backend == 'pdftotext':
+        return _pages_pdftotext(path, entry('pdf_text', backend)['path'] or 'pdftotext')
+    with stage(backend):
+        return PDF_TEXT[backend](path)
+
+
+def sample_pdf(pages):
+    """A text-only PDF of `pages` letter pages with 40 lines each, for timing PDF text backends."""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page in range(1, pages + 1):
+        lines = ' '.join(f"({SAMPLE_LINE.format(page=page, line=line)}) '" for line in range(1, 41))
+        content = f"BT /F1 10 Tf 14 TL 72 740 Td {lines} ET".encode('latin1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % len(objects))
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % kid for kid in kids), pages)
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def sample_xlsx(rows=20):
+    """A one-sheet workbook with a year column, a value column and a line chart of them, for timing renderers."""
+    def rels(*items):
+        return (f'<Relationships xmlns="{PKG_REL_NS}">'
+                + ''.join(f'<Relationship Id="rId{n}" Type="{REL_NS}/{kind}" Target="{target}"/>'
+                          for n, (kind, target) in enumerate(items, 1))
+                + '</Relationships>')
+
+    def cache(values):
+        return (f'<c:numCache><c:ptCount val="{len(values)}"/>'
+                + ''.join(f'<c:pt idx="{i}"><c:v>{value}</c:v></c:pt>' for i, value in enumerate(values))
+                + '</c:numCache>')
+
+    years = [2000 + r for r in range(rows)]
+    values = [100 + 7 * r + (r % 3) * 5 for r in range(rows)]
+    cells = ''.join(f'<row r="{r + 2}"><c r="A{r + 2}"><v>{years[r]}</v></c><c r="B{r + 2}"><v>{values[r]}</v></c></row>'
+                    for r in range(rows))
+    last = rows + 1
+    parts = {
+        '[Content_Types].xml': (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/drawings/drawing1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.drawing+xml"/>'
+            '<Override PartName="/xl/charts/chart1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.drawingml.chart+xml"/></Types>'),
+        '_rels/.rels': rels(('officeDocument', 'xl/workbook.xml')),
+        'xl/workbook.xml': (f'<workbook xmlns="{S_NS}" xmlns:r="{REL_NS}"><sheets>'
+                            '<sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+        'xl/_rels/workbook.xml.rels': rels(('worksheet', 'worksheets/sheet1.xml')),
+        'xl/worksheets/sheet1.xml': (
+            f'<worksheet xmlns="{S_NS}" xmlns:r="{REL_NS}"><sheetData><row r="1">'
+            '<c r="A1" t="inlineStr"><is><t>Year</t></is></c><c r="B1" t="inlineStr"><is><t>Value</t></is></c></row>'
+            f'{cells}</sheetData><drawing r:id="rId1"/></worksheet>'),
+        'xl/worksheets/_rels/sheet1.xml.rels': rels(('drawing', '../drawings/drawing1.xml')),
+        'xl/drawings/drawing1.xml': (
+            f'<xdr:wsDr xmlns:xdr="{XDR_NS}" xmlns:a="{A_NS}" xmlns:c="{C_NS}" xmlns:r="{REL_NS}">'
+            '<xdr:twoCellAnchor><xdr:from><xdr:col>3</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>1</xdr:row>'
+            '<xdr:rowOff>0</xdr:rowOff></xdr:from><xdr:to><xdr:col>11</xdr:col><xdr:colOff>0</xdr:colOff>'
+            '<xdr:row>16</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:to><xdr:graphicFrame macro="">'
+            '<xdr:nvGraphicFramePr><xdr:cNvPr id="2" name="Chart 1"/><xdr:cNvGraphicFramePr/></xdr:nvGraphicFramePr>'
+            '<xdr:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/></xdr:xfrm><a:graphic>'
+            f'<a:graphicData uri="{C_NS}"><c:chart r:id="rId1"/></a:graphicData></a:graphic>'
+            '</xdr:graphicFrame><xdr:clientData/></xdr:twoCellAnchor></xdr:wsDr>'),
+        'xl/drawings/_rels/drawing1.xml.rels': rels(('chart', '../charts/chart1.xml')),
+        'xl/charts/chart1.xml': (
+            f'<c:chartSpace xmlns:c="{C_NS}" xmlns:a="{A_NS}"><c:chart><c:plotArea><c:lineChart>'
+            '<c:grouping val="standard"/><c:ser><c:idx val="0"/><c:order val="0"/>'
+            f'<c:cat><c:numRef><c:f>Data!$A$2:$A${last}</c:f>{cache(years)}</c:numRef></c:cat>'
+            f'<c:val><c:numRef><c:f>Data!$B$2:$B${last}</c:f>{cache(values)}</c:numRef></c:val></c:ser>'
+            '<c:axId val="1"/><c:axId val="2"/></c:lineChart>'
+            '<c:catAx><c:axId val="1"/><c:scaling/><c:axPos val="b"/><c:crossAx val="2"/></c:catAx>'
+            '<c:valAx><c:axId val="2"/><c:scaling/><c:axPos val="l"/><c:crossAx val="1"/></c:valAx>'
+            '</c:plotArea></c:chart></c:chartSpace>'),
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, xml in parts.items():
+            z.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>' + xml)
+    return buf.getvalue()
+
+
+def _time_pdf_text(name, tool, sample, pages):
+    """Best of three runs on the sample PDF, after checking that every page comes back."""
+    def read():
+        return _pages_pdftotext(sample, tool) if name == 'pdftotext' else PDF_TEXT[name](sample)
+
+    texts = read()  # also pays for the import
+    if len(texts) != pages or not all(len(text.split()) > 20 for text in texts):
+        raise ValueError(f"read {len(texts)} of {pages} pages from a sample PDF, some of them empty")
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        read()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4)
+
+
+def _probe(found):
+    def path(name):
+        return found[name][0] if found.get(name) else None
+
+    def add(stage_name, name, location=None, version=None, note=None):
+        entries[stage_name].append({'name': name, 'available': note is None, 'path': location,
+                                    'version': version, 'seconds': None, 'note': note or ''})
+
+    entries = {stage_name: [] for stage_name in ORDER}
+    for name in ('pymupdf', 'pypdfium2', 'pypdf'):
+        if path(name):
+            add('pdf_text', name, path(name), _module_version(name))
+        else:
+            add('pdf_text', name, note=f"not installed (pip install {DISTRIBUTIONS[name].lower()})")
+    if path('pdftotext'):
+        add('pdf_text', 'pdftotext', path('pdftotext'), _version([path('pdftotext'), '-v']))
+    else:
+        add('pdf_text', 'pdftotext', note='not installed (poppler)')
+
+    if not path('tesseract'):
+        add('ocr', 'tesseract', note='not installed')
+    elif not path('pdftoppm'):
+        add('ocr', 'tesseract', path('tesseract'), note='needs pdftoppm (poppler) to rasterize pages')
+    else:
+        add('ocr', 'tesseract', path('tesseract'), _version([path('tesseract'), '--version']))
+
+    if not path('soffice'):
+        add('render', 'libreoffice', note='not installed')
+    elif not path('pdftoppm'):
+        add('render', 'libreoffice', path('soffice'), note='needs pdftoppm (poppler) for the PNGs')
+    else:
+        add('render', 'libreoffice', path('soffice'), _version([path('soffice'), '--version']))
+    if sys.platform != 'darwin' or not path('qlmanage'):
+        add('render', 'quicklook', note='macOS only (qlmanage)')
+    else:
+        add('render', 'quicklook', path('qlmanage'), platform.mac_ver()[0] or None)
+    if not path('excel') or not path('osascript'):
+        add('render', 'excel', note='needs Microsoft Excel on macOS')
+    elif not path('pdftoppm'):
+        add('render', 'excel', path('excel'), note='needs pdftoppm (poppler) for the PNGs')
+    else:
+        add('render', 'excel', path('excel'), _excel_version())
+
+    usable = [e for e in entries['pdf_text'] if e['available']]
+    if usable:
+        pages = 10
+        with tempfile.TemporaryDirectory(prefix='wmf-probe-') as tmp:
+            sample = Path(tmp) / 'sample.pdf'
+            sample.write_bytes(sample_pdf(pages))
+            for e in usable:
+                try:
+                    e['seconds'] = _time_pdf_text(e['name'], e['path'], sample, pages)
+                except Exception as exc:
+                    e['available'] = False
+                    e['note'] = f"failed on a sample PDF: {exc}"
+    return entries
+
+
+def _save(reg):
+    path = registry_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(reg, indent=2) + '\n', encoding='utf-8')
+        os.replace(tmp, path)
+    except OSError:
+        pass  # a read-only home: keep the probe for this process only
+
+
+def registry(refresh=False):
+    """The probed backends, from the cache file while nothing they depend on has changed."""
+    global _registry
+    if _registry is not None and not refresh:
+        return _registry
+    found = _found()
+    fingerprint = _fingerprint(found)
+    reg = None
+    if not refresh:
+        try:
+            reg = json.loads(registry_path().read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            reg = None
+        if reg and reg.get('fingerprint') != fingerprint:
+            reg = None
+    if reg is None:
+        reg = {'version': REGISTRY_VERSION, 'fingerprint': fingerprint,
+               'probed': time.strftime('%Y-%m-%dT%H:%M:%S'), 'backends': _probe(found)}
+        _save(reg)
+    _registry = reg
+    return reg
+
+
+def ranked(stage_name):
+    """A stage's backends, best first: working before not, measured by speed, then in ORDER."""
+    order = ORDER[stage_name]
+    return sorted(registry()['backends'][stage_name],
+                  key=lambda e: (not e['available'], e['seconds'] is None, e['seconds'] or 0,
+                                 order.index(e['name'])))
+
+
+def entry(stage_name, name):
+    for e in registry()['backends'][stage_name]:
+        if e['name'] == name:
+            return e
+    raise RuntimeError(f"unknown {LABELS[stage_name]} backend: {name}")
+
+
+def choose(stage_name, preferred=None):
+    """Name of the backend to use for a stage; `preferred` (other than 'auto') is used if it works."""
+    if preferred and preferred != 'auto':
+        e = entry(stage_name, preferred)
+        if not e['available']:
+            raise RuntimeError(f"{preferred} cannot be used for {LABELS[stage_name]}: {e['note']}")
+        return preferred
+    entries = ranked(stage_name)
+    if not entries or not entries[0]['available']:
+        reasons = '; '.join(f"{e['name']}: {e['note']}" for e in entries)
+        raise RuntimeError(f"no {LABELS[stage_name]} backend ({reasons})")
+    return entries[0]['name']
+
+
+def record_speed(stage_name, name, seconds):
+    """Fold a measured time per item (e.g. seconds per workbook) into the cached speed."""
+    e = entry(stage_name, name)
+    e['seconds'] = round(seconds if e['seconds'] is None else 0.7 * e['seconds'] + 0.3 * seconds, 4)
+    _save(registry())
+
+
+def _render_sample(name, path, out_dir):
+    if name == 'libreoffice':
+        from render_xlsx import render_many
+
+        outcome = render_many([path], out_dir, jobs=1, cache=False)[path]
+        if isinstance(outcome, Exception):
+            raise outcome
+    elif name == 'excel':
+        from render_xlsx_excel import render_xlsx
+
+        render_xlsx(path, out_dir)
+    else:
+        from render_xlsx_quicklook import render_xlsx
+
+        render_xlsx(path, out_dir)
+
+
+def measure_renderers():
+    """Time each working renderer on a small one-chart workbook and cache the result."""
+    with tempfile.TemporaryDirectory(prefix='wmf-probe-') as tmp:
+        sample = Path(tmp) / 'sample.xlsx'
+        sample.write_bytes(sample_xlsx())
+        for e in registry()['backends']['render']:
+            if not e['available']:
+                continue
+            start = time.perf_counter()
+            try:
+                _render_sample(e['name'], sample, Path(tmp) / e['name'])
+            except Exception as exc:
+                e['available'] = False
+                e['note'] = f"failed to render a sample workbook: {exc}"
+                continue
+            e['seconds'] = round(time.perf_counter() - start, 4)
+    _save(registry())
+
+
+def describe():
+    """One line per backend, fastest first within each stage."""
+    lines = []
+    for stage_name in ORDER:
+        lines.append(f"{LABELS[stage_name]}:")
+        for rank, e in enumerate(ranked(stage_name)):
+            if e['available']:
+                speed = f"{e['seconds'] * 1000:.0f} ms" if e['seconds'] is not None else 'not measured'
+                version = f" {e['version']}" if e['version'] else ''
+                mark = '*' if rank == 0 else ' '
+                lines.append(f"  {mark} {e['name']}{version} ({speed})")
+            else:
+                lines.append(f"    {e['name']}: {e['note']}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Probe and list the PDF text, OCR and rendering backends.')
+    parser.add_argument('--refresh', action='store_true', help='Probe again instead of using the cached result')
+    parser.add_argument('--measure-render', action='store_true',
+                        help='Also time each renderer on a small sample workbook')
+    parser.add_argument('--json', action='store_true', help='Print the registry as JSON')
+    args = parser.parse_args()
+
+    registry(refresh=args.refresh)
+    if args.measure_render:
+        measure_renderers()
+    if args.json:
+        print(json.dumps(registry(), indent=2))
+        return
+    print('\n'.join(describe()))
+    print(f"(* = used; cached in {registry_path()})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark the extractors on a corpus and compare against a saved run.
+
+Each extractor (docx, xlsx, pdf) runs in its own fresh process over the
+corpus files of its type, through the same extract() call the batch
+uses (uncached, writing into a scratch directory), so its peak RSS is
+not mixed up with the other extractors or with this harness. Reported
+per extractor: files and MB per second, p50/p95/max per-file latency,
+peak RSS of the extractor process, and peak RSS of the largest tool it
+ran (pdftotext, pdftoppm, tesseract), where most of the PDF
+extractor's memory goes.
+
+Build a corpus with synth_corpus.py; its corpus.json is recorded with the
+results, and --compare warns when the baseline was run on a different
+corpus.
+
+Usage:
+    python synth_corpus.py --out corpus --preset medium
+    python benchmark.py --corpus corpus --save bench-before.json
+    python benchmark.py --corpus corpus --compare bench-before.json [--fail-on-regression]
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from backends import choose
+
+EXTRACTORS = ('docx', 'xlsx', 'pdf')
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def _run_extractor(paths, repeat):
+    """Worker: extract every file `repeat` times; returns latencies and peak RSS (own, tools)."""
+    from extract_submission_text import extract
+
+    latencies = []
+    with tempfile.TemporaryDirectory(prefix='wmf-bench-') as tmp:
+        for _ in range(repeat):
+            for path in paths:
+                out_dir = Path(tmp) / 'out'
+                out_dir.mkdir()
+                start = time.perf_counter()
+                extract(Path(path), out_dir)
+                latencies.append(time.perf_counter() - start)
+                shutil.rmtree(out_dir)
+    # ru_maxrss is in KB on Linux and bytes on macOS; RUSAGE_CHILDREN is the largest reaped child
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    child_peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return latencies, peak_mb, child_peak_mb
+
+
+def bench_extractor(paths, repeat=1):
+    ctx = multiprocessing.get_context('spawn')  # a fresh interpreter: RSS belongs to this extractor alone
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        start = time.perf_counter()
+        latencies, peak_mb, child_peak_mb = pool.submit(_run_extractor, [str(p) for p in paths], repeat).result()
+    size = sum(p.stat().st_size for p in paths) * repeat
+    busy = sum(latencies)
+    latencies.sort()
+    return {
+        'files': len(paths),
+        'runs': len(latencies),
+        'mb': round(size / 1e6, 3),
+        'seconds': round(busy, 4),
+        'wall_seconds': round(time.perf_counter() - start, 4),
+        'files_per_s': round(len(latencies) / busy, 2) if busy else None,
+        'mb_per_s': round(size / 1e6 / busy, 3) if busy else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        'peak_rss_mb': round(peak_mb, 1),
+        'child_peak_rss_mb': round(child_peak_mb, 1),
+    }
+
+
+def corpus_fingerprint(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(f"{path.name}\0{path.stat().st_size}\0".encode('utf-8'))
+        h.update(hashlib.sha256(path.read_bytes()).digest())
+    return h.hexdigest()[:16]
+
+
+def run_benchmark(corpus_dir, extractors=EXTRACTORS, repeat=1):
+    paths = sorted(p for p in corpus_dir.iterdir() if p.suffix.lower().lstrip('.') in EXTRACTORS)
+    spec = {}
+    if (corpus_dir / 'corpus.json').exists():
+        spec = json.loads((corpus_dir / 'corpus.json').read_text(encoding='utf-8'))
+        spec.pop('files', None)
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+        'corpus': {'path': str(corpus_dir), 'fingerprint': corpus_fingerprint(paths), 'spec': spec},
+        'extractors': {},
+        'skipped': {},
+    }
+    for kind in extractors:
+        files = [p for p in paths if p.suffix.lower() == f'.{kind}']
+        if not files:
+            continue
+        if kind == 'pdf':
+            try:
+                backend = choose('pdf_text')
+            except RuntimeError as exc:
+                results['skipped'][kind] = str(exc)
+                continue
+        print(f"  {kind}: {len(files)} files...", file=sys.stderr)
+        results['extractors'][kind] = bench_extractor(files, repeat)
+        if kind == 'pdf':
+            results['extractors'][kind]['backend'] = backend
+            try:
+                choose('ocr')
+            except RuntimeError as exc:
+                results['extractors'][kind]['note'] = f"scanned pages fail without OCR: {exc}"
+    return results
+
+
+def format_results(results):
+    lines = [f"{'extractor':<10}{'files':>7}{'MB':>9}{'files/s':>10}{'MB/s':>9}"
+             f"{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'RSS MB':>9}{'tool MB':>9}"]
+    for kind, r in results['extractors'].items():
+        lines.append(f"{kind:<10}{r['files']:>7}{r['mb']:>9.2f}{r['files_per_s'] or 0:>10.1f}{r['mb_per_s'] or 0:>9.2f}"
+                     f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['max_ms']:>10.1f}{r['peak_rss_mb']:>9.1f}"
+                     f"{r.get('child_peak_rss_mb', 0):>9.1f}")
+        if r.get('backend'):
+            lines.append(f"  backend: {r['backend']}")
+        if r.get('note'):
+            lines.append(f"  note: {r['note']}")
+    for kind, reason in results['skipped'].items():
+        lines.append(f"{kind:<10}skipped: {reason}")
+    return '\n'.join(lines)
+
+
+def compare(results, baseline, threshold=0.10):
+    """(report lines, regressions) comparing latency, throughput and RSS to a baseline run."""
+    lines = []
+    regressions = []
+    if results['corpus']['fingerprint'] != baseline.get('corpus', {}).get('fingerprint'):
+        lines.append("WARNING: baseline was run on a different corpus; the comparison is not like for like")
+    lines.append(f"{'extractor':<10}{'metric':<18}{'baseline':>11}{'now':>11}{'change':>9}")
+    for kind, now in results['extractors'].items():
+        before = baseline.get('extractors', {}).get(kind)
+        if not before:
+            lines.append(f"{kind:<10}(not in baseline)")
+            continue
+        for metric, higher_is_worse in (('p50_ms', True), ('p95_ms', True), ('files_per_s', False),
+                                        ('peak_rss_mb', True), ('child_peak_rss_mb', True)):
+            old, new = before.get(metric), now.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if higher_is_worse else change < -threshold
+            flag = '  REGRESSION' if worse else ''
+            if worse:
+                regressions.append(f"{kind} {metric} {change:+.0%}")
+            lines.append(f"{kind:<10}{metric:<18}{old:>11.2f}{new:>11.2f}{change:>+9.0%}{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extractors on a (synthetic) corpus.')
+    parser.add_argument('--corpus', required=True, help='Corpus folder (see synth_corpus.py)')
+    parser.add_argument('--extractors', default=','.join(EXTRACTORS),
+                        help='Comma-separated extractors to run (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over each file (default: %(default)s)')
+    parser.add_argument('--save', metavar='FILE', help='Write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative change counted as a regression (default: %(default)s)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 on any regression')
+    args = parser.parse_args()
+
+    corpus_dir = Path(args.corpus)
+    if not corpus_dir.is_dir():
+        print(f"ERROR: {corpus_dir} is not a directory", file=sys.stderr)
+        sys.exit(1)
+    extractors = [kind.strip() for kind in args.extractors.split(',') if kind.strip()]
+    unknown = set(extractors) - set(EXTRACTORS)
+    if unknown:
+        parser.error(f"unknown extractor(s): {', '.join(sorted(unknown))}")
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+
+    results = run_benchmark(corpus_dir, extractors, max(1, args.repeat))
+    print(format_results(results))
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + '\n', encoding='utf-8')
+        print(f"Saved: {args.save}", file=sys.stderr)
+    if baseline:
+        lines, regressions = compare(results, baseline, args.threshold)
+        print()
+        print('\n'.join(lines))
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
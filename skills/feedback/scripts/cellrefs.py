@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+A1-style cell reference helpers shared by the formula tools.
+"""
+
+import re
+
+# An A1 reference, optionally sheet-qualified, outside of string literals.
+# Group names: sheet (quoted or bare), c_abs, col, r_abs, row.
+REF_RE = re.compile(
+    r"""(?P<string>"(?:[^"]|"")*")
+      | (?:(?P<sheet>'(?:[^']|'')+'|[A-Za-z_][A-Za-z0-9_.]*)!)?
+        (?<![A-Za-z0-9_.$])
+        (?P<c_abs>\$?)(?P<col>[A-Z]{1,3})(?P<r_abs>\$?)(?P<row>[0-9]+)
+        (?![A-Za-z0-9_(!])""",
+    re.VERBOSE,
+)
+
+# Any reference a formula can make to a block of cells: a cell or cell
+# range (A1, $A$1:B9), a whole-column range (A:C) or a whole-row range
+# (3:5), optionally sheet-qualified. String literals are matched so they
+# can be skipped.
+RANGE_RE = re.compile(
+    r"""(?P<string>"(?:[^"]|"")*")
+      | (?:(?P<sheet>'(?:[^']|'')+'|(?:\[[^\]]+\])?[A-Za-z_][A-Za-z0-9_.]*)!)?
+        (?:
+            (?<![A-Za-z0-9_.$:])
+            (?P<start>\$?[A-Z]{1,3}\$?[0-9]+)(?::(?P<end>\$?[A-Z]{1,3}\$?[0-9]+))?
+            (?![A-Za-z0-9_(!:])
+          | (?<![A-Za-z0-9_.$:])(?P<cols>\$?[A-Z]{1,3}:\$?[A-Z]{1,3})(?![A-Za-z0-9_(!:])
+          | (?<![A-Za-z0-9_.$:])(?P<rows>\$?[0-9]+:\$?[0-9]+)(?![A-Za-z0-9_(!:])
+        )""",
+    re.VERBOSE,
+)
+
+MAX_ROW = 1048576
+MAX_COL = 16384
+
+
+def col_to_index(col):
+    """'A' -> 1, 'AA' -> 27."""
+    index = 0
+    for ch in col.upper():
+        index = index * 26 + ord(ch) - 64
+    return index
+
+
+def index_to_col(index):
+    """1 -> 'A', 27 -> 'AA'."""
+    col = ''
+    while index > 0:
+        index, rem = divmod(index - 1, 26)
+        col = chr(65 + rem) + col
+    return col
+
+
+def split_ref(ref):
+    """'$B$15' -> (2, 15)."""
+    match = re.fullmatch(r'\$?([A-Za-z]{1,3})\$?([0-9]+)', ref)
+    if not match:
+        raise ValueError(f"not a cell reference: {ref!r}")
+    return col_to_index(match.group(1)), int(match.group(2))
+
+
+def unquote_sheet(sheet):
+    if sheet and sheet.startswith("'"):
+        return sheet[1:-1].replace("''", "'")
+    return sheet
+
+
+def to_r1c1(formula, ref):
+    """Rewrite a formula's A1 references relative to the cell `ref`.
+
+    Formulas filled down or across a range become identical in R1C1 form,
+    e.g. =B15/C15 in D15 and =B16/C16 in D16 both become =RC[-2]/RC[-1].
+    """
+    col0, row0 = split_ref(ref)
+
+    def convert(match):
+        if match.group('string'):
+            return match.group('string')
+        col, row = col_to_index(match.group('col')), int(match.group('row'))
+        r = f"R{row}" if match.group('r_abs') else ('R' if row == row0 else f"R[{row - row0}]")
+        c = f"C{col}" if match.group('c_abs') else ('C' if col == col0 else f"C[{col - col0}]")
+        sheet = match.group('sheet')
+        return (f"{sheet}!" if sheet else '') + r + c
+
+    return REF_RE.sub(convert, formula)
+
+
+def shift_formula(formula, rows, cols):
+    """Move a formula's relative references by (rows, cols).
+
+    This is how Excel fills a shared formula (<f t="shared" si="..."/>)
+    from its master cell into the rest of its range.
+    """
+    def shift(match):
+        if match.group('string'):
+            return match.group('string')
+        col = match.group('col')
+        row = match.group('row')
+        if not match.group('c_abs'):
+            col = index_to_col(col_to_index(col) + cols)
+        if not match.group('r_abs'):
+            row = str(int(row) + rows)
+        sheet = match.group('sheet')
+        return (f"{sheet}!" if sheet else '') + match.group('c_abs') + col + match.group('r_abs') + row
+
+    return REF_RE.sub(shift, formula)
+
+
+def formula_refs(formula):
+    """Blocks of cells a formula reads, as (sheet or None, col1, row1, col2, row2).
+
+    Defined names, structured table references and references to other
+    workbooks are not resolved.
+    """
+    refs = []
+    for match in RANGE_RE.finditer(formula):
+        if match.group('string'):
+            continue
+        sheet = unquote_sheet(match.group('sheet'))
+        if sheet and sheet.startswith('['):
+            continue
+        if match.group('start'):
+            c1, r1 = split_ref(match.group('start'))
+            c2, r2 = split_ref(match.group('end')) if match.group('end') else (c1, r1)
+        elif match.group('cols'):
+            first, last = match.group('cols').replace('$', '').split(':')
+            c1, c2, r1, r2 = col_to_index(first), col_to_index(last), 1, MAX_ROW
+        else:
+            first, last = match.group('rows').replace('$', '').split(':')
+            c1, c2, r1, r2 = 1, MAX_COL, int(first), int(last)
+        refs.append((sheet, min(c1, c2), min(r1, r2), max(c1, c2), max(r1, r2)))
+    return refs
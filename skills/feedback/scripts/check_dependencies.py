@@ -2,13 +2,17 @@
 """
 Check for required dependencies and provide platform-specific install guidance.
 Returns exit code 0 if all dependencies are present, 1 if any are missing.
+Also lists the PDF text, OCR and rendering backends found (see backends.py).
 """
 
+import importlib.util
 import subprocess
 import sys
 import shutil
 import platform
 
+from backends import choose, describe
+
 
 def get_platform_info():
     """Detect OS and available package managers."""
@@ -31,12 +35,8 @@ def get_platform_info():
 
 
 def check_python_package(package_name):
-    """Check if a Python package is installed."""
-    try:
-        __import__(package_name)
-        return True
-    except ImportError:
-        return False
+    """Check if a Python package is installed (without importing it)."""
+    return importlib.util.find_spec(package_name) is not None
 
 
 def check_command(command):
@@ -52,6 +52,10 @@ def get_install_instructions(system, managers):
             'description': 'Python package for reading older Office file formats',
             'all_platforms': 'pip install olefile',
         },
+        'numpy': {
+            'description': 'Python package for array math (offline formula recalculation, score summaries)',
+            'all_platforms': 'pip install numpy',
+        },
         'poppler': {
             'description': 'PDF toolkit (provides pdftotext for extracting text from PDFs)',
             'darwin': {
@@ -124,17 +128,17 @@ def get_package_manager_install_instructions(system, managers):
     return None
 
 
-def main():
-    system, managers = get_platform_info()
-    instructions = get_install_instructions(system, managers)
-
-    # Track what's missing
+def missing_dependencies():
+    """Names of the optional dependencies that are not installed."""
     missing = []
 
     # Check Python packages
     if not check_python_package('olefile'):
         missing.append('olefile')
 
+    if not check_python_package('numpy'):
+        missing.append('numpy')
+
     # Check command-line tools
     if not check_command('pdftotext'):
         missing.append('poppler')
@@ -142,9 +146,36 @@ def main():
     if not check_command('tesseract'):
         missing.append('tesseract')
 
+    return missing
+
+
+def pdf_text_backend():
+    """The backend PDF text extraction will use, or None."""
+    try:
+        return choose('pdf_text')
+    except RuntimeError:
+        return None
+
+
+def print_backends():
+    print("Backends (* = used, fastest first):")
+    for line in describe():
+        print(f"  {line}")
+    print()
+
+
+def main():
+    system, managers = get_platform_info()
+    instructions = get_install_instructions(system, managers)
+
+    # Track what's missing
+    missing = missing_dependencies()
+
     # All good!
     if not missing:
         print("✓ All dependencies are installed. The framework is ready to use.")
+        print()
+        print_backends()
         return 0
 
     # Report what's missing
@@ -168,13 +199,18 @@ def main():
     print()
     if 'olefile' in missing:
         print("  • Without olefile: Cannot read older .doc/.xls formats (pre-2007)")
-    if 'poppler' in missing:
+    if 'numpy' in missing:
+        print("  • Without numpy: Cannot recalculate workbook formulas (recalc.py) or summarize scores (summarize_feedback.py)")
+    if 'poppler' in missing and pdf_text_backend():
+        print(f"  • Without poppler: Cannot OCR scanned PDFs or render charts (PDF text uses {pdf_text_backend()})")
+    elif 'poppler' in missing:
         print("  • Without poppler: Cannot extract text from PDF files")
     if 'tesseract' in missing:
         print("  • Without tesseract: Cannot OCR scanned/image-based PDFs")
     print()
     print("The framework will still work for supported file types.")
     print()
+    print_backends()
 
     print("-" * 70)
     print("HOW TO INSTALL")
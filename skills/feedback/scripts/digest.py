@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Render extraction records as a digest that fits a character budget.
+
+The plain-text view has fixed caps per section (50 insertions, 200
+formulas, 40 rows, ...) and no cap at all on the document text. A digest
+instead measures what each section would need in full, splits the budget
+across sections by weight (sections that need less than their share give
+the rest back), and fills each section in priority order:
+
+- document text: opening and closing paragraphs first, then paragraphs
+  with comments or tracked changes, then the rest from both ends inward
+- tracked changes: longest first; comments in document order
+- formulas: one line per distinct R1C1 pattern, so a column filled down
+  500 rows costs one line
+- sheet rows: header rows, the last row, then rows spread evenly across
+  the sheet rather than the first N
+- charts, then unique strings
+
+Whatever did not fit is listed in a closing ELIDED section, so the
+reviewer knows what they are not seeing.
+
+    from digest import render_digest
+    text = render_digest(records, budget=24000)
+"""
+
+from cellrefs import col_to_index, split_ref, to_r1c1
+from xlsx_charts import format_charts
+
+CHARS_PER_TOKEN = 4
+
+# Rows read per sheet when building a digest, so sampling can reach past
+# the top of the sheet. Sheets longer than this are sampled from these rows.
+SCAN_ROWS = 2000
+
+# Relative share of the budget each kind of section asks for.
+WEIGHTS = {
+    'text': 8,
+    'insertions': 2,
+    'deletions': 2,
+    'comments': 2,
+    'formulas': 3,
+    'charts': 2,
+    'rows': 3,
+    'strings': 1,
+}
+
+HEADER_ROWS = 3
+
+
+def parse_budget(value):
+    """'24000' -> 24000 characters; '6000t' or '6000tokens' -> 24000 characters."""
+    text = str(value).strip().lower()
+    for suffix, scale in (('tokens', CHARS_PER_TOKEN), ('t', CHARS_PER_TOKEN), ('chars', 1), ('c', 1)):
+        if text.endswith(suffix):
+            return int(text[:-len(suffix)]) * scale
+    return int(text)
+
+
+def allocate(demands, weights, budget):
+    """Split `budget` across sections in proportion to weight (water-filling).
+
+    A section whose full demand fits in its share gets exactly its demand,
+    and the surplus is shared out again among the sections still wanting
+    more. Returns {section: characters}.
+    """
+    alloc = {}
+    active = {key for key, demand in demands.items() if demand > 0}
+    remaining = budget
+    while active:
+        total = sum(weights[key] for key in active)
+        satisfied = {key for key in active if demands[key] <= remaining * weights[key] / total}
+        if not satisfied:
+            for key in active:
+                alloc[key] = int(remaining * weights[key] / total)
+            break
+        for key in satisfied:
+            alloc[key] = demands[key]
+            remaining -= demands[key]
+        active -= satisfied
+    return alloc
+
+
+class Section:
+    """A titled list of entries that can be cut down to a character limit.
+
+    `entries` are in display order; `priority` lists their indexes in the
+    order they should be kept. `unit` names what an entry is, for the
+    elision summary, and `gap` renders a run of skipped entries inline.
+    """
+
+    def __init__(self, key, name, entries, unit, priority=None, gap=None, note=None, detail=None):
+        self.key = key
+        self.name = name
+        self.title = f"=== {name}{f' ({detail})' if detail else ''} ==="
+        self.entries = entries
+        self.unit = unit
+        self.priority = priority if priority is not None else list(range(len(entries)))
+        self.gap = gap
+        self.note = note
+
+    def demand(self):
+        return sum(len(entry) + 1 for entry in self.entries)
+
+    def render(self, limit):
+        """Lines for this section within `limit` characters, plus an elision note or None."""
+        if self.demand() <= limit:
+            keep = set(range(len(self.entries)))
+        else:
+            # Once anything is dropped, each kept entry may bring a gap marker with it
+            marker = len(self.gap(len(self.entries))) + 1 if self.gap else 0
+            keep = set()
+            used = marker
+            for index in self.priority:
+                cost = len(self.entries[index]) + 1 + marker
+                if used + cost <= limit:
+                    keep.add(index)
+                    used += cost
+        # A single oversized entry (a very long paragraph) is cut rather than dropped
+        if not keep and self.entries and limit > 80:
+            first = self.priority[0]
+            cut = self.entries[first][:limit - 40].rstrip()
+            entries = list(self.entries)
+            entries[first] = f"{cut} [... {len(self.entries[first]) - len(cut):,} chars cut]"
+            self.entries = entries
+            keep.add(first)
+
+        lines = [self.title]
+        if self.note:
+            lines.append(self.note)
+        skipped = 0
+        for index, entry in enumerate(self.entries):
+            if index in keep:
+                if skipped and self.gap:
+                    lines.append(self.gap(skipped))
+                skipped = 0
+                lines.append(entry)
+            else:
+                skipped += 1
+        if skipped and self.gap:
+            lines.append(self.gap(skipped))
+
+        dropped = [i for i in range(len(self.entries)) if i not in keep]
+        if not dropped:
+            return lines, None
+        chars = sum(len(self.entries[i]) for i in dropped)
+        return lines, f"{self.name}: {len(dropped)} of {len(self.entries)} {self.unit} ({chars:,} chars)"
+
+
+def _gap(unit):
+    return lambda n: f"[... {n} {unit} elided ...]"
+
+
+def _ends_first(n):
+    """Indexes 0..n-1 ordered from both ends inward: 0, n-1, 1, n-2, ..."""
+    order = []
+    lo, hi = 0, n - 1
+    while lo <= hi:
+        order.append(lo)
+        if hi != lo:
+            order.append(hi)
+        lo, hi = lo + 1, hi - 1
+    return order
+
+
+def _spread(n):
+    """Indexes 0..n-1 ordered so any prefix is spread evenly over the range."""
+    if n <= 0:
+        return []
+    order = [0, n - 1] if n > 1 else [0]
+    seen = set(order)
+    step = n - 1
+    while step > 1:
+        half = step / 2
+        pos = half
+        while pos < n - 1:
+            index = int(round(pos))
+            if index not in seen:
+                seen.add(index)
+                order.append(index)
+            pos += step
+        step = half
+    order.extend(i for i in range(n) if i not in seen)
+    return order
+
+
+def _clip(text, limit):
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def docx_sections(records):
+    paragraphs = records['paragraphs']
+    changed = {change['paragraph'] for change in records['insertions'] + records['deletions']}
+    entries = []
+    for para in paragraphs:
+        text = para['text']
+        # Short comment markers; the comment text is in the COMMENTS section
+        for anchor in sorted(para['comments'], key=lambda a: a['offset'], reverse=True):
+            text = text[:anchor['offset']] + f" [{anchor['comment']}] " + text[anchor['offset']:]
+        entries.append(text)
+
+    ends = _ends_first(len(paragraphs))
+    marked = [i for i, para in enumerate(paragraphs) if para['comments'] or para['id'] in changed]
+    priority = ends[:2] + marked + ends[2:]
+    priority = list(dict.fromkeys(priority))
+    total_chars = sum(len(p['text']) for p in paragraphs)
+    sections = [Section('text', "DOCUMENT TEXT", entries, 'paragraphs', priority, _gap('paragraphs'),
+                        detail=f"{len(paragraphs)} paragraphs, {total_chars:,} chars")]
+
+    for key, label in (('insertions', 'INSERTIONS'), ('deletions', 'DELETIONS')):
+        changes = records[key]
+        if changes:
+            entries = [f"[{c['id']} {c['paragraph'] or '-'}] \"{_clip(c['text'], 200)}\""
+                       + (f" - {c['author']}" if c['author'] != "Unknown" else "") for c in changes]
+            priority = sorted(range(len(changes)), key=lambda i: -len(changes[i]['text']))
+            sections.append(Section(key, f"TRACKED {label}", entries, key, priority, _gap(key),
+                                    detail=str(len(changes))))
+
+    if records['comments']:
+        entries = [f"[{c['id']}] {c['author']}: \"{_clip(c['text'], 300)}\"" for c in records['comments']]
+        sections.append(Section('comments', "COMMENTS", entries, 'comments', gap=_gap('comments'),
+                                detail=str(len(entries))))
+    return sections
+
+
+def _ref_range(refs):
+    """'D2:D101' when refs are one contiguous run in a row or column, else 'D2, F7, ...'."""
+    coords = [split_ref(ref) for ref in refs]
+    cols = {c for c, _r in coords}
+    rows = {r for _c, r in coords}
+    if len(cols) == 1 and max(rows) - min(rows) + 1 == len(rows):
+        return refs[0] if len(refs) == 1 else f"{refs[0]}:{refs[-1]}"
+    if len(rows) == 1 and max(cols) - min(cols) + 1 == len(cols):
+        return f"{refs[0]}:{refs[-1]}"
+    shown = ', '.join(refs[:3])
+    return shown + (', ...' if len(refs) > 3 else '')
+
+
+def formula_groups(formulas):
+    """Group formulas by (sheet, R1C1 pattern), in order of first appearance."""
+    groups = {}
+    for formula in formulas:
+        try:
+            pattern = to_r1c1(formula['formula'], formula['ref'])
+        except ValueError:
+            pattern = formula['formula']
+        groups.setdefault((formula['sheet'], pattern), []).append(formula)
+    return groups
+
+
+def xlsx_sections(records, label=''):
+    sections = []
+    prefix = f"{label}: " if label else ''
+
+    if records['charts']:
+        entries = []
+        for chart in records['charts']:
+            entries.append('\n'.join(format_charts([chart])))
+        sections.append(Section('charts', f"{prefix}CHARTS", entries, 'charts', detail=str(len(entries))))
+
+    groups = formula_groups(records['formulas'])
+    if groups:
+        entries = []
+        for (sheet, pattern), members in groups.items():
+            first = members[0]
+            refs = [member['ref'] for member in members]
+            count = f" ({len(members)} cells)" if len(members) > 1 else ""
+            entries.append(f"{sheet}!{_ref_range(refs)}{count} ={first['formula']}"
+                           + (f"  [R1C1 ={pattern}]" if len(members) > 1 else ""))
+        detail = f"{len(records['formulas'])} cells, {len(groups)} distinct patterns"
+        sections.append(Section('formulas', f"{prefix}FORMULAS", entries, 'patterns', detail=detail))
+
+    rows = {}
+    for cell in records['cells']:
+        rows.setdefault(cell['sheet'], {}).setdefault(cell['row'], []).append(cell)
+    if rows:
+        entries = []
+        orders = []
+        for sheet, sheet_rows in rows.items():
+            start = len(entries)
+            entries.append(f"[Sheet] {sheet} ({len(sheet_rows)} rows read)")
+            numbers = sorted(sheet_rows)
+            for number in numbers:
+                cells = sorted(sheet_rows[number], key=lambda c: col_to_index(''.join(ch for ch in c['ref'] if ch.isalpha())))
+                entries.append(f"{number}\t" + " | ".join(str(c['value']) for c in cells))
+            n = len(numbers)
+            head = list(range(min(HEADER_ROWS, n)))
+            body = [i for i in _spread(n) if i not in head]
+            orders.append([start] + [start + 1 + i for i in head + body])
+        # Round-robin across sheets so every sheet gets its header before
+        # any sheet gets its samples
+        priority = []
+        for depth in range(max(len(order) for order in orders)):
+            priority.extend(order[depth] for order in orders if depth < len(order))
+        note = "(sampled across the rows read; the first number on each line is the sheet row)"
+        sections.append(Section('rows', f"{prefix}SHEET ROWS", entries, 'rows', priority, _gap('rows'), note))
+
+    if records['strings']:
+        sections.append(Section('strings', f"{prefix}UNIQUE STRINGS", list(records['strings']), 'strings',
+                                detail=str(len(records['strings']))))
+    return sections
+
+
+def pdf_sections(records):
+    pages = records['pages']
+    entries = [f"--- {page['id']}{' (OCR)' if page['ocr'] else ''} ---\n{page['text'].strip()}" for page in pages]
+    total_chars = sum(len(page['text']) for page in pages)
+    return [Section('text', "DOCUMENT TEXT", entries, 'pages', _ends_first(len(pages)), _gap('pages'),
+                    detail=f"{len(pages)} pages, {total_chars:,} chars")]
+
+
+def render_digest(records, budget):
+    """A digest of extraction records in at most about `budget` characters."""
+    head = f"FILE: {records['file']} ({records['type']}, digest of ~{budget:,} chars)"
+    if 'error' in records and not records.get('pages'):
+        return f"{head}\nERROR: {records['error']}"
+
+    if records['type'] == 'xlsx':
+        sections = xlsx_sections(records)
+    elif records['type'] == 'pdf':
+        sections = pdf_sections(records)
+    else:
+        sections = docx_sections(records)
+        for embedded in records.get('embedded', []):
+            if embedded['type'] == 'xlsx' and 'error' not in embedded:
+                sections.extend(xlsx_sections(embedded, label=f"EMBEDDED {embedded['file']}"))
+
+    # Titles, notes, gap markers and the elision summary come off the top
+    overhead = len(head) + 60 + sum(len(s.title) + len(s.note or '') + len(s.name) + 70 for s in sections)
+    available = max(0, budget - overhead)
+    demands = {index: section.demand() for index, section in enumerate(sections)}
+    weights = {index: WEIGHTS[section.key] for index, section in enumerate(sections)}
+    alloc = allocate(demands, weights, available)
+
+    out = [head]
+    elided = []
+    for index, section in enumerate(sections):
+        lines, note = section.render(alloc.get(index, 0))
+        out.append('')
+        out.extend(lines)
+        if note:
+            elided.append(note)
+    if records.get('embedded'):
+        unparsed = [e['file'] for e in records['embedded'] if e['type'] != 'xlsx' or 'error' in e]
+        if unparsed:
+            out.append('')
+            out.append("=== EMBEDDED FILES NOT PARSED ===")
+            out.extend(unparsed)
+    if elided:
+        out.append('')
+        out.append("=== ELIDED (not shown above to fit the budget) ===")
+        out.extend(elided)
+    return '\n'.join(out)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Dispatch one review per writer across a fixed number of slots.
+
+Writers are queued longest-first by extracted text size, and a slot
+picks up the next writer as soon as its review finishes, so one long
+thesis no longer holds a whole batch back. When the reviewer reports a
+rate limit, the writer goes back to the front of the queue and the
+number of slots in use is halved; each run of successful reviews adds
+one back, up to --slots (additive increase, multiplicative decrease).
+
+Usage:
+    python dispatch.py plan --input submissions
+    python dispatch.py run --input submissions --slots 5 --command 'my-reviewer {writer} {files} --out {out}'
+    python dispatch.py run --input submissions --slots 5 --stub   # offline stand-in reviewer
+
+In a --command, {writer} is the writer's username, {files} their files
+(as separate arguments), and {out} the feedback file to write. A command
+that exits with 75 (EX_TEMPFAIL) or prints a rate-limit/429/overloaded
+error counts as rate limited; any other non-zero exit is a failure.
+"""
+
+import argparse
+import json
+import random
+import re
+import shlex
+import string
+import subprocess
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from pathlib import Path
+
+from submission_names import group_by_writer
+
+SUBMISSION_SUFFIXES = {'.docx', '.xlsx', '.pdf', '.doc', '.xls', '.txt', '.md'}
+EXTRACTED_SUFFIXES = ('.txt', '.json', '.jsonl')
+RATE_LIMIT_EXIT = 75
+RATE_LIMIT_RE = re.compile(r'rate[ _-]?limit|\b429\b|overloaded|too many requests', re.IGNORECASE)
+MAX_RATE_LIMITED = 8  # per writer, before the review is reported as failed
+COMMAND_FIELDS = ('writer', 'files', 'out')
+
+Task = namedtuple('Task', 'writer files size out')
+Outcome = namedtuple('Outcome', 'status detail retry_after')  # status: done | rate_limited | failed
+
+
+def extracted_size(path, extracted_dir):
+    """Bytes of extracted text for a submission file, or the file's own size if not extracted yet."""
+    if extracted_dir:
+        sizes = [(extracted_dir / f"{path.name}{suffix}") for suffix in EXTRACTED_SUFFIXES]
+        sizes = [p.stat().st_size for p in sizes if p.exists()]
+        if sizes:
+            return max(sizes)
+    return path.stat().st_size
+
+
+def build_queue(input_dir, extracted_dir=None, feedback_dir=None, force=False):
+    """Tasks for every writer without feedback yet, longest first."""
+    paths = [p for p in sorted(input_dir.iterdir())
+             if p.suffix.lower() in SUBMISSION_SUFFIXES and 'turnitin' not in p.name.lower()]
+    tasks = []
+    for writer, files in group_by_writer(paths).items():
+        out = feedback_dir / f"{writer}.md" if feedback_dir else None
+        if out and out.exists() and not force:
+            continue
+        tasks.append(Task(writer, files, sum(extracted_size(p, extracted_dir) for p in files), out))
+    tasks.sort(key=lambda task: (-task.size, task.writer))
+    return tasks
+
+
+class CommandReviewer:
+    """Run an external command per writer (e.g. a headless agent).
+
+    Raises ValueError for a template that cannot be split or names a
+    field other than COMMAND_FIELDS, so a typo fails before any review.
+    """
+
+    def __init__(self, template, timeout=None):
+        self.args = shlex.split(template)
+        for arg in self.args:
+            for _text, field, _spec, _conversion in string.Formatter().parse(arg):
+                if field is not None and field not in COMMAND_FIELDS:
+                    raise ValueError(f"unknown field {{{field}}} in {arg!r} "
+                                     f"(use {', '.join('{' + name + '}' for name in COMMAND_FIELDS)})")
+        self.timeout = timeout
+
+    def command(self, task):
+        values = {'writer': task.writer, 'out': str(task.out or ''), 'files': ' '.join(map(str, task.files))}
+        args = []
+        for arg in self.args:
+            if arg == '{files}':
+                args.extend(str(p) for p in task.files)
+            else:
+                args.append(arg.format(**values))
+        return args
+
+    def __call__(self, task):
+        try:
+            proc = subprocess.run(self.command(task), capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return Outcome('failed', f"timed out after {self.timeout}s", None)
+        except OSError as e:
+            return Outcome('failed', str(e), None)
+        output = (proc.stderr or '') + (proc.stdout or '')
+        if proc.returncode == RATE_LIMIT_EXIT or (proc.returncode and RATE_LIMIT_RE.search(output)):
+            match = re.search(r'retry[ -]after[:= ]+(\d+(?:\.\d+)?)', output, re.IGNORECASE)
+            return Outcome('rate_limited', output.strip()[-200:], float(match.group(1)) if match else None)
+        if proc.returncode:
+            return Outcome('failed', output.strip()[-200:] or f"exit status {proc.returncode}", None)
+        return Outcome('done', None, None)
+
+
+class StubReviewer:
+    """Offline stand-in for a reviewer service.
+
+    A review takes `base` seconds plus `per_kb` seconds per KB of text
+    (with some jitter), and the "service" rejects a request with a rate
+    limit while more than `capacity` reviews are already running.
+    """
+
+    def __init__(self, capacity=4, base=0.05, per_kb=0.002, seed=0):
+        self.capacity = capacity
+        self.base = base
+        self.per_kb = per_kb
+        self.random = random.Random(seed)
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, task):
+        with self._lock:
+            if self.running >= self.capacity:
+                rejected = True
+            else:
+                rejected = False
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            jitter = self.random.uniform(0.8, 1.2)
+        if rejected:
+            time.sleep(self.base / 5)
+            return Outcome('rate_limited', f"429 too many requests ({self.capacity} concurrent)", self.base)
+        try:
+            time.sleep((self.base + self.per_kb * task.size / 1024) * jitter)
+        finally:
+            with self._lock:
+                self.running -= 1
+        return Outcome('done', None, None)
+
+
+class Dispatcher:
+    """Keep up to `slots` reviews running from a queue, adapting to rate limits."""
+
+    def __init__(self, reviewer, slots, min_slots=1, cooldown=1.0, barrier=False, on_event=None):
+        self.reviewer = reviewer
+        self.barrier = barrier
+        self.max_slots = slots
+        self.min_slots = min_slots
+        self.limit = slots
+        self.cooldown = cooldown
+        self.on_event = on_event
+        self.samples = []
+
+    def _sample(self, event, **detail):
+        sample = {'t': round(time.monotonic() - self.start, 3), 'event': event, 'queue': len(self.queue),
+                  'busy': self.busy, 'limit': self.limit, **detail}
+        self.samples.append(sample)
+        if self.on_event:
+            self.on_event(sample)
+
+    def run(self, tasks):
+        """Review every task; returns {writer: Outcome} and fills self.stats."""
+        self.queue = deque(tasks)
+        self.busy = 0
+        self.start = time.monotonic()
+        results = {}
+        attempts = {}
+        busy_seconds = 0.0
+        increase_credit = 0.0
+        last_decrease = self.start
+        paused_until = 0.0
+        rate_limited = 0
+        cond = threading.Condition()
+
+        def work(task, started):
+            try:
+                outcome = self.reviewer(task)
+            except Exception as exc:  # a broken reviewer fails the writer, not the whole run
+                outcome = Outcome('failed', f"{type(exc).__name__}: {exc}", None)
+            nonlocal busy_seconds, increase_credit, last_decrease, paused_until, rate_limited
+            with cond:
+                finished = time.monotonic()
+                elapsed = finished - started
+                busy_seconds += elapsed
+                self.busy -= 1
+                if outcome.status == 'rate_limited':
+                    rate_limited += 1
+                    attempts[task.writer] = attempts.get(task.writer, 0) + 1
+                    if attempts[task.writer] >= MAX_RATE_LIMITED:
+                        results[task.writer] = Outcome('failed', f"rate limited {MAX_RATE_LIMITED} times", None)
+                        self._sample('failed', writer=task.writer, seconds=round(elapsed, 3))
+                    else:
+                        self.queue.appendleft(task)
+                    # One decrease per congestion event: reviews started before the last
+                    # decrease were admitted under the old limit
+                    if started >= last_decrease:
+                        old = self.limit
+                        self.limit = max(self.min_slots, self.limit // 2)
+                        last_decrease = finished
+                        increase_credit = 0.0
+                        self._sample('decrease', writer=task.writer, old=old)
+                    paused_until = max(paused_until, finished + (outcome.retry_after or self.cooldown))
+                else:
+                    results[task.writer] = outcome
+                    self._sample(outcome.status, writer=task.writer, seconds=round(elapsed, 3),
+                                 detail=outcome.detail)
+                    if outcome.status == 'done' and self.limit < self.max_slots:
+                        increase_credit += 1.0 / self.limit
+                        if increase_credit >= 1.0:
+                            increase_credit = 0.0
+                            self.limit += 1
+                            self._sample('increase')
+                cond.notify()
+
+        with cond:
+            while self.queue or self.busy:
+                now = time.monotonic()
+                if self.barrier and self.busy:
+                    cond.wait()
+                    continue
+                while self.queue and self.busy < self.limit and now >= paused_until:
+                    task = self.queue.popleft()
+                    self.busy += 1
+                    self._sample('start', writer=task.writer)
+                    threading.Thread(target=work, args=(task, now), daemon=True).start()
+                cond.wait(timeout=max(0.01, paused_until - now) if now < paused_until else None)
+
+        wall = time.monotonic() - self.start
+        self.stats = {
+            'wall_seconds': round(wall, 3),
+            'reviews': len(results),
+            'failed': sum(1 for outcome in results.values() if outcome.status == 'failed'),
+            'rate_limited': rate_limited,
+            'slots': self.max_slots,
+            'final_limit': self.limit,
+            'utilization': round(busy_seconds / (self.max_slots * wall), 3) if wall else 0.0,
+            'max_queue': max((s['queue'] for s in self.samples), default=0),
+        }
+        return results
+
+
+def print_event(total):
+    done = [0]
+
+    def on_event(sample):
+        if sample['event'] in ('done', 'failed'):
+            done[0] += 1
+            extra = f": {sample['detail']}" if sample['event'] == 'failed' and sample.get('detail') else ''
+            print(f"[{done[0]}/{total}] {sample['event']} {sample['writer']} ({sample['seconds']:.1f}s)"
+                  f" - queue {sample['queue']}, busy {sample['busy']}/{sample['limit']}{extra}", file=sys.stderr)
+        elif sample['event'] == 'decrease':
+            print(f"rate limited on {sample['writer']}; slots {sample['old']} -> {sample['limit']}", file=sys.stderr)
+        elif sample['event'] == 'increase':
+            print(f"slots -> {sample['limit']}", file=sys.stderr)
+    return on_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dispatch per-writer reviews across slots, longest first.')
+    sub = parser.add_subparsers(dest='command_name', required=True)
+    for name in ('plan', 'run'):
+        p = sub.add_parser(name)
+        p.add_argument('--input', required=True, help='Submissions folder')
+        p.add_argument('--extracted', default='feedback_extracted',
+                       help='Extracted text folder, used to size each review (default: %(default)s)')
+        p.add_argument('--feedback', default='feedback',
+                       help='Feedback folder; writers with <writer>.md already there are skipped (default: %(default)s)')
+        p.add_argument('--force', action='store_true', help='Queue writers that already have feedback')
+    plan = sub.choices['plan']
+    plan.add_argument('--format', choices=['text', 'json'], default='text')
+    run = sub.choices['run']
+    run.add_argument('--slots', type=int, default=3, help='Maximum concurrent reviews (review.max_parallel_agents)')
+    reviewer = run.add_mutually_exclusive_group(required=True)
+    reviewer.add_argument('--command', help='Reviewer command; {writer}, {files} and {out} are filled in')
+    reviewer.add_argument('--stub', action='store_true', help='Use the offline stand-in reviewer')
+    run.add_argument('--stub-capacity', type=int, default=4,
+                     help='Concurrent reviews the stand-in accepts before rate limiting (default: %(default)s)')
+    run.add_argument('--timeout', type=int, help='Seconds allowed per review command')
+    run.add_argument('--cooldown', type=float, default=1.0,
+                     help='Seconds to hold new reviews after a rate limit without Retry-After (default: %(default)s)')
+    run.add_argument('--barrier', action='store_true',
+                     help='Wait for every running review before starting more (the old batch behaviour, for comparison)')
+    run.add_argument('--metrics', metavar='FILE', help='Write queue/slot samples as JSONL')
+    args = parser.parse_args()
+
+    reviewer = None
+    if args.command_name == 'run':
+        try:
+            if args.stub:
+                reviewer = StubReviewer(capacity=args.stub_capacity)
+            else:
+                reviewer = CommandReviewer(args.command, timeout=args.timeout)
+        except ValueError as exc:
+            parser.error(f"--command: {exc}")
+
+    in_path = Path(args.input)
+    if not in_path.is_dir():
+        print(f"ERROR: {in_path} is not a directory", file=sys.stderr)
+        sys.exit(1)
+    extracted_dir = Path(args.extracted)
+    tasks = build_queue(in_path, extracted_dir if extracted_dir.is_dir() else None,
+                        Path(args.feedback), force=args.force or getattr(args, 'stub', False))
+
+    if args.command_name == 'plan':
+        if args.format == 'json':
+            print(json.dumps([{'writer': t.writer, 'size': t.size, 'files': [str(p) for p in t.files]}
+                              for t in tasks], indent=2))
+        else:
+            for task in tasks:
+                print(f"{task.size:>10,}  {task.writer}  ({len(task.files)} file{'s' if len(task.files) != 1 else ''})")
+        return
+
+    if not tasks:
+        print("Done: nothing to review", file=sys.stderr)
+        return
+    Path(args.feedback).mkdir(parents=True, exist_ok=True)
+    dispatcher = Dispatcher(reviewer, max(1, args.slots), cooldown=args.cooldown, barrier=args.barrier,
+                            on_event=print_event(len(tasks)))
+    results = dispatcher.run(tasks)
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            for sample in dispatcher.samples:
+                f.write(json.dumps(sample) + '\n')
+            f.write(json.dumps({'event': 'summary', **dispatcher.stats}) + '\n')
+
+    stats = dispatcher.stats
+    print(
+        f"Done: {stats['reviews'] - stats['failed']} reviewed, {stats['failed']} failed, "
+        f"{stats['rate_limited']} rate-limited retries in {stats['wall_seconds']:.1f}s "
+        f"(slot utilization {stats['utilization']:.0%}, peak queue {stats['max_queue']}, "
+        f"ends at {stats['final_limit']}/{stats['slots']} slots)",
+        file=sys.stderr,
+    )
+    for writer, outcome in sorted(results.items()):
+        if outcome.status == 'failed':
+            print(f"  FAILED {writer}: {outcome.detail}", file=sys.stderr)
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
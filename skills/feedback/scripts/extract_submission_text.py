@@ -1,16 +1,112 @@
 #!/usr/bin/env python3
+"""
+Extract text, track changes, comments, formulas and charts from DOCX, XLSX
+and PDF submissions, and from legacy .doc and .xls files (read in process
+by legacy_office.py).
+
+Usable as a script (see --help) or as a library:
+
+    from extract_submission_text import extract_records, render_text
+    records = extract_records(Path('submissions/x.docx'))
+
+Records are plain dicts tagged with 'type' ('docx', 'xlsx', 'pdf'; .doc
+and .xls records use the docx and xlsx shapes with a 'format'); IDs
+are stable for a given file, and offsets are character positions in the
+text view.
+
+- docx: 'paragraphs' {id 'p<n>', offset, text, runs, comments},
+  runs {id 'p<n>.r<m>', offset (in paragraph), text, change (ins id)},
+  'insertions' / 'deletions' {id, author, date, paragraph, offset, text},
+  'comments' {id 'c<n>', author, date, text}, 'embedded' [records]
+- xlsx: 'sheets' {id, name, part, rows_previewed},
+  'cells' {id 'Sheet!A1', sheet, ref, row, type, value},
+  'formulas' {id, sheet, ref, formula, value (cached)},
+  'charts' (see xlsx_charts.py), 'strings' (first unique strings)
+- pdf: 'pages' {id 'page<n>', offset, text, ocr}
+
+A file that cannot be read yields {'type', 'file', 'error'}. The .txt
+output is render_text(records), or render_digest(records, budget) when a
+budget is set. Workbooks with formulas (including embedded ones) also get
+a NAME.deps.json dependency graph; see formula_graph.py.
+"""
 import argparse
+import hashlib
 import io
+import json
+import os
 import re
-import struct
-import subprocess
+import shutil
 import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 import zipfile
 import xml.etree.ElementTree as ET
+from array import array
 
 import olefile
 
+from backends import ORDER, choose, pdf_pages
+from digest import SCAN_ROWS, parse_budget, render_digest
+from formula_graph import FormulaGraph, SharedFormulas, build_graph
+from journal import Journal, journal_key
+from legacy_office import doc_embedded_objects, doc_records, ole_object_file, rtf_records, sniff_format, xls_records
+from manifest import open_manifest
+from metrics import MetricsLog, as_dict, bind, current, profile_call, recording, stage
+from metrics import run as run_tool
+from ooxml import cell_id, workbook_sheets
+from xlsx_charts import format_charts, workbook_charts
+
+# Bump whenever extraction output changes so cached results are invalidated.
+EXTRACTOR_VERSION = '11'
+
+DEFAULT_OPTIONS = {
+    'format': 'text',   # text (.txt), json (.json) or jsonl (.jsonl)
+    'max_rows': 40,     # rows previewed per sheet; 0 skips the preview
+    'sheet_rows': {},   # per-sheet overrides: {sheet name: rows}
+    'ocr_page_chars': 100,  # PDF pages with fewer non-whitespace chars are OCRed
+    'ocr_workers': min(4, os.cpu_count() or 1),  # concurrent tesseract processes, split across extract_all jobs
+    'budget': 0,        # characters for a digest .txt (see digest.py); 0 writes everything
+    'deps': True,       # write NAME.deps.json formula dependency graphs for workbooks
+    'write_embedded': False,  # also write embedded files to OUT/embedded (they are parsed in memory)
+    'pdf_backend': 'auto',  # PDF text backend (see backends.py); auto picks the fastest that works
+}
+
+# Singular record kinds used in JSONL output
+KIND_NAMES = {
+    'paragraphs': 'paragraph',
+    'insertions': 'insertion',
+    'deletions': 'deletion',
+    'comments': 'comment',
+    'sheets': 'sheet',
+    'cells': 'cell',
+    'formulas': 'formula',
+    'charts': 'chart',
+    'strings': 'string',
+    'pages': 'page',
+}
+
+# Options that only affect speed, not output, and so stay out of the cache key.
+UNCACHED_OPTIONS = {'ocr_workers'}
+
+EMBEDDED_WORKBOOK_SUFFIXES = ('.xlsx', '.xlsm', '.xls')
+
+# Parsed embedded workbooks by key (see parse_embedded), most recent last
+_embedded_memo = {}
+EMBEDDED_MEMO_SIZE = 32
+
+
+class ExtractionFailed(Exception):
+    """A file could not be read; `outputs` (written, showing the error) are not cached."""
+
+    def __init__(self, error, outputs):
+        super().__init__(error)
+        self.outputs = outputs
+
 NS = {
     'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
     'w14': 'http://schemas.microsoft.com/office/word/2010/wordml',
@@ -18,107 +114,273 @@ NS = {
 }
 
 
-def run(cmd, check=True):
-    return subprocess.run(cmd, capture_output=True, text=True, check=check)
+def run(cmd, check=True, env=None):
+    return run_tool(cmd, check=check, env=env)
+
+
+def _temp_sibling(path):
+    """A temporary name next to `path`, unique across processes and threads."""
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def write_bytes(path, data):
+    """Write a file through a temporary sibling and a rename.
+
+    An interrupted run leaves either the old file or the new one, never a
+    half-written one.
+    """
+    tmp = _temp_sibling(path)
+    try:
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
 
 
 def write_text(path, text):
-    path.write_text(text, encoding='utf-8', errors='ignore')
+    write_bytes(path, text.encode('utf-8', errors='ignore'))
 
 
-def extract_docx(path):
-    """Extract text, track changes, and comments from a DOCX file."""
-    text_parts = []
+def copy_file(src, dest):
+    """shutil.copy2 with the same all-or-nothing guarantee as write_bytes."""
+    tmp = _temp_sibling(dest)
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+W = f"{{{NS['w']}}}"
+W_BODY = W + 'body'
+W_P = W + 'p'
+W_R = W + 'r'
+W_T = W + 't'
+W_TAB = W + 'tab'
+W_BR = W + 'br'
+W_CR = W + 'cr'
+W_INS = W + 'ins'
+W_DEL = W + 'del'
+W_DEL_TEXT = W + 'delText'
+W_COMMENT_START = W + 'commentRangeStart'
+
+
+def _read_comments(f):
+    """Stream word/comments.xml into a list of comment dicts."""
+    comments = []
+    comment_text = []
+    for event, elem in ET.iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == W + 'comment':
+                comment_text = []
+            continue
+        if elem.tag == W + 't':
+            if elem.text:
+                comment_text.append(elem.text)
+        elif elem.tag == W + 'comment':
+            comment_id = elem.attrib.get(W + 'id')
+            if comment_id and comment_text:
+                comments.append({
+                    'id': comment_id,
+                    'author': elem.attrib.get(W + 'author', "Unknown"),
+                    'date': elem.attrib.get(W + 'date', ""),
+                    'text': ''.join(comment_text)
+                })
+            elem.clear()
+    return comments
+
+
+def _scan_document(f, comment_map):
+    """Single streaming pass over word/document.xml, building docx records.
+
+    Keeps a stack of open paragraphs (text boxes nest them), the open run,
+    and a stack of open w:ins/w:del ranges. Each w:t lands once in its
+    paragraph and run and once in the innermost open insertion; w:delText
+    only in the innermost deletion. Finished top-level body children are
+    dropped so memory stays flat.
+    """
+    paragraphs = []
     track_changes = {
         'insertions': [],
         'deletions': [],
     }
-    comments = []
-    comment_map = {}  # id -> comment text
+    para_stack = []
+    change_stack = []
+    run = None
+    pending_marks = []  # comment anchors seen between paragraphs
+    counters = {'p': 0, 'ins': 0, 'del': 0}
+    offset = 0  # start of the next paragraph in the document text
+    body = None
+    depth = 0
+
+    def add_text(text):
+        para = para_stack[-1]
+        para['parts'].append(text)
+        para['length'] += len(text)
+        if run is not None:
+            run['text'].append(text)
+
+    for event, elem in ET.iterparse(f, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            depth += 1
+            if tag == W_P:
+                counters['p'] += 1
+                para_stack.append({'id': f"p{counters['p']}", 'parts': [], 'length': 0,
+                                   'runs': [], 'comments': pending_marks})
+                pending_marks = []
+            elif tag == W_R:
+                if para_stack:
+                    para = para_stack[-1]
+                    change = change_stack[-1]['id'] if change_stack else None
+                    run = {'offset': para['length'], 'text': [], 'change': change}
+            elif tag == W_INS or tag == W_DEL:
+                kind = 'ins' if tag == W_INS else 'del'
+                counters[kind] += 1
+                para = para_stack[-1] if para_stack else None
+                change_stack.append({
+                    'id': f"{kind}{counters[kind]}",
+                    'kind': 'insertions' if kind == 'ins' else 'deletions',
+                    'author': elem.attrib.get(W + 'author', "Unknown"),
+                    'date': elem.attrib.get(W + 'date', ""),
+                    'paragraph': para['id'] if para else None,
+                    'offset': para['length'] if para else 0,
+                    'text': [],
+                })
+            elif tag == W_COMMENT_START:
+                # Marks where a comment is anchored in the text
+                comment_id = elem.attrib.get(W + 'id')
+                if comment_id in comment_map:
+                    if para_stack:
+                        para_stack[-1]['comments'].append((para_stack[-1]['length'], comment_id))
+                    else:
+                        pending_marks.append((0, comment_id))
+            elif tag == W_BODY:
+                body = elem
+            continue
+
+        depth -= 1
+        if tag == W_T:
+            if elem.text and para_stack:
+                add_text(elem.text)
+                if change_stack and change_stack[-1]['kind'] == 'insertions':
+                    change_stack[-1]['text'].append(elem.text)
+        elif tag == W_DEL_TEXT:
+            if elem.text and change_stack and change_stack[-1]['kind'] == 'deletions':
+                change_stack[-1]['text'].append(elem.text)
+        elif tag == W_TAB:
+            if para_stack:
+                add_text('\t')
+        elif tag == W_BR or tag == W_CR:
+            if para_stack:
+                add_text('\n')
+        elif tag == W_R:
+            if run is not None and run['text']:
+                para = para_stack[-1]
+                para['runs'].append({
+                    'id': f"{para['id']}.r{len(para['runs']) + 1}",
+                    'offset': run['offset'],
+                    'text': ''.join(run['text']),
+                    'change': run['change'],
+                })
+            run = None
+        elif tag == W_P:
+            para = para_stack.pop()
+            text = ''.join(para['parts'])
+            if text.strip():
+                paragraphs.append({
+                    'id': para['id'],
+                    'offset': offset,
+                    'text': text,
+                    'runs': para['runs'],
+                    'comments': [{'comment': cid, 'offset': at} for at, cid in para['comments']],
+                })
+                offset += len(text) + 1  # paragraphs are joined by newlines
+            elif para['comments']:
+                pending_marks.extend((0, cid) for _at, cid in para['comments'])
+        elif tag == W_INS or tag == W_DEL:
+            change = change_stack.pop()
+            if change['text']:
+                track_changes[change['kind']].append({
+                    'id': change['id'],
+                    'author': change['author'],
+                    'date': change['date'],
+                    'paragraph': change['paragraph'],
+                    'offset': change['offset'],
+                    'text': ''.join(change['text'])
+                })
+        if body is not None and depth == 2:
+            # A direct child of w:body (paragraph, table, ...) is complete
+            body.clear()
+
+    return paragraphs, track_changes
 
+
+def docx_records(source, name=None):
+    """Typed records for a DOCX file (path or file-like object).
+
+    Returns {'type': 'docx', 'file', 'paragraphs', 'insertions',
+    'deletions', 'comments'}; see the module docstring for the fields.
+    """
+    name = name or Path(source).name
     try:
-        with zipfile.ZipFile(path) as z:
-            # First, extract comments if they exist
+        with zipfile.ZipFile(source) as z:
+            comments = []
             if 'word/comments.xml' in z.namelist():
                 with z.open('word/comments.xml') as f:
-                    tree = ET.parse(f)
-                    for comment in tree.findall('.//w:comment', NS):
-                        comment_id = comment.attrib.get(f"{{{NS['w']}}}id")
-                        author = comment.attrib.get(f"{{{NS['w']}}}author", "Unknown")
-                        date = comment.attrib.get(f"{{{NS['w']}}}date", "")
-                        # Get comment text
-                        comment_text = []
-                        for t in comment.iter():
-                            if t.tag == f"{{{NS['w']}}}t" and t.text:
-                                comment_text.append(t.text)
-                        if comment_id and comment_text:
-                            full_text = ''.join(comment_text)
-                            comment_map[comment_id] = {
-                                'author': author,
-                                'date': date,
-                                'text': full_text
-                            }
-                            comments.append({
-                                'id': comment_id,
-                                'author': author,
-                                'date': date,
-                                'text': full_text
-                            })
+                    comments = _read_comments(f)
+            comment_map = {comment['id']: comment for comment in comments}
 
             # Extract main document with track changes
             with z.open('word/document.xml') as f:
-                tree = ET.parse(f)
-
-                for node in tree.iter():
-                    # Regular text
-                    if node.tag == f"{{{NS['w']}}}t" and node.text:
-                        text_parts.append(node.text)
-
-                    # Track changes - insertions
-                    elif node.tag == f"{{{NS['w']}}}ins":
-                        author = node.attrib.get(f"{{{NS['w']}}}author", "Unknown")
-                        date = node.attrib.get(f"{{{NS['w']}}}date", "")
-                        ins_text = []
-                        for t in node.iter():
-                            if t.tag == f"{{{NS['w']}}}t" and t.text:
-                                ins_text.append(t.text)
-                        if ins_text:
-                            track_changes['insertions'].append({
-                                'author': author,
-                                'date': date,
-                                'text': ''.join(ins_text)
-                            })
-
-                    # Track changes - deletions
-                    elif node.tag == f"{{{NS['w']}}}del":
-                        author = node.attrib.get(f"{{{NS['w']}}}author", "Unknown")
-                        date = node.attrib.get(f"{{{NS['w']}}}date", "")
-                        del_text = []
-                        for t in node.iter():
-                            if t.tag == f"{{{NS['w']}}}delText" and t.text:
-                                del_text.append(t.text)
-                        if del_text:
-                            track_changes['deletions'].append({
-                                'author': author,
-                                'date': date,
-                                'text': ''.join(del_text)
-                            })
-
-                    # Comment references (marks where comments are in the text)
-                    elif node.tag == f"{{{NS['w']}}}commentRangeStart":
-                        comment_id = node.attrib.get(f"{{{NS['w']}}}id")
-                        if comment_id and comment_id in comment_map:
-                            text_parts.append(f" [COMMENT: {comment_map[comment_id]['text'][:50]}...] ")
-
+                paragraphs, track_changes = _scan_document(f, comment_map)
     except Exception as exc:
-        return f"[docx extract error: {exc}]"
+        return {'type': 'docx', 'file': name, 'error': str(exc)}
+
+    for comment in comments:
+        comment['id'] = f"c{comment['id']}"
+    for para in paragraphs:
+        for anchor in para['comments']:
+            anchor['comment'] = f"c{anchor['comment']}"
+    return {
+        'type': 'docx',
+        'file': name,
+        'paragraphs': paragraphs,
+        'insertions': track_changes['insertions'],
+        'deletions': track_changes['deletions'],
+        'comments': comments,
+    }
+
+
+def render_docx_text(records):
+    """The plain-text view of docx records used for .txt output."""
+    if 'error' in records:
+        return f"[{records.get('format', 'docx')} extract error: {records['error']}]"
+    comment_text = {comment['id']: comment['text'] for comment in records['comments']}
+    track_changes = {
+        'insertions': records['insertions'],
+        'deletions': records['deletions'],
+    }
+    comments = records['comments']
+
+    lines = []
+    for para in records['paragraphs']:
+        text = para['text']
+        # Insert comment markers right to left so earlier offsets stay valid
+        for anchor in sorted(para['comments'], key=lambda a: a['offset'], reverse=True):
+            mark = f" [COMMENT: {comment_text[anchor['comment']][:50]}...] "
+            text = text[:anchor['offset']] + mark + text[anchor['offset']:]
+        lines.append(text)
 
     # Build output
     output = []
     output.append("=" * 60)
     output.append("DOCUMENT TEXT")
     output.append("=" * 60)
-    output.append("\n".join(text_parts))
+    output.append("\n".join(lines))
 
     # Add track changes section if any exist
     if track_changes['insertions'] or track_changes['deletions']:
@@ -167,204 +429,902 @@ def extract_docx(path):
     return "\n".join(output)
 
 
-def _parse_ole10_native(data):
-    try:
-        pos = 0
-        _total = struct.unpack_from("<I", data, pos)[0]
-        pos += 4
-        pos += 2
-        pos += 2
-        end = data.index(b"\x00", pos)
-        filename = data[pos:end].decode("latin1", errors="ignore")
-        pos = end + 1
-        end = data.index(b"\x00", pos)
-        pos = end + 1
-        pos += 4
-        pos += 4
-        size = struct.unpack_from("<I", data, pos)[0]
-        pos += 4
-        filedata = data[pos:pos + size]
-        return filename, filedata
-    except Exception:
-        return None, None
+def extract_docx(path):
+    """Extract text, track changes, and comments from a DOCX file."""
+    return render_docx_text(docx_records(path))
 
 
-def extract_embedded_from_docx(path, out_dir):
-    embedded_paths = []
+def embedded_objects(source):
+    """(name, bytes) for each file embedded in a DOCX (path or file-like object).
+
+    Everything is read in memory: workbooks stored as package parts are
+    returned as they are, and OLE objects (oleObject*.bin) are unwrapped
+    to the file inside them (see legacy_office.ole_object_file).
+    """
+    objects = []
     try:
-        with zipfile.ZipFile(path) as z:
+        with zipfile.ZipFile(source) as z:
             for name in z.namelist():
                 if not name.startswith("word/embeddings/"):
                     continue
                 base = Path(name).name
-                data = z.read(name)
-                if base.lower().endswith((".xlsx", ".xlsm", ".xls")):
-                    out_path = out_dir / f"{path.stem}__{base}"
-                    out_path.write_bytes(data)
-                    embedded_paths.append(out_path)
+                if base.lower().endswith(EMBEDDED_WORKBOOK_SUFFIXES):
+                    objects.append((base, z.read(name)))
                 elif base.lower().endswith(".bin"):
+                    data = z.read(name)
                     try:
-                        ole = olefile.OleFileIO(io.BytesIO(data))
-                        if ole.exists("\x01Ole10Native"):
-                            stream = ole.openstream("\x01Ole10Native").read()
-                            fname, fdata = _parse_ole10_native(stream)
-                            if fdata:
-                                safe = Path(fname).name if fname else f"{base}.bin"
-                                out_path = out_dir / f"{path.stem}__{safe}"
-                                out_path.write_bytes(fdata)
-                                embedded_paths.append(out_path)
-                        ole.close()
+                        with olefile.OleFileIO(io.BytesIO(data)) as ole:
+                            found = ole_object_file(ole, [], Path(base).stem)
                     except Exception:
                         continue
+                    if found and found[0].endswith(".xls"):
+                        found = (found[0], data)  # the whole compound file, not just its Workbook stream
+                    if found:
+                        objects.append(found)
     except Exception:
-        return embedded_paths
+        return objects
+    return objects
+
+
+def extract_embedded_from_docx(path, out_dir):
+    """Write the files embedded in a DOCX to out_dir as STEM__NAME; returns their paths."""
+    embedded_paths = []
+    for name, data in embedded_objects(path):
+        out_path = out_dir / f"{path.stem}__{name}"
+        write_bytes(out_path, data)
+        embedded_paths.append(out_path)
     return embedded_paths
 
 
-def extract_xlsx(path):
-    strings = []
-    sheets = {}
-    formulas = []
-    charts = []
+S = f"{{{NS['s']}}}"
+S_SI = S + 'si'
+S_T = S + 't'
+S_RPH = S + 'rPh'
+S_ROW = S + 'row'
+S_C = S + 'c'
+S_V = S + 'v'
+S_F = S + 'f'
+S_IS = S + 'is'
+
+class SharedStrings:
+    """Shared-string table kept as one UTF-8 buffer plus an offset index.
+
+    Entries are decoded only when looked up, so a workbook with hundreds of
+    thousands of strings costs a few bytes per entry instead of a Python
+    object each.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._offsets = array('Q', [0])
+
+    def append(self, text):
+        self._buf += text.encode('utf-8')
+        self._offsets.append(len(self._buf))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._buf[self._offsets[idx]:self._offsets[idx + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    @classmethod
+    def read(cls, f):
+        strings = cls()
+        parts = []
+        in_phonetic = False
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if elem.tag == S_RPH:
+                in_phonetic = event == 'start'
+            elif event == 'end':
+                if elem.tag == S_T:
+                    if elem.text and not in_phonetic:
+                        parts.append(elem.text)
+                elif elem.tag == S_SI:
+                    # One entry per <si>, rich-text runs joined
+                    strings.append(''.join(parts))
+                    parts = []
+                    elem.clear()
+        return strings
+
+
+def iter_sheet_rows(f, strings):
+    """Stream a worksheet part, yielding (row number, [(ref, value, formula, kind)]).
+
+    `kind` is the cell's t attribute ('n' when absent): 's' and 'inlineStr'
+    values are resolved to their text, everything else is the raw <v> text.
+    Shared formulas are expanded to each cell's own formula.
+    """
+    row_num = 0
+    cells = []
+    shared = SharedFormulas()
+    for event, elem in ET.iterparse(f, events=('end',)):
+        tag = elem.tag
+        if tag == S_C:
+            value = None
+            t = elem.attrib.get('t', 'n')
+            v = elem.find(S_V)
+            if t == 's':
+                if v is not None and v.text is not None:
+                    idx = int(v.text)
+                    if 0 <= idx < len(strings):
+                        value = strings[idx]
+            elif t == 'inlineStr':
+                isv = elem.find(S_IS)
+                if isv is not None:
+                    value = ''.join(node.text or '' for node in isv.iter(S_T)) or None
+            elif v is not None and v.text:
+                value = v.text
+            fnode = elem.find(S_F)
+            formula = shared.resolve(fnode, elem.attrib.get('r')) if fnode is not None else None
+            cells.append((elem.attrib.get('r'), value, formula, t))
+        elif tag == S_ROW:
+            row_num = int(elem.attrib.get('r', row_num + 1))
+            yield row_num, cells
+            cells = []
+            elem.clear()
+
+
+def xlsx_records(source, options=None, name=None):
+    """Typed records for an XLSX workbook (path or file-like object).
+
+    Returns {'type': 'xlsx', 'file', 'sheets', 'cells', 'formulas',
+    'charts', 'strings'}; see the module docstring for the fields.
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    name = name or Path(source).name
+    records = {'type': 'xlsx', 'file': name, 'sheets': [], 'cells': [], 'formulas': [], 'charts': [], 'strings': []}
+    strings = SharedStrings()
     try:
-        with zipfile.ZipFile(path) as z:
+        with zipfile.ZipFile(source) as z:
             if 'xl/sharedStrings.xml' in z.namelist():
                 with z.open('xl/sharedStrings.xml') as f:
-                    tree = ET.parse(f)
-                    for t in tree.iter():
-                        if t.tag.endswith('}t') and t.text:
-                            strings.append(t.text)
-            if 'xl/workbook.xml' in z.namelist():
-                with z.open('xl/workbook.xml') as f:
-                    tree = ET.parse(f)
-                    for sh in tree.findall('.//s:sheets/s:sheet', NS):
-                        name = sh.attrib.get('name')
-                        if name:
-                            sheets[name] = []
-            for name in z.namelist():
-                if name.startswith('xl/worksheets/sheet') and name.endswith('.xml'):
-                    with z.open(name) as f:
-                        tree = ET.parse(f)
-                        rows = []
-                        for row in tree.findall('.//s:row', NS):
-                            row_vals = []
-                            for c in row.findall('s:c', NS):
-                                v = c.find('s:v', NS)
-                                t = c.attrib.get('t')
-                                if t == 's' and v is not None and v.text is not None:
-                                    idx = int(v.text)
-                                    if 0 <= idx < len(strings):
-                                        row_vals.append(strings[idx])
-                                elif t == 'inlineStr':
-                                    isv = c.find('s:is/s:t', NS)
-                                    if isv is not None and isv.text:
-                                        row_vals.append(isv.text)
-                                elif v is not None and v.text:
-                                    row_vals.append(v.text)
-                                fnode = c.find('s:f', NS)
-                                if fnode is not None and fnode.text:
-                                    formulas.append(fnode.text)
-                            if row_vals:
-                                rows.append(row_vals)
-                            if len(rows) >= 40:
+                    strings = SharedStrings.read(f)
+            for index, (sheet_name, part) in enumerate(workbook_sheets(z), 1):
+                limit = options['sheet_rows'].get(sheet_name, options['max_rows'])
+                previewed = 0
+                if limit:
+                    with z.open(part) as f:
+                        for row_num, cells in iter_sheet_rows(f, strings):
+                            has_values = False
+                            for ref, value, formula, kind in cells:
+                                if value is not None:
+                                    has_values = True
+                                    records['cells'].append({
+                                        'id': cell_id(sheet_name, ref), 'sheet': sheet_name,
+                                        'ref': ref, 'row': row_num, 'type': kind, 'value': value,
+                                    })
+                                if formula:
+                                    records['formulas'].append({
+                                        'id': cell_id(sheet_name, ref), 'sheet': sheet_name,
+                                        'ref': ref, 'formula': formula, 'value': value,
+                                    })
+                            if has_values:
+                                previewed += 1
+                            if previewed >= limit:
                                 break
-                        if sheets:
-                            sheet_name = next(iter(sheets))
-                            sheets[sheet_name] = rows
-            charts = [n for n in z.namelist() if n.startswith('xl/charts/chart')]
+                records['sheets'].append({
+                    'id': f"sheet{index}", 'name': sheet_name, 'part': part, 'rows_previewed': previewed,
+                })
+            for index, chart in enumerate(workbook_charts(z), 1):
+                records['charts'].append({'id': f"chart{index}", **chart})
     except Exception as exc:
-        return {"error": str(exc)}
+        return {'type': 'xlsx', 'file': name, 'error': str(exc)}
 
-    out = []
-    out.append(f"FILE: {path.name}")
-    out.append("CHART_FILES:")
-    out.extend(charts)
-    out.append("FORMULAS:")
-    out.extend(formulas[:200])
-    out.append("SHEETS_PREVIEW:")
-    for sheet, rows in sheets.items():
-        out.append(f"[Sheet] {sheet}")
-        for row in rows:
-            out.append("\t" + " | ".join(row))
-    uniq = []
     seen = set()
     for s in strings:
         if s not in seen:
-            uniq.append(s)
+            records['strings'].append(s)
             seen.add(s)
-        if len(uniq) >= 200:
+        if len(records['strings']) >= 200:
             break
+    return records
+
+
+def render_xlsx_text(records):
+    """The plain-text view of xlsx records used for .txt output."""
+    if 'error' in records:
+        return f"ERROR: {records['error']}"
+    rows = {sheet['name']: {} for sheet in records['sheets']}
+    for cell in records['cells']:
+        rows[cell['sheet']].setdefault(cell['row'], []).append(cell['value'])
+
+    out = []
+    out.append(f"FILE: {records['file']}")
+    out.append("CHARTS:")
+    out.extend(format_charts(records['charts']))
+    out.append("FORMULAS:")
+    out.extend(f"{formula['id']} ={formula['formula']}" for formula in records['formulas'][:200])
+    out.append("SHEETS_PREVIEW:")
+    for sheet, sheet_rows in rows.items():
+        out.append(f"[Sheet] {sheet}")
+        for row in sheet_rows.values():
+            out.append("\t" + " | ".join(row))
     out.append("UNIQUE_STRINGS:")
-    out.extend(uniq)
+    out.extend(records['strings'])
     return "\n".join(out)
 
 
-def extract_pdf(path, out_dir):
-    txt_path = out_dir / f"{path.name}.txt"
+def extract_xlsx(path, options=None):
+    records = xlsx_records(path, options)
+    if 'error' in records:
+        return {"error": records['error']}
+    return render_xlsx_text(records)
+
+
+def pdf_page_count(path):
     try:
-        result = run(['pdftotext', str(path), '-'])
-        text = result.stdout
-    except Exception as exc:
-        text = f"[pdftotext error: {exc}]"
+        info = run(['pdfinfo', str(path)]).stdout
+    except Exception:
+        return 0
+    match = re.search(r'^Pages:\s+(\d+)', info, re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def _ocr_page(path, page, work_dir, record=None):
+    with bind(record):
+        prefix = work_dir / f"page-{page}"
+        run(['pdftoppm', '-r', '200', '-png', '-f', str(page), '-l', str(page),
+             '-singlefile', str(path), str(prefix)])
+        img = prefix.with_suffix('.png')
+        try:
+            # One tesseract thread per process; the pool provides the parallelism
+            return run(['tesseract', str(img), 'stdout'], env={**os.environ, 'OMP_THREAD_LIMIT': '1'}).stdout
+        finally:
+            img.unlink(missing_ok=True)
+
+
+def ocr_pages(path, pages, workers=1):
+    """OCR the given 1-based pages, returning their text in page order.
 
-    # If text is too small, fall back to OCR
-    if len(re.sub(r'\s+', '', text)) < 200:
-        ocr_text = []
-        img_prefix = out_dir / path.stem
+    Each task renders a single page into a scratch directory, runs tesseract
+    on it and deletes the image, so at most `workers` page images exist at
+    any time. Without tesseract and pdftoppm every page gets an error
+    placeholder, without starting a process per page.
+    """
+    try:
+        choose('ocr')
+    except RuntimeError as exc:
+        return [f"[ocr error on page {page}: {exc}]" for page in pages]
+    texts = []
+    with tempfile.TemporaryDirectory(prefix='wmf-ocr-') as tmp, stage('ocr'):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(_ocr_page, path, page, Path(tmp), current()) for page in pages]
+            for page, future in zip(pages, futures):
+                try:
+                    texts.append(future.result())
+                except Exception as exc:
+                    texts.append(f"[ocr error on page {page}: {exc}]")
+    return texts
+
+
+def pdf_records(path, options=None):
+    """Typed records for a PDF: one record per page.
+
+    Pages come from the `pdf_backend` option's backend (see backends.py;
+    'auto' is the fastest one on this machine). A page whose
+    text layer has fewer than `ocr_page_chars` non-whitespace characters
+    (a scan, or a typed page with only a header) is replaced by its OCR
+    text, so mixed typed/scanned documents get OCR exactly where needed.
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    records = {'type': 'pdf', 'file': path.name, 'pages': []}
+    try:
+        backend = choose('pdf_text', options['pdf_backend'])
+    except RuntimeError as exc:
+        records['error'] = str(exc)
+        pages = [''] * pdf_page_count(path)
+    else:
         try:
-            run(['pdftoppm', '-r', '200', '-png', str(path), str(img_prefix)])
-            for img in sorted(out_dir.glob(f"{path.stem}-*.png")):
-                ocr = run(['tesseract', str(img), 'stdout'])
-                ocr_text.append(ocr.stdout)
+            pages = pdf_pages(path, backend)
         except Exception as exc:
-            ocr_text.append(f"[ocr error: {exc}]")
-        text = text + "\n" + "\n".join(ocr_text)
-    write_text(txt_path, text)
+            records['error'] = f"{backend} error: {exc}"
+            pages = [''] * pdf_page_count(path)
 
+    sparse = [i + 1 for i, page in enumerate(pages)
+              if len(re.sub(r'\s+', '', page)) < options['ocr_page_chars']]
+    ocr_text = dict(zip(sparse, ocr_pages(path, sparse, options['ocr_workers']))) if sparse else {}
+    offset = 0
+    for number, page_text in enumerate(pages, 1):
+        page_text = ocr_text.get(number, page_text)
+        records['pages'].append({'id': f"page{number}", 'offset': offset, 'text': page_text, 'ocr': number in ocr_text})
+        offset += len(page_text) + 1  # pages are joined by form feeds
+    return records
+
+
+def render_pdf_text(records):
+    """The plain-text view of pdf records used for .txt output."""
+    if not records['pages'] and 'error' in records:
+        return f"[{records['error']}]"
+    return '\f'.join(page['text'] for page in records['pages'])
+
+
+def extract_pdf(path, out_dir, options=None):
+    txt_path = out_dir / f"{path.name}.txt"
+    write_text(txt_path, render_pdf_text(pdf_records(path, options)))
+    return [txt_path]
 
-def extract(path, out_dir):
+
+def parse_embedded(name, data, options=None, cache_dir=None):
+    """(records, deps JSON or None) for a file embedded in a DOCX or DOC, parsed from memory.
+
+    Embedded files are keyed by content, not name: Word numbers its
+    embeddings (Microsoft_Excel_Worksheet.xlsx, ...Worksheet1.xlsx), so a
+    workbook embedded in many submissions (an instructor's template) at
+    different positions is still parsed once per process and, with a
+    `cache_dir`, once across worker processes and runs. Each call gets its
+    own top-level records dict with 'file' set to `name`; the lists inside
+    are shared between submissions: copy before changing them.
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    content = hashlib.sha256(data).hexdigest()
+    if not name.lower().endswith(EMBEDDED_WORKBOOK_SUFFIXES):
+        return {'type': 'unparsed', 'file': name, 'sha256': content}, None
+    legacy = name.lower().endswith('.xls')
+    keyed = keyed_options(options, Path(name))
+    key = hashlib.sha256(json.dumps([EXTRACTOR_VERSION, keyed, legacy, content], sort_keys=True)
+                         .encode('utf-8')).hexdigest()
+    store = cache_dir / 'embedded' / f"{key}.json" if cache_dir is not None else None
+    shared = _embedded_memo.pop(key, None)
+    if shared is None and store is not None and store.exists():
+        try:
+            shared = json.loads(store.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            shared = None  # a damaged entry is simply parsed again
+    if shared is None:
+        if legacy:
+            records = xls_records(io.BytesIO(data), options['max_rows'], options['sheet_rows'], name=name)
+        else:
+            records = xlsx_records(io.BytesIO(data), options, name=name)
+        records['sha256'] = content
+        deps = None
+        if options['deps'] and not legacy and 'error' not in records:
+            try:
+                graph = build_graph(io.BytesIO(data), name)
+                deps = graph.to_json() if graph.formulas else None
+            except Exception:
+                pass  # the records already say why the workbook could not be read
+        shared = {'records': records, 'deps': deps}
+        if store is not None:
+            store.parent.mkdir(parents=True, exist_ok=True)
+            write_text(store, json.dumps(shared, ensure_ascii=False))
+    _embedded_memo[key] = shared
+    while len(_embedded_memo) > EMBEDDED_MEMO_SIZE:
+        del _embedded_memo[next(iter(_embedded_memo))]
+    deps = FormulaGraph.rename_json(shared['deps'], name) if shared['deps'] else None
+    return dict(shared['records'], file=name), deps
+
+
+def extract_records(path, options=None, embedded_dir=None, cache_dir=None, embedded_deps=None):
+    """Typed records for any supported submission file, or None if unsupported.
+
+    For DOCX and DOC files, embedded files are parsed in memory (see
+    parse_embedded) and their records listed under 'embedded', each with
+    the 'sha256' of its contents. With `embedded_dir`, the embedded files
+    are also written there as STEM__NAME and each record gets their
+    'path'. `embedded_deps`, if a dict, collects {index in 'embedded':
+    deps JSON} for embedded workbooks with formulas.
+
+    A .doc or .xls that is really a .docx/.xlsx is read as one, and a .doc
+    that is really RTF gets its text (see legacy_office.sniff_format).
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
     suffix = path.suffix.lower()
-    out_path = out_dir / f"{path.name}.txt"
-    if suffix == '.docx':
-        text = extract_docx(path)
-        embedded_dir = out_dir / "embedded"
-        embedded_dir.mkdir(parents=True, exist_ok=True)
-        embedded_files = extract_embedded_from_docx(path, embedded_dir)
-        if embedded_files:
-            text += "\n\n[EMBEDDED_FILES]\n"
-            for embedded in embedded_files:
-                if embedded.suffix.lower() in {'.xlsx', '.xlsm', '.xls'}:
-                    text += f"\n[Embedded] {embedded.name}\n"
-                    text += extract_xlsx(embedded)
-                else:
-                    text += f"\n[Embedded] {embedded.name} (unparsed)\n"
-        write_text(out_path, text)
-    elif suffix == '.xlsx':
-        data = extract_xlsx(path)
-        if isinstance(data, dict) and 'error' in data:
-            write_text(out_path, f"ERROR: {data['error']}")
+    # A .doc or .xls may really be a renamed .docx/.xlsx, or RTF saved by Word
+    actual = sniff_format(path) if suffix in ('.doc', '.xls') else None
+    if suffix in ('.docx', '.doc'):
+        if suffix == '.docx' or actual == 'zip':
+            with stage('docx'):
+                records = docx_records(path)
+            with stage('embedded'):
+                objects = embedded_objects(path)
+        elif actual == 'rtf':
+            with stage('rtf'):
+                records = rtf_records(path)
+            objects = []
         else:
-            write_text(out_path, data)
-    elif suffix == '.pdf':
-        extract_pdf(path, out_dir)
+            with stage('doc'):
+                records = doc_records(path)
+            with stage('embedded'):
+                objects = doc_embedded_objects(path)
+        records['embedded'] = []
+        for name, data in objects:
+            with stage('xlsx' if name.lower().endswith(EMBEDDED_WORKBOOK_SUFFIXES) else 'embedded'):
+                entry, deps = parse_embedded(name, data, options, cache_dir)
+            if embedded_dir is not None:
+                embedded_dir.mkdir(parents=True, exist_ok=True)
+                out_path = embedded_dir / f"{path.stem}__{name}"
+                write_bytes(out_path, data)
+                entry['path'] = str(out_path)
+            if deps and embedded_deps is not None:
+                embedded_deps[len(records['embedded'])] = deps
+            records['embedded'].append(entry)
+        return records
+    if suffix == '.xlsx' or actual == 'zip':
+        with stage('xlsx'):
+            return xlsx_records(path, options)
+    if suffix == '.xls':
+        with stage('xls'):
+            return xls_records(path, options['max_rows'], options['sheet_rows'])
+    if suffix == '.pdf':
+        with stage('pdf'):
+            return pdf_records(path, options)
+    return None
+
+
+def render_text(records):
+    """The plain-text view of any extraction records."""
+    if records['type'] == 'xlsx':
+        return render_xlsx_text(records)
+    if records['type'] == 'pdf':
+        return render_pdf_text(records)
+    text = render_docx_text(records)
+    if records.get('embedded'):
+        text += "\n\n[EMBEDDED_FILES]\n"
+        for embedded in records['embedded']:
+            if embedded['type'] == 'xlsx':
+                text += f"\n[Embedded] {embedded['file']}\n"
+                text += render_xlsx_text(embedded)
+            else:
+                text += f"\n[Embedded] {embedded['file']} (unparsed)\n"
+    return text
+
+
+def iter_jsonl(records, parent=None):
+    """Flatten records into one JSON object per line, each tagged with its kind."""
+    head = {key: value for key, value in records.items() if not isinstance(value, list)}
+    head['kind'] = records['type']
+    if parent:
+        head['parent'] = parent
+    yield head
+    for key, items in records.items():
+        if not isinstance(items, list) or key == 'embedded':
+            continue
+        kind = KIND_NAMES.get(key, key)
+        for item in items:
+            if isinstance(item, dict):
+                yield {'kind': kind, 'file': records['file'], **item}
+            else:
+                yield {'kind': kind, 'file': records['file'], 'value': item}
+    for embedded in records.get('embedded', []):
+        yield from iter_jsonl(embedded, parent=records['file'])
+
+
+def extract(path, out_dir, options=None, cache_dir=None):
+    """Extract one submission and return the paths of every file written.
+
+    Embedded files parsed for an earlier submission are reused from
+    `cache_dir` (see parse_embedded).
+    """
+    return _extract(path, out_dir, options, cache_dir)[0]
+
+
+def _extract(path, out_dir, options=None, cache_dir=None):
+    """extract(), returning (outputs, error): the error of a file that yielded only an error record."""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    if options['budget'] and options['max_rows']:
+        # Read further down each sheet so the digest can sample across it
+        options['max_rows'] = max(options['max_rows'], SCAN_ROWS)
+    embedded_dir = out_dir / "embedded" if options['write_embedded'] else None
+    embedded_deps = {}
+    records = extract_records(path, options, embedded_dir, cache_dir, embedded_deps)
+    if records is None:
+        return [], None
+    fmt = options['format']
+    out_path = out_dir / f"{path.name}.{'txt' if fmt == 'text' else fmt}"
+    with stage('write'):
+        _write_records(records, out_path, options)
+    outputs = [out_path]
+    outputs.extend(Path(embedded['path']) for embedded in records.get('embedded', []) if 'path' in embedded)
+    if options['deps']:
+        with stage('deps'):
+            outputs.extend(_write_deps(path, records, out_dir, embedded_deps))
+    failed = 'error' in records and not records.get('pages')  # a PDF with pages is still usable
+    return outputs, records['error'] if failed else None
+
+
+def _write_records(records, out_path, options):
+    fmt = options['format']
+    if fmt == 'json':
+        write_text(out_path, json.dumps(records, ensure_ascii=False, indent=1))
+    elif fmt == 'jsonl':
+        write_text(out_path, ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in iter_jsonl(records)))
+    elif options['budget']:
+        write_text(out_path, render_digest(records, options['budget']))
+    else:
+        write_text(out_path, render_text(records))
+
+
+def _write_deps(path, records, out_dir, embedded_deps):
+    """Write the formula graphs; returns the paths written.
+
+    A workbook gets NAME.deps.json, and each embedded workbook with
+    formulas embedded/STEM__NAME.deps.json.
+    """
+    written = []
+    if records['type'] == 'xlsx':
+        try:
+            graph = build_graph(path)
+        except Exception:
+            graph = None  # the extraction already reports why the workbook could not be read
+        if graph is not None and graph.formulas:
+            deps_path = out_dir / f"{path.name}.deps.json"
+            write_text(deps_path, graph.to_json())
+            written.append(deps_path)
+    for index, deps in sorted(embedded_deps.items()):
+        deps_path = out_dir / 'embedded' / f"{path.stem}__{records['embedded'][index]['file']}.deps.json"
+        deps_path.parent.mkdir(parents=True, exist_ok=True)
+        write_text(deps_path, deps)
+        written.append(deps_path)
+    return written
+
+
+def keyed_options(options, path):
+    """The options that can change `path`'s output, with an 'auto' PDF backend resolved.
+
+    PDFs are also keyed on the OCR backend (None when OCR is unavailable),
+    so pages that could not be OCRed are extracted again once it is
+    installed rather than restored from the cache.
+    """
+    keyed = {k: v for k, v in options.items() if k not in UNCACHED_OPTIONS}
+    pdf_backend = keyed.pop('pdf_backend')
+    if path.suffix.lower() == '.pdf':
+        try:
+            keyed['pdf_backend'] = choose('pdf_text', pdf_backend)
+        except RuntimeError:
+            keyed['pdf_backend'] = None
+        if options['ocr_page_chars']:
+            try:
+                keyed['ocr_backend'] = choose('ocr')
+            except RuntimeError:
+                keyed['ocr_backend'] = None
+    return keyed
+
+
+def file_digest(path, options=None):
+    """Cache key: extractor version, options, file name (output names derive from it) and contents."""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    h = hashlib.sha256()
+    h.update(EXTRACTOR_VERSION.encode('utf-8'))
+    h.update(json.dumps(keyed_options(options, path), sort_keys=True).encode('utf-8'))
+    h.update(b'\0' + path.name.encode('utf-8') + b'\0')
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def restore_from_cache(cache_dir, digest, out_dir):
+    entry = cache_dir / digest
+    manifest = entry / 'manifest.json'
+    if not manifest.exists():
+        return None
+    restored = []
+    for rel in json.loads(manifest.read_text(encoding='utf-8')):
+        dest = out_dir / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        copy_file(entry / 'files' / rel, dest)
+        restored.append(dest)
+    return restored
+
+
+def store_in_cache(cache_dir, digest, out_dir, outputs):
+    entry = cache_dir / digest
+    if entry.exists():
+        return
+    # Build the entry under a temporary name and rename it into place so an
+    # interrupted run never leaves a half-written entry behind.
+    tmp = cache_dir / f".{digest}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    rels = []
+    for out in outputs:
+        if not out.exists():
+            continue
+        rel = out.relative_to(out_dir).as_posix()
+        dest = tmp / 'files' / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(out, dest)
+        rels.append(rel)
+    tmp.mkdir(parents=True, exist_ok=True)
+    (tmp / 'manifest.json').write_text(json.dumps(rels), encoding='utf-8')
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def extract_cached(path, out_dir, cache_dir=None, options=None):
+    """Like extract(), but reuse earlier results for byte-identical files.
+
+    Returns (outputs, from_cache). Raises ExtractionFailed, without
+    caching, for a file that yielded only an error record.
+    """
+    digest = None
+    if cache_dir is not None:
+        with stage('hash'):
+            digest = file_digest(path, options)
+        with stage('cache'):
+            restored = restore_from_cache(cache_dir, digest, out_dir)
+        if restored is not None:
+            return restored, True
+    outputs, error = _extract(path, out_dir, options, cache_dir)
+    if error:
+        raise ExtractionFailed(error, outputs)
+    if digest is None:
+        return outputs, False
+    with stage('cache'):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        store_in_cache(cache_dir, digest, out_dir, outputs)
+    return outputs, False
+
+
+def _extract_job(path, out_dir, cache_dir, options, journal=None, key=None, metrics=False):
+    """Worker entry point. Never raises, so one bad file cannot stop a batch.
+
+    Returns (status, error, outputs relative to out_dir, metrics line or None).
+    """
+    if journal is not None:
+        journal.start('extract', path, key)
+    if not metrics:
+        return _extract_one(path, out_dir, cache_dir, options) + (None,)
+    with recording(path) as record:
+        status, error, outputs = _extract_one(path, out_dir, cache_dir, options)
+    return status, error, outputs, as_dict(record, 'extract', status, bytes=path.stat().st_size)
+
+
+def _extract_one(path, out_dir, cache_dir, options):
+    try:
+        outputs, from_cache = extract_cached(path, out_dir, cache_dir, options)
+        return 'cached' if from_cache else 'extracted', None, [out.relative_to(out_dir).as_posix() for out in outputs]
+    except ExtractionFailed as exc:
+        return 'failed', str(exc), [out.relative_to(out_dir).as_posix() for out in exc.outputs]
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        write_text(out_dir / f"{path.name}.txt", f"ERROR: {error}")  # always .txt so the failure is visible
+        return 'failed', error, [f"{path.name}.txt"]
+
+
+def extract_all(paths, out_dir, cache_dir=None, jobs=1, options=None, journal=None, on_result=None, metrics=None):
+    """Extract many files, optionally across a process pool.
+
+    Every file writes only its own outputs, so the result on disk does not
+    depend on completion order. Returns {path: (status, error)}.
+
+    If a worker process dies, the files in flight with it are retried one
+    at a time in a fresh process and the rest of the batch continues on a
+    new pool. With a `journal` (see journal.py), files already extracted
+    with the same settings are skipped ('resumed'), each outcome is
+    recorded as it happens, and files that were running when an earlier
+    run died are retried one at a time too. `on_result(path, status,
+    error)` is called as each file finishes.
+
+    With `metrics` (a metrics.MetricsLog), every extracted file adds a
+    line with its per-stage timings.
+
+    With more than one job, `ocr_workers` is divided between the jobs
+    (at least one each), so concurrent PDFs do not run jobs times as many
+    tesseract processes as asked for.
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    if jobs > 1 and len(paths) > 1:
+        options['ocr_workers'] = max(1, options['ocr_workers'] // min(jobs, len(paths)))
+    results = {}
+    measure = metrics is not None
+    start = time.monotonic()
+    keys = {}
+    suspects = []
+    if options['pdf_backend'] == 'auto' and any(path.suffix.lower() == '.pdf' for path in paths):
+        try:  # once here rather than in every worker (the first call on a machine probes)
+            options['pdf_backend'] = choose('pdf_text')
+        except RuntimeError:
+            pass
+    if journal is not None:
+        keys = {path: journal_key(path, EXTRACTOR_VERSION, keyed_options(options, path)) for path in paths}
+        done, suspects, paths, given_up = journal.plan('extract', paths, keys, out_dir)
+        for path in done:
+            results[path] = ('resumed', None)
+        for path in given_up:
+            results[path] = ('failed', journal.state('extract', path, keys[path])['error'])
+
+    def report(path, outcome, crashed=False):
+        status, error, outputs, line = outcome
+        results[path] = (status, error)
+        if line:
+            metrics.add(line)
+        if journal is not None and crashed:
+            # Crashed on its own too: keep it failed until the file changes
+            journal.record('extract', path, keys[path], 'failed', error=error, gave_up=True)
+        elif journal is not None:
+            journal.finish('extract', path, keys[path], outputs, error)
+        if on_result:
+            on_result(path, status, error)
+        print(f"[{len(results)}/{len(keys) or len(paths)}] {status:<9} {path.name}", file=sys.stderr)
+
+    def run_isolated(path):
+        # A fresh single-worker pool, so a crash takes down only this file
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(_extract_job, path, out_dir, cache_dir, options, journal, keys.get(path), measure)
+            try:
+                report(path, future.result())
+            except Exception as exc:  # worker process died
+                report(path, ('failed', f"worker process died ({type(exc).__name__})", [], None), crashed=True)
+
+    for path in suspects:
+        run_isolated(path)
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            report(path, _extract_job(path, out_dir, cache_dir, options, journal, keys.get(path), measure))
+    else:
+        # At most `jobs` files are queued at a time, so when a worker dies the
+        # files in flight are exactly the ones its pool was running: only they
+        # are isolated, and the rest carry on in a new pool of full width.
+        queue = deque(paths)
+        crashed = []
+        while queue:
+            in_flight = {}
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                broken = False
+                while not broken and (queue or in_flight):
+                    while queue and len(in_flight) < jobs:
+                        path = queue.popleft()
+                        try:
+                            future = pool.submit(_extract_job, path, out_dir, cache_dir, options, journal,
+                                                 keys.get(path), measure)
+                        except BrokenProcessPool:
+                            queue.appendleft(path)
+                            broken = True
+                            break
+                        in_flight[future] = path
+                    done, _pending = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path = in_flight.pop(future)
+                        try:
+                            report(path, future.result())
+                        except Exception:  # a worker process died and took the pool down
+                            crashed.append(path)
+                            broken = True
+                crashed.extend(in_flight.values())
+        for path in crashed:
+            run_isolated(path)
+
+    counts = {status: 0 for status in ('extracted', 'cached', 'resumed', 'failed')}
+    for status, _error in results.values():
+        counts[status] += 1
+    print(
+        f"Done: {counts['extracted']} extracted, {counts['cached']} from cache, "
+        + (f"{counts['resumed']} already done, " if journal is not None else "")
+        + f"{counts['failed']} failed in {time.monotonic() - start:.1f}s",
+        file=sys.stderr,
+    )
+    for path in sorted(results):
+        status, error = results[path]
+        if status == 'failed':
+            print(f"  FAILED {path.name}: {error}", file=sys.stderr)
+    return results
 
 
 def main():
     parser = argparse.ArgumentParser(description='Extract text from DOCX/PDF/XLSX submissions.')
     parser.add_argument('--input', required=True, help='File or directory to process')
     parser.add_argument('--out', required=True, help='Output directory for extracted text')
+    parser.add_argument('--cache', help='Extraction cache directory (default: OUT/.extract_cache)')
+    parser.add_argument('--no-cache', action='store_true', help='Re-extract every file, ignoring the cache')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--format', choices=['text', 'json', 'jsonl'], default=DEFAULT_OPTIONS['format'],
+                        help='Output format: text (.txt, default), json (.json) or jsonl (.jsonl, one record per line)')
+    parser.add_argument('--max-rows', type=int, default=DEFAULT_OPTIONS['max_rows'],
+                        help='Rows previewed per worksheet (default: %(default)s; 0 disables the preview)')
+    parser.add_argument('--sheet-rows', action='append', default=[], metavar='SHEET=N',
+                        help='Per-sheet row limit overriding --max-rows (repeatable)')
+    parser.add_argument('--ocr-page-chars', type=int, default=DEFAULT_OPTIONS['ocr_page_chars'],
+                        help='OCR PDF pages whose text layer has fewer non-whitespace characters '
+                             '(default: %(default)s; 0 disables OCR)')
+    parser.add_argument('--ocr-workers', type=int, default=DEFAULT_OPTIONS['ocr_workers'],
+                        help='Concurrent tesseract processes, divided between the --jobs workers (default: %(default)s)')
+    parser.add_argument('--pdf-backend', choices=('auto',) + ORDER['pdf_text'], default=DEFAULT_OPTIONS['pdf_backend'],
+                        help='PDF text backend (default: %(default)s, the fastest one installed; '
+                             'see `python backends.py`)')
+    parser.add_argument('--no-deps', action='store_true',
+                        help='Skip the NAME.deps.json formula dependency graph for workbooks')
+    parser.add_argument('--write-embedded', action='store_true',
+                        help='Also write files embedded in DOCX submissions to OUT/embedded (for debugging; '
+                             'they are parsed in memory either way)')
+    parser.add_argument('--manifest', metavar='DB',
+                        help='Submission manifest (see manifest.py): extract only files it lists as pending, '
+                             'and record each outcome')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='Job journal (see journal.py): skip files finished by an earlier, interrupted run '
+                             '(default: none; pipeline.py uses OUT/.journal.jsonl)')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='Append per-file, per-stage timings to this JSONL file and print where the time went')
+    parser.add_argument('--profile', metavar='OUT',
+                        help='Profile the extraction of a single --input file and save the profile to OUT')
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile',
+                        help='Profiler for --profile (default: %(default)s)')
+    parser.add_argument('--budget', metavar='N[t]',
+                        help='Fit each .txt into N characters (or N tokens with a t suffix, e.g. 6000t), '
+                             'sizing each section to fit and listing what was left out')
     args = parser.parse_args()
 
+    budget = 0
+    if args.budget:
+        try:
+            budget = parse_budget(args.budget)
+        except ValueError:
+            parser.error(f"--budget expects N or Nt, got {args.budget!r}")
+        if args.format != 'text':
+            parser.error("--budget applies to --format text only")
+    sheet_rows = {}
+    for item in args.sheet_rows:
+        name, sep, rows = item.rpartition('=')
+        if not sep or not rows.isdigit():
+            parser.error(f"--sheet-rows expects SHEET=N, got {item!r}")
+        sheet_rows[name] = int(rows)
+    options = {
+        'format': args.format,
+        'max_rows': args.max_rows,
+        'sheet_rows': sheet_rows,
+        'ocr_page_chars': args.ocr_page_chars,
+        'ocr_workers': args.ocr_workers,
+        'budget': budget,
+        'deps': not args.no_deps,
+        'write_embedded': args.write_embedded,
+        'pdf_backend': args.pdf_backend,
+    }
+
     in_path = Path(args.input)
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
+    if args.no_cache:
+        cache_dir = None
+    else:
+        cache_dir = Path(args.cache) if args.cache else out_dir / '.extract_cache'
+
+    if args.profile:
+        if in_path.is_dir():
+            parser.error("--profile takes a single file as --input")
+        try:
+            profile_call(lambda: extract(in_path, out_dir, options), args.profile, args.profiler)
+        except RuntimeError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Profile: {args.profile}", file=sys.stderr)
+        return
 
     if in_path.is_dir():
-        for path in sorted(in_path.iterdir()):
-            if path.suffix.lower() in {'.docx', '.xlsx', '.pdf'}:
-                extract(path, out_dir)
+        paths = [p for p in sorted(in_path.iterdir()) if p.suffix.lower() in {'.docx', '.doc', '.xlsx', '.xls', '.pdf'}]
     else:
-        extract(in_path, out_dir)
+        paths = [in_path]
+    manifest = None
+    if args.manifest:
+        manifest = open_manifest(args.manifest, in_path if in_path.is_dir() else in_path.parent)
+        pending = {row['path'] for row in manifest.pending('extract')}
+        listed = len(paths)
+        paths = [p for p in paths if str(p.resolve()) in pending]
+        print(f"Manifest: {len(paths)} pending, {listed - len(paths)} done or not the latest version", file=sys.stderr)
+    journal = Journal(args.journal) if args.journal else None
+
+    def record(path, status, error):
+        manifest.mark([path], 'extract', 'failed' if status == 'failed' else 'done', error)
+
+    metrics = MetricsLog(args.metrics) if args.metrics else None
+    results = extract_all(paths, out_dir, cache_dir, jobs=args.jobs, options=options,
+                          journal=journal, on_result=record if manifest else None, metrics=metrics)
+    if manifest:
+        manifest.close()
+    if metrics:
+        print(metrics.summary(), file=sys.stderr)
+    if any(status == 'failed' for status, _error in results.values()):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
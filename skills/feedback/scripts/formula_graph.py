@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Cell-level formula dependency graph for XLSX workbooks.
+
+Every <f> element is read, including shared formulas: Excel writes the
+formula text once on the master cell (<f t="shared" ref="B3:B29" si="0">)
+and only <f t="shared" si="0"/> on the other cells, whose formulas are
+recovered by shifting the master's relative references.
+
+Nodes are formula cells; edges point from the cells and ranges a formula
+reads (its precedents) to the formula (a dependent). Lookups go both ways:
+
+    graph = build_graph(Path('model.xlsx'))
+    graph.precedents('Calc!D15')                  # ['Calc!B15', 'Calc!C15']
+    graph.dependents('Data!B3', transitive=True)  # every formula downstream
+
+The graph is saved as NAME.deps.json next to the extraction. Formulas
+filled down a column are stored once per run (sheet, range, first
+formula, R1C1 pattern), so a column of 10,000 formulas is one entry;
+edges are recomputed from the formulas when the file is loaded.
+
+Usage:
+    python formula_graph.py workbook.xlsx [--cell 'Calc!D15'] [--transitive] [--out deps.json]
+"""
+
+import argparse
+import json
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from collections import deque
+from pathlib import Path
+
+from cellrefs import formula_refs, index_to_col, shift_formula, split_ref, to_r1c1, unquote_sheet
+from ooxml import S_NS, cell_id, workbook_sheets
+
+DEPS_FORMAT = 'wmf-deps/1'
+_GROUPS_OPEN = ',"groups":['
+
+S = f"{{{S_NS}}}"
+S_C = S + 'c'
+S_F = S + 'f'
+S_V = S + 'v'
+S_ROW = S + 'row'
+
+# Ranges wider than this many columns are kept in a per-sheet list instead
+# of being indexed under every column they cover.
+WIDE_COLUMNS = 64
+
+
+class SharedFormulas:
+    """Resolves <f> elements on one sheet, filling in shared-formula children."""
+
+    def __init__(self):
+        self.masters = {}
+
+    def resolve(self, fnode, ref):
+        text = fnode.text
+        if fnode.attrib.get('t') != 'shared':
+            return text or None
+        si = fnode.attrib.get('si')
+        if text:
+            self.masters[si] = (ref, text)
+            return text
+        master = self.masters.get(si)
+        if master is None or not ref:
+            return None
+        col0, row0 = split_ref(master[0])
+        col, row = split_ref(ref)
+        return shift_formula(master[1], row - row0, col - col0)
+
+
+def iter_sheet_formulas(f):
+    """Stream a worksheet part, yielding (ref, formula, cached value) for each formula cell."""
+    shared = SharedFormulas()
+    for _event, elem in ET.iterparse(f, events=('end',)):
+        if elem.tag == S_C:
+            fnode = elem.find(S_F)
+            if fnode is not None:
+                ref = elem.attrib.get('r')
+                formula = shared.resolve(fnode, ref)
+                if formula and ref:
+                    v = elem.find(S_V)
+                    yield ref, formula, v.text if v is not None else None
+        elif elem.tag == S_ROW:
+            elem.clear()
+
+
+def _parse_id(cell):
+    sheet, _sep, ref = cell.rpartition('!')
+    return unquote_sheet(sheet), ref
+
+
+def _block_id(sheet, c1, r1, c2, r2):
+    start = f"{index_to_col(c1)}{r1}"
+    if (c1, r1) == (c2, r2):
+        return cell_id(sheet, start)
+    return cell_id(sheet, f"{start}:{index_to_col(c2)}{r2}")
+
+
+class _Intervals:
+    """Row intervals (r1, r2, node) in one column, queried by the row they contain.
+
+    A max-segment tree over the intervals sorted by start row: each lookup
+    costs O(log n) per interval found, however many intervals overlap. With
+    `tree` from copy_tree(), found intervals are removed so a traversal
+    never reports the same one twice.
+    """
+
+    def __init__(self, entries):
+        entries.sort()
+        self.starts = [r1 for r1, _r2, _node in entries]
+        self.nodes = [node for _r1, _r2, node in entries]
+        self.size = 1
+        while self.size < len(entries):
+            self.size *= 2
+        self.tree = [0] * (2 * self.size)
+        for i, (_r1, r2, _node) in enumerate(entries):
+            self.tree[self.size + i] = r2
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def copy_tree(self):
+        return list(self.tree)
+
+    def containing(self, row, tree=None):
+        remove = tree is not None
+        tree = tree if remove else self.tree
+        limit = bisect_right(self.starts, row)  # only intervals starting at or above `row`
+        found = []
+        stack = [(1, 0, self.size)]
+        while stack:
+            i, lo, hi = stack.pop()
+            if lo >= limit or tree[i] < row:
+                continue
+            if i >= self.size:
+                found.append(self.nodes[i - self.size])
+                if remove:
+                    tree[i] = 0
+                    j = i // 2
+                    while j and tree[j] != max(tree[2 * j], tree[2 * j + 1]):
+                        tree[j] = max(tree[2 * j], tree[2 * j + 1])
+                        j //= 2
+                continue
+            mid = (lo + hi) // 2
+            stack.append((2 * i + 1, mid, hi))
+            stack.append((2 * i, lo, mid))
+        return found
+
+
+class FormulaGraph:
+    """Formula cells with their precedents, indexed for lookups in both directions.
+
+    Cells are (sheet, column number, row number) internally; the public
+    methods take and return ids like 'Calc!D15' or "'My Sheet'!A1:B9".
+    Range lookups are indexed per column, so a column of running totals
+    (=SUM($A$1:A2), =SUM($A$1:A3), ...) does not make queries quadratic.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self.sheets = []
+        self.formulas = {}     # cell -> formula text
+        self.values = {}       # cell -> cached value text
+        self.blocks = {}       # cell -> [(sheet, c1, r1, c2, r2)] it reads
+        self._cell_readers = {}    # (sheet, col, row) -> {formula cells reading it}
+        self._range_entries = {}   # (sheet, col) -> [(r1, r2, formula cell)] reading part of it
+        self._wide_readers = {}    # sheet -> [(c1, r1, c2, r2, formula cell)]
+        self._intervals = None     # (sheet, col) -> _Intervals, built on first lookup
+        self._columns = None       # sheet -> ([cols], {col: sorted formula rows})
+
+    def add(self, sheet, ref, formula, value=None):
+        if sheet not in self.sheets:
+            self.sheets.append(sheet)
+        col, row = split_ref(ref)
+        node = (sheet, col, row)
+        self.formulas[node] = formula
+        if value is not None:
+            self.values[node] = value
+        blocks = [(ref_sheet or sheet, c1, r1, c2, r2) for ref_sheet, c1, r1, c2, r2 in formula_refs(formula)]
+        self.blocks[node] = blocks
+        for block_sheet, c1, r1, c2, r2 in blocks:
+            if (c1, r1) == (c2, r2):
+                self._cell_readers.setdefault((block_sheet, c1, r1), set()).add(node)
+            elif c2 - c1 >= WIDE_COLUMNS:
+                self._wide_readers.setdefault(block_sheet, []).append((c1, r1, c2, r2, node))
+            else:
+                for c in range(c1, c2 + 1):
+                    self._range_entries.setdefault((block_sheet, c), []).append((r1, r2, node))
+        self._intervals = None
+        self._columns = None
+
+    def _readers(self, sheet, col, row, trees=None):
+        """Formula cells that read (sheet, col, row) directly.
+
+        With `trees` (a dict kept across calls), readers already reported
+        are not reported again.
+        """
+        if self._intervals is None:
+            self._intervals = {key: _Intervals(list(entries)) for key, entries in self._range_entries.items()}
+        found = set(self._cell_readers.get((sheet, col, row), ()))
+        intervals = self._intervals.get((sheet, col))
+        if intervals:
+            tree = None
+            if trees is not None:
+                tree = trees.get((sheet, col))
+                if tree is None:
+                    tree = trees[(sheet, col)] = intervals.copy_tree()
+            found.update(intervals.containing(row, tree))
+        for c1, r1, c2, r2, node in self._wide_readers.get(sheet, ()):
+            if c1 <= col <= c2 and r1 <= row <= r2:
+                found.add(node)
+        return found
+
+    def _formula_columns(self, sheet):
+        """([formula columns], {col: sorted formula rows}) for a sheet."""
+        if self._columns is None:
+            columns = {}
+            for s, c, r in self.formulas:
+                columns.setdefault(s, {}).setdefault(c, []).append(r)
+            self._columns = {s: (sorted(cols), {c: sorted(rows) for c, rows in cols.items()})
+                             for s, cols in columns.items()}
+        return self._columns.get(sheet, ([], {}))
+
+    def _block_columns(self, sheet, c1, r1, c2, r2):
+        """(col, sorted rows, lo, hi) for each formula column a block covers; rows[lo:hi] are inside it."""
+        cols, rows_by_col = self._formula_columns(sheet)
+        for col in cols[bisect_left(cols, c1):bisect_right(cols, c2)]:
+            rows = rows_by_col[col]
+            lo, hi = bisect_left(rows, r1), bisect_right(rows, r2)
+            if lo < hi:
+                yield col, rows, lo, hi
+
+    def precedents(self, cell, transitive=False):
+        """Cells and ranges `cell` reads. With `transitive`, also everything those formulas read."""
+        start = self._node(cell)
+        if not transitive:
+            return [_block_id(*block) for block in self.blocks.get(start, ())]
+        seen_blocks = {}
+        # Per column, the next not-yet-visited formula row at or after each
+        # index (with path compression), so overlapping ranges are walked once
+        skip = {}
+
+        def next_unvisited(key, i):
+            links = skip[key]
+            root = i
+            while links.get(root, root) != root:
+                root = links[root]
+            while links.get(i, i) != root:
+                links[i], i = root, links[i]
+            return root
+
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for block in self.blocks.get(node, ()):
+                seen_blocks[block] = None
+                for col, rows, lo, hi in self._block_columns(*block):
+                    key = (block[0], col)
+                    skip.setdefault(key, {})
+                    i = next_unvisited(key, lo)
+                    while i < hi:
+                        upstream = (block[0], col, rows[i])
+                        skip[key][i] = i + 1
+                        if upstream != start:
+                            queue.append(upstream)
+                        i = next_unvisited(key, i + 1)
+        return [_block_id(*block) for block in seen_blocks]
+
+    def dependents(self, cell, transitive=False):
+        """Formula cells that read `cell`. With `transitive`, everything downstream of it."""
+        start = self._node(cell)
+        if not transitive:
+            found = self._readers(*start)
+        else:
+            trees = {}
+            found = set()
+            queue = deque([start])
+            while queue:
+                for node in self._readers(*queue.popleft(), trees):
+                    if node not in found:
+                        found.add(node)
+                        queue.append(node)
+        return [_block_id(s, c, r, c, r) for s, c, r in sorted(found, key=self._sort_key)]
+
+    def order(self):
+        """Formula cells in calculation order (precedents first).
+
+        Returns (ordered, unresolved); unresolved cells are on a circular
+        reference or downstream of one. A range is linked to the formula
+        cells inside it through a segment tree per column, so the number
+        of links stays O(n log n) even when every formula reads a long range.
+        """
+        upstream = {}
+        sizes = {}
+        for sheet in self.sheets:
+            cols, rows_by_col = self._formula_columns(sheet)
+            for col in cols:
+                rows = rows_by_col[col]
+                size = 1
+                while size < len(rows):
+                    size *= 2
+                sizes[(sheet, col)] = size
+                for i, row in enumerate(rows):
+                    upstream[('seg', sheet, col, size + i)] = [(sheet, col, row)]
+                for i in range(size - 1, 0, -1):
+                    kids = [('seg', sheet, col, k) for k in (2 * i, 2 * i + 1) if ('seg', sheet, col, k) in upstream]
+                    if kids:
+                        upstream[('seg', sheet, col, i)] = kids
+        for node, blocks in self.blocks.items():
+            sources = upstream.setdefault(node, [])
+            for block in blocks:
+                for col, _rows, lo, hi in self._block_columns(*block):
+                    size = sizes[(block[0], col)]
+                    lo, hi = lo + size, hi + size
+                    while lo < hi:
+                        if lo & 1:
+                            sources.append(('seg', block[0], col, lo))
+                            lo += 1
+                        if hi & 1:
+                            hi -= 1
+                            sources.append(('seg', block[0], col, hi))
+                        lo //= 2
+                        hi //= 2
+
+        downstream = {}
+        waiting = {}
+        for node, sources in upstream.items():
+            waiting[node] = len(sources)
+            for source in sources:
+                downstream.setdefault(source, []).append(node)
+        ready = deque(node for node, n in waiting.items() if n == 0)
+        ordered = []
+        while ready:
+            node = ready.popleft()
+            if len(node) == 3:  # a formula cell, not a segment
+                ordered.append(node)
+            for child in downstream.get(node, ()):
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+        unresolved = sorted((node for node, n in waiting.items() if n > 0 and len(node) == 3),
+                            key=self._sort_key)
+        return ordered, unresolved
+
+    def _sort_key(self, node):
+        sheet, col, row = node
+        return (self.sheets.index(sheet) if sheet in self.sheets else len(self.sheets), row, col)
+
+    def _node(self, cell):
+        sheet, ref = _parse_id(cell)
+        col, row = split_ref(ref)
+        return (sheet, col, row)
+
+    def runs(self):
+        """Formula cells merged into vertical runs that share an R1C1 pattern.
+
+        Returns [(sheet, col, first row, last row, first formula, pattern)]
+        in sheet, row, column order.
+        """
+        runs = []
+        open_runs = {}  # (sheet, col) -> index of that column's latest run
+        for node in sorted(self.formulas, key=lambda n: (n[0], n[1], n[2])):
+            sheet, col, row = node
+            formula = self.formulas[node]
+            try:
+                pattern = to_r1c1(formula, f"{index_to_col(col)}{row}")
+            except ValueError:
+                pattern = formula
+            latest = open_runs.get((sheet, col))
+            if latest is not None and runs[latest][5] == pattern and runs[latest][3] == row - 1:
+                runs[latest][3] = row
+            else:
+                open_runs[(sheet, col)] = len(runs)
+                runs.append([sheet, col, row, row, formula, pattern])
+        runs.sort(key=lambda run: (self._sort_key((run[0], run[1], run[2]))))
+        return [tuple(run) for run in runs]
+
+    def groups(self):
+        """runs() in the form stored in NAME.deps.json."""
+        groups = []
+        for sheet, col, first, last, formula, pattern in self.runs():
+            span = f"{index_to_col(col)}{first}"
+            if last != first:
+                span += f":{index_to_col(col)}{last}"
+            groups.append({'sheet': self.sheets.index(sheet), 'range': span,
+                           'formula': formula, 'pattern': pattern})
+        return groups
+
+    def to_json(self):
+        groups = self.groups()
+        _ordered, unresolved = self.order()
+        edges = sum(len(blocks) for blocks in self.blocks.values())
+        head = {
+            'format': DEPS_FORMAT,
+            'file': self.file,
+            'sheets': self.sheets,
+            'cells': len(self.formulas),
+            'edges': edges,
+            'circular': [_block_id(s, c, r, c, r) for s, c, r in unresolved],
+        }
+        # One group per line keeps large graphs diffable and the file small
+        lines = [json.dumps(head, ensure_ascii=False)[:-1] + _GROUPS_OPEN]
+        lines.append(',\n'.join(json.dumps(g, ensure_ascii=False, separators=(',', ':')) for g in groups))
+        lines.append(']}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def rename_json(text, name):
+        """to_json() text with its 'file' set to `name`; the groups are left as they are."""
+        head, sep, rest = text.partition('\n')
+        data = json.loads(head[:-len(_GROUPS_OPEN)] + '}')
+        data['file'] = name
+        return json.dumps(data, ensure_ascii=False)[:-1] + _GROUPS_OPEN + sep + rest
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        graph = cls(data.get('file'))
+        graph.sheets = list(data['sheets'])
+        for group in data['groups']:
+            sheet = data['sheets'][group['sheet']]
+            first, _sep, last = group['range'].partition(':')
+            col, row0 = split_ref(first)
+            row1 = split_ref(last)[1] if last else row0
+            ref = f"{index_to_col(col)}{row0}"
+            graph.add(sheet, ref, group['formula'])
+            for row in range(row0 + 1, row1 + 1):
+                graph.add(sheet, f"{index_to_col(col)}{row}", shift_formula(group['formula'], row - row0, 0))
+        return graph
+
+
+def build_graph(source, name=None):
+    """Read every formula in a workbook (path or file-like object) into a FormulaGraph."""
+    graph = FormulaGraph(name or Path(source).name)
+    with zipfile.ZipFile(source) as z:
+        for sheet_name, part in workbook_sheets(z):
+            graph.sheets.append(sheet_name)
+            with z.open(part) as f:
+                for ref, formula, value in iter_sheet_formulas(f):
+                    graph.add(sheet_name, ref, formula, value)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the formula dependency graph of an XLSX workbook.')
+    parser.add_argument('workbook', help='XLSX file')
+    parser.add_argument('--cell', action='append', default=[],
+                        help="Show precedents and dependents of a cell, e.g. 'Calc!D15' (repeatable)")
+    parser.add_argument('--transitive', action='store_true', help='Follow --cell lookups all the way up and down')
+    parser.add_argument('--out', help='Write the graph as JSON to this file (default: print it)')
+    args = parser.parse_args()
+
+    graph = build_graph(Path(args.workbook))
+    if args.cell:
+        for cell in args.cell:
+            sheet, ref = _parse_id(cell)
+            if not sheet:
+                parser.error(f"--cell needs a sheet-qualified reference, got {cell!r}")
+            node = graph._node(cell)
+            print(cell)
+            if node in graph.formulas:
+                print(f"  formula: ={graph.formulas[node]}")
+            print(f"  precedents: {', '.join(graph.precedents(cell, args.transitive)) or '-'}")
+            print(f"  dependents: {', '.join(graph.dependents(cell, args.transitive)) or '-'}")
+    elif args.out:
+        Path(args.out).write_text(graph.to_json(), encoding='utf-8')
+    else:
+        sys.stdout.write(graph.to_json())
+
+
+if __name__ == '__main__':
+    main()
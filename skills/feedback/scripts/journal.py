@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Append-only job journal that lets batch stages resume after a crash.
+
+Each line is one JSON event for one file and stage:
+
+    {"stage": "extract", "file": "/abs/path.docx", "key": "...", "event": "start"}
+    {"stage": "extract", "file": "/abs/path.docx", "key": "...", "event": "done", "outputs": [...]}
+    {"stage": "extract", "file": "/abs/path.docx", "key": "...", "event": "failed", "error": "..."}
+
+Events are appended with a single write and fsynced, so a crash loses at
+most the line being written, and a torn last line is ignored on load.
+Worker processes append their own "start" events.
+
+On restart, a file is skipped when its last event is "done" for the same
+key (file size, mtime and stage settings) and its outputs still exist. A
+file with a "start" but no outcome was running when the batch died; it
+is retried on its own, and after `max_attempts` such interruptions it is
+recorded as failed, so one file that crashes the process cannot stop
+every later run.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_MAX_ATTEMPTS = 2
+
+
+def journal_key(path, *settings):
+    """Identity of a file plus the settings that shape a stage's output."""
+    stat = Path(path).stat()
+    h = hashlib.sha256()
+    h.update(json.dumps([stat.st_size, stat.st_mtime_ns, *settings], sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def append_event(journal_path, entry):
+    """Append one event. Safe to call from several processes at once."""
+    line = (json.dumps({**entry, 'time': round(time.time(), 3)}, ensure_ascii=False) + '\n').encode('utf-8')
+    fd = os.open(journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """The journal file and the last known state of every (stage, file)."""
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.states = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with self.path.open('rb') as f:
+                for raw in f:
+                    try:
+                        self._apply(json.loads(raw))
+                    except ValueError:
+                        continue  # torn last line from a crash
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def __getstate__(self):
+        # Worker processes only need the path, to append their "start" events
+        return {'path': self.path, 'max_attempts': self.max_attempts, 'states': {}}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _apply(self, entry):
+        slot = (entry['stage'], entry['file'])
+        state = self.states.get(slot)
+        if state is None or state['key'] != entry['key']:
+            state = self.states[slot] = {'key': entry['key'], 'status': None, 'interrupted': 0,
+                                         'outputs': [], 'error': None, 'gave_up': False}
+        if entry['event'] == 'start':
+            state['interrupted'] += 1  # until an outcome for this attempt follows
+            state['status'] = None
+        else:
+            state['interrupted'] = 0
+            state['status'] = entry['event']
+            state['outputs'] = entry.get('outputs', [])
+            state['error'] = entry.get('error')
+            state['gave_up'] = entry.get('gave_up', False)
+
+    def state(self, stage, path, key):
+        """{'status': 'done' | 'failed' | None, 'interrupted': n, 'outputs', 'error'} for this key."""
+        state = self.states.get((stage, str(Path(path).resolve())))
+        if state is None or state['key'] != key:
+            return {'status': None, 'interrupted': 0, 'outputs': [], 'error': None, 'gave_up': False}
+        return state
+
+    def is_done(self, stage, path, key, out_dir):
+        state = self.state(stage, path, key)
+        return state['status'] == 'done' and all((Path(out_dir) / rel).exists() for rel in state['outputs'])
+
+    def record(self, stage, path, key, event, **detail):
+        entry = {'stage': stage, 'file': str(Path(path).resolve()), 'key': key, 'event': event, **detail}
+        with self._lock:
+            append_event(self.path, entry)
+            self._apply(entry)
+
+    def start(self, stage, path, key):
+        self.record(stage, path, key, 'start')
+
+    def finish(self, stage, path, key, outputs=(), error=None):
+        """Record an outcome: 'failed' when `error` is set, else 'done' with its outputs."""
+        if error:
+            self.record(stage, path, key, 'failed', error=error)
+        else:
+            self.record(stage, path, key, 'done', outputs=[str(rel) for rel in outputs])
+
+    def plan(self, stage, paths, keys, out_dir):
+        """Split paths into (done, suspects, todo, given_up).
+
+        Suspects were interrupted mid-run before and should be retried one
+        at a time; given_up were interrupted `max_attempts` times and stay
+        failed until the file changes.
+        """
+        done, suspects, todo, given_up = [], [], [], []
+        for path in paths:
+            key = keys[path]
+            state = self.state(stage, path, key)
+            if self.is_done(stage, path, key, out_dir):
+                done.append(path)
+            elif state['gave_up']:
+                given_up.append(path)
+            elif state['interrupted'] >= self.max_attempts:
+                self.record(stage, path, key, 'failed', gave_up=True,
+                            error=f"gave up after {state['interrupted']} interrupted attempts")
+                given_up.append(path)
+            elif state['interrupted']:
+                suspects.append(path)
+            else:
+                todo.append(path)
+        return done, suspects, todo, given_up
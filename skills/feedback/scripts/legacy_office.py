@@ -0,0 +1,1201 @@
+#!/usr/bin/env python3
+"""
+Read Word and Excel 97-2003 files (.doc, .xls) in process, without LibreOffice.
+
+Both are OLE compound files, opened with olefile:
+
+- doc_records() follows the piece table of the WordDocument stream to
+  the document text, keeps field results (not field codes), reads
+  tracked insertions and deletions from the character revision marks,
+  and reads comments with their authors.
+- xls_records() walks the BIFF8 Workbook stream record by record: cell
+  values (shared strings resolved), cached formula results, and the
+  formulas themselves, decoded from their token arrays. A formula using
+  a token this reader does not know is left out; its cell still has its
+  value.
+
+The records have the same fields as docx_records() and xlsx_records() in
+extract_submission_text.py, plus 'format': 'doc' or 'xls'. Word 6/95,
+Excel 5/95 and encrypted files yield an error record. sniff_format()
+spots .doc and .xls files that are really .docx/.xlsx or RTF, and
+rtf_records() reads the text of the RTF ones.
+
+Usage:
+    python legacy_office.py old_report.doc     # print the records as JSON
+"""
+import argparse
+import io
+import json
+import re
+import struct
+import sys
+import zipfile
+from bisect import bisect_right
+from pathlib import Path
+
+import olefile
+
+from cellrefs import index_to_col
+from ooxml import cell_id
+
+# --- Word 97 ----------------------------------------------------------------
+
+WORD_IDENT = 0xA5EC
+WORD97_NFIB = 0xC1
+
+# FibRgFcLcb97 entries (fc, lcb pairs in the table stream) used here
+FIB_PLCFANDREF = 4
+FIB_PLCFANDTXT = 5
+FIB_PLCFBTECHPX = 12
+FIB_CLX = 33
+FIB_GRPXSTATNOWNERS = 36
+FIB_STTBFRMARK = 51
+
+SPRM_RMARK_DEL = 0x0800
+SPRM_RMARK = 0x0801
+SPRM_IBST_RMARK = 0x4804
+SPRM_DTTM_RMARK = 0x6805
+SPRM_IBST_RMARK_DEL = 0x4863
+SPRM_DTTM_RMARK_DEL = 0x6864
+SPRM_TDEF_TABLE = 0xD608
+SPRA_SIZES = {0: 1, 1: 1, 2: 2, 3: 4, 4: 2, 5: 2, 7: 3}
+
+PARAGRAPH_ENDS = '\r\x07\x0c'  # paragraph mark, table cell/row end, page or section break
+FIELD_BEGIN, FIELD_SEPARATOR, FIELD_END = '\x13', '\x14', '\x15'
+ANNOTATION_REF = '\x05'
+CHAR_MAP = {'\t': '\t', '\x0b': '\n', '\x1e': '-'}  # other control characters are dropped
+TOKEN = re.compile(r'[\x00-\x1f]|[^\x00-\x1f]+')
+
+
+def _fc_lcb(word, index):
+    return struct.unpack_from('<II', word, 0x9A + 8 * index)
+
+
+def _pieces(table, fc, lcb):
+    """(first cp, end cp, file offset, bytes per character) for each text piece."""
+    clx = table[fc:fc + lcb]
+    pos = 0
+    while pos < len(clx) and clx[pos] == 0x01:  # Prc: property modifiers, not needed for text
+        pos += 3 + struct.unpack_from('<H', clx, pos + 1)[0]
+    if pos >= len(clx) or clx[pos] != 0x02:
+        raise ValueError("no piece table")
+    size = struct.unpack_from('<I', clx, pos + 1)[0]
+    plc = clx[pos + 5:pos + 5 + size]
+    count = (len(plc) - 4) // 12
+    cps = struct.unpack_from(f'<{count + 1}I', plc)
+    pieces = []
+    for i in range(count):
+        fc_value = struct.unpack_from('<I', plc, 4 * (count + 1) + 8 * i + 2)[0]
+        if fc_value & 0x40000000:  # 8-bit (cp1252) text
+            pieces.append((cps[i], cps[i + 1], (fc_value & 0x3FFFFFFF) // 2, 1))
+        else:
+            pieces.append((cps[i], cps[i + 1], fc_value, 2))
+    return pieces
+
+
+def _sprms(grpprl):
+    pos = 0
+    while pos + 2 <= len(grpprl):
+        sprm = struct.unpack_from('<H', grpprl, pos)[0]
+        pos += 2
+        if sprm == SPRM_TDEF_TABLE:
+            size = struct.unpack_from('<H', grpprl, pos)[0] + 1
+        elif sprm >> 13 == 6:
+            size = grpprl[pos] + 1 if pos < len(grpprl) else 1
+        else:
+            size = SPRA_SIZES[sprm >> 13]
+        yield sprm, grpprl[pos:pos + size]
+        pos += size
+
+
+def _revision_mark(grpprl):
+    """('ins' or 'del', author index, DTTM) for a CHPX carrying a revision mark, or None."""
+    kinds = set()
+    values = {}
+    for sprm, operand in _sprms(grpprl):
+        if sprm in (SPRM_RMARK, SPRM_RMARK_DEL) and operand and operand[0] in (1, 0x81):
+            kinds.add('del' if sprm == SPRM_RMARK_DEL else 'ins')
+        elif sprm in (SPRM_IBST_RMARK, SPRM_IBST_RMARK_DEL) and len(operand) == 2:
+            values[sprm] = struct.unpack('<h', operand)[0]
+        elif sprm in (SPRM_DTTM_RMARK, SPRM_DTTM_RMARK_DEL) and len(operand) == 4:
+            values[sprm] = struct.unpack('<I', operand)[0]
+    if 'del' in kinds:  # inserted and then deleted: gone from the document
+        return ('del', values.get(SPRM_IBST_RMARK_DEL, values.get(SPRM_IBST_RMARK)),
+                values.get(SPRM_DTTM_RMARK_DEL, values.get(SPRM_DTTM_RMARK)))
+    if 'ins' in kinds:
+        return ('ins', values.get(SPRM_IBST_RMARK), values.get(SPRM_DTTM_RMARK))
+    return None
+
+
+def _revision_runs(word, table):
+    """Sorted (first fc, end fc, mark) for the text runs that carry a revision mark."""
+    fc, lcb = _fc_lcb(word, FIB_PLCFBTECHPX)
+    count = (lcb - 4) // 8
+    if count <= 0:
+        return []
+    pns = struct.unpack_from(f'<{count}I', table, fc + 4 * (count + 1))
+    runs = []
+    for pn in pns:
+        page = word[(pn & 0x3FFFFF) * 512:((pn & 0x3FFFFF) + 1) * 512]
+        if len(page) < 512:
+            continue
+        crun = page[511]
+        fcs = struct.unpack_from(f'<{crun + 1}I', page)
+        for i in range(crun):
+            offset = page[4 * (crun + 1) + i] * 2
+            if not offset:
+                continue  # default character properties
+            mark = _revision_mark(page[offset + 1:offset + 1 + page[offset]])
+            if mark:
+                runs.append((fcs[i], fcs[i + 1], mark))
+    runs.sort()
+    return runs
+
+
+def _spans(pieces, runs, end):
+    """(first cp, end cp, revision mark or None) covering cp 0..end."""
+    starts = [run[0] for run in runs]
+    for cp0, cp1, fc, width in pieces:
+        cp1 = min(cp1, end)
+        if cp0 >= cp1:
+            continue
+        cp = cp0
+        i = max(bisect_right(starts, fc + (cp - cp0) * width) - 1, 0)
+        while cp < cp1:
+            pos = fc + (cp - cp0) * width
+            while i < len(runs) and runs[i][1] <= pos:
+                i += 1
+            if i < len(runs) and runs[i][0] <= pos:
+                stop = cp0 + (runs[i][1] - fc) // width
+                mark = runs[i][2]
+            else:
+                stop = cp0 + (runs[i][0] - fc) // width if i < len(runs) else cp1
+                mark = None
+            stop = min(max(stop, cp + 1), cp1)
+            yield cp, stop, mark
+            cp = stop
+
+
+def _xst_list(data):
+    """Names from a run of Xst (u16 length + UTF-16) strings."""
+    names = []
+    pos = 0
+    while pos + 2 <= len(data):
+        cch = struct.unpack_from('<H', data, pos)[0]
+        names.append(data[pos + 2:pos + 2 + 2 * cch].decode('utf-16-le', errors='replace'))
+        pos += 2 + 2 * cch
+    return names
+
+
+def _sttb(data):
+    """Strings from an STTB (string table), ignoring their extra data."""
+    if len(data) < 6:
+        return []
+    extended = data[:2] == b'\xff\xff'
+    pos = 2 if extended else 0
+    count, extra = struct.unpack_from('<HH', data, pos)
+    pos += 4
+    names = []
+    for _ in range(count):
+        if extended:
+            cch = struct.unpack_from('<H', data, pos)[0]
+            names.append(data[pos + 2:pos + 2 + 2 * cch].decode('utf-16-le', errors='replace'))
+            pos += 2 + 2 * cch + extra
+        else:
+            cch = data[pos]
+            names.append(data[pos + 1:pos + 1 + cch].decode('cp1252', errors='replace'))
+            pos += 1 + cch + extra
+    return names
+
+
+def _dttm(value):
+    """ISO date for a Word DTTM, or "Unknown"."""
+    if not value:
+        return "Unknown"
+    minute, hour, day = value & 0x3F, (value >> 6) & 0x1F, (value >> 11) & 0x1F
+    month, year = (value >> 16) & 0x0F, 1900 + ((value >> 20) & 0x1FF)
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return "Unknown"
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:00Z"
+
+
+def _clean(text):
+    """Visible text of a subdocument range: field results only, control characters dropped."""
+    out = []
+    fields = []  # one entry per open field: True while still in its code
+    for token in TOKEN.findall(text):
+        if token == FIELD_BEGIN:
+            fields.append(True)
+        elif token == FIELD_SEPARATOR:
+            if fields:
+                fields[-1] = False
+        elif token == FIELD_END:
+            if fields:
+                fields.pop()
+        elif True in fields:
+            continue
+        elif token in PARAGRAPH_ENDS:
+            out.append('\n')
+        elif len(token) > 1 or token >= ' ':
+            out.append(token)
+        else:
+            out.append(CHAR_MAP.get(token, ''))
+    return ' '.join(line.strip() for line in ''.join(out).split('\n') if line.strip())
+
+
+class _DocumentBuilder:
+    """Collects paragraphs, runs and tracked changes from the main text, in order."""
+
+    def __init__(self, authors):
+        self.authors = authors
+        self.paragraphs = []
+        self.changes = {'insertions': [], 'deletions': []}
+        self.offset = 0
+        self.counter = 0
+        self.pending_comments = []
+        self.change = None
+        self._new_paragraph()
+
+    def _new_paragraph(self):
+        self.counter += 1
+        self.para_id = f"p{self.counter}"
+        self.parts = []
+        self.length = 0
+        self.runs = []
+        self.comments = self.pending_comments
+        self.pending_comments = []
+
+    def _change_for(self, mark):
+        kind, ibst, dttm = mark
+        key = (kind, ibst, dttm)
+        if self.change is None or self.change[0] != key:
+            author = self.authors[ibst] if ibst is not None and 0 <= ibst < len(self.authors) else "Unknown"
+            entries = self.changes['insertions' if kind == 'ins' else 'deletions']
+            entry = {
+                'id': f"{kind}{len(entries) + 1}", 'author': author or "Unknown", 'date': _dttm(dttm),
+                'paragraph': self.para_id, 'offset': self.length, 'text': '',
+            }
+            entries.append(entry)
+            self.change = (key, entry)
+        return self.change[1]
+
+    def add_text(self, text, mark):
+        change = None
+        if mark is not None:
+            entry = self._change_for(mark)
+            entry['text'] += text
+            if mark[0] == 'del':
+                return  # deleted text is not part of the paragraph
+            change = entry['id']
+        else:
+            self.change = None
+        if self.runs and self.runs[-1]['change'] == change:
+            self.runs[-1]['text'] += text
+        else:
+            self.runs.append({'id': f"{self.para_id}.r{len(self.runs) + 1}", 'offset': self.length,
+                              'text': text, 'change': change})
+        self.parts.append(text)
+        self.length += len(text)
+
+    def add_comment(self, comment):
+        self.comments.append({'comment': comment, 'offset': self.length})
+
+    def end_paragraph(self):
+        self.change = None
+        text = ''.join(self.parts)
+        if text.strip():
+            self.paragraphs.append({'id': self.para_id, 'offset': self.offset, 'text': text,
+                                    'runs': self.runs, 'comments': self.comments})
+            self.offset += len(text) + 1
+        else:
+            self.pending_comments = self.comments  # keep anchors in empty paragraphs
+        self._new_paragraph()
+
+
+def _read_comments(word, table, text, start):
+    """(comment records, {anchor cp: comment id}) from the annotation subdocument at `start`."""
+    ref_fc, ref_lcb = _fc_lcb(word, FIB_PLCFANDREF)
+    txt_fc, txt_lcb = _fc_lcb(word, FIB_PLCFANDTXT)
+    count = (ref_lcb - 4) // 34
+    if count <= 0 or txt_lcb < 4 * (count + 1):
+        return [], {}
+    owners_fc, owners_lcb = _fc_lcb(word, FIB_GRPXSTATNOWNERS)
+    owners = _xst_list(table[owners_fc:owners_fc + owners_lcb])
+    anchors = struct.unpack_from(f'<{count}I', table, ref_fc)
+    bounds = struct.unpack_from(f'<{count + 1}I', table, txt_fc)
+    comments = []
+    anchor_at = {}
+    for i in range(count):
+        atrd = ref_fc + 4 * (count + 1) + 30 * i
+        initials_len = min(struct.unpack_from('<H', table, atrd)[0], 9)
+        initials = table[atrd + 2:atrd + 2 + 2 * initials_len].decode('utf-16-le', errors='replace')
+        ibst = struct.unpack_from('<h', table, atrd + 20)[0]
+        author = owners[ibst] if 0 <= ibst < len(owners) else initials
+        comments.append({
+            'id': f"c{i}", 'author': author or "Unknown", 'date': "Unknown",
+            'text': _clean(text[start + bounds[i]:start + bounds[i + 1]]),
+        })
+        anchor_at[anchors[i]] = f"c{i}"
+    return comments, anchor_at
+
+
+def doc_records(source, name=None):
+    """Typed records for a Word 97-2003 document (path or file-like object).
+
+    Returns the fields of docx_records() with 'type': 'docx' and
+    'format': 'doc'.
+    """
+    name = name or Path(source).name
+    try:
+        with olefile.OleFileIO(source) as ole:
+            if not ole.exists('WordDocument'):
+                raise ValueError("no WordDocument stream (not a Word 97-2003 document)")
+            word = ole.openstream('WordDocument').read()
+            ident, nfib = struct.unpack_from('<HH', word)
+            flags = struct.unpack_from('<H', word, 0x0A)[0]
+            if ident != WORD_IDENT:
+                raise ValueError("not a Word document")
+            if nfib < WORD97_NFIB:
+                raise ValueError("Word 6/95 documents are not supported")
+            if flags & 0x0100:
+                raise ValueError("document is encrypted")
+            table_name = '1Table' if flags & 0x0200 else '0Table'
+            if not ole.exists(table_name):
+                raise ValueError(f"no {table_name} stream")
+            table = ole.openstream(table_name).read()
+
+        ccp = struct.unpack_from('<8I', word, 0x4C)  # text, footnote, header, -, annotation, ...
+        pieces = _pieces(table, *_fc_lcb(word, FIB_CLX))
+        text = ''.join(
+            word[fc:fc + (cp1 - cp0) * width].decode('cp1252' if width == 1 else 'utf-16-le', errors='replace')
+            for cp0, cp1, fc, width in pieces
+        )
+        comments, anchor_at = [], {}
+        if ccp[4]:
+            try:
+                comments, anchor_at = _read_comments(word, table, text, sum(ccp[:4]))
+            except Exception:
+                comments, anchor_at = [], {}
+        try:
+            runs = _revision_runs(word, table)
+            fc_lcb = _fc_lcb(word, FIB_STTBFRMARK)
+            authors = _sttb(table[fc_lcb[0]:fc_lcb[0] + fc_lcb[1]])
+        except Exception:
+            runs, authors = [], []
+
+        builder = _DocumentBuilder(authors)
+        fields = []  # one entry per open field: True while still in its code
+        for cp0, cp1, mark in _spans(pieces, runs, ccp[0]):
+            for match in TOKEN.finditer(text, cp0, cp1):
+                token = match.group()
+                if token == FIELD_BEGIN:
+                    fields.append(True)
+                elif token == FIELD_SEPARATOR:
+                    if fields:
+                        fields[-1] = False
+                elif token == FIELD_END:
+                    if fields:
+                        fields.pop()
+                elif token in PARAGRAPH_ENDS:
+                    builder.end_paragraph()
+                elif True in fields:
+                    continue
+                elif token == ANNOTATION_REF:
+                    if match.start() in anchor_at:
+                        builder.add_comment(anchor_at[match.start()])
+                elif len(token) > 1 or token >= ' ':
+                    builder.add_text(token, mark)
+                elif CHAR_MAP.get(token):
+                    builder.add_text(CHAR_MAP[token], mark)
+        builder.end_paragraph()
+    except Exception as exc:
+        return {'type': 'docx', 'format': 'doc', 'file': name, 'error': str(exc)}
+
+    return {
+        'type': 'docx',
+        'format': 'doc',
+        'file': name,
+        'paragraphs': builder.paragraphs,
+        'insertions': builder.changes['insertions'],
+        'deletions': builder.changes['deletions'],
+        'comments': comments,
+    }
+
+
+# --- Excel 97 (BIFF8) ---------------------------------------------------------
+
+BIFF8 = 0x0600
+RT_BOF = 0x0809
+RT_EOF = 0x000A
+RT_CONTINUE = 0x003C
+RT_FILEPASS = 0x002F
+RT_BOUNDSHEET = 0x0085
+RT_SST = 0x00FC
+RT_NAME = 0x0018
+RT_EXTERNSHEET = 0x0017
+RT_SUPBOOK = 0x01AE
+RT_LABELSST = 0x00FD
+RT_LABEL = 0x0204
+RT_RSTRING = 0x00D6
+RT_NUMBER = 0x0203
+RT_RK = 0x027E
+RT_MULRK = 0x00BD
+RT_BOOLERR = 0x0205
+RT_FORMULA = 0x0006
+RT_STRING = 0x0207
+RT_SHRFMLA = 0x04BC
+RT_ARRAY = 0x0221
+CELL_RECORDS = {RT_LABELSST, RT_LABEL, RT_RSTRING, RT_NUMBER, RT_RK, RT_MULRK, RT_BOOLERR, RT_FORMULA}
+
+ERRORS = {0x00: '#NULL!', 0x07: '#DIV/0!', 0x0F: '#VALUE!', 0x17: '#REF!', 0x1D: '#NAME?',
+          0x24: '#NUM!', 0x2A: '#N/A'}
+BUILTIN_NAMES = {0x00: 'Consolidate_Area', 0x01: 'Auto_Open', 0x02: 'Auto_Close', 0x03: 'Extract',
+                 0x04: 'Database', 0x05: 'Criteria', 0x06: 'Print_Area', 0x07: 'Print_Titles',
+                 0x08: 'Recorder', 0x09: 'Data_Form', 0x0A: 'Auto_Activate', 0x0B: 'Auto_Deactivate',
+                 0x0C: 'Sheet_Title', 0x0D: '_FilterDatabase'}
+BINARY_OPERATORS = {0x03: '+', 0x04: '-', 0x05: '*', 0x06: '/', 0x07: '^', 0x08: '&', 0x09: '<',
+                    0x0A: '<=', 0x0B: '=', 0x0C: '>=', 0x0D: '>', 0x0E: '<>', 0x0F: ' ', 0x10: ',',
+                    0x11: ':'}
+# Skipped tokens (the Mem* subexpression markers) and the bytes that follow them
+SKIPPED_TOKENS = {0x26: 6, 0x27: 6, 0x28: 6, 0x29: 2, 0x2E: 2, 0x2F: 2}
+
+# Built-in functions by index: (name, fixed argument count or None if variable)
+FUNCTIONS = {
+    0: ('COUNT', None), 1: ('IF', None), 2: ('ISNA', 1), 3: ('ISERROR', 1), 4: ('SUM', None),
+    5: ('AVERAGE', None), 6: ('MIN', None), 7: ('MAX', None), 8: ('ROW', None), 9: ('COLUMN', None),
+    10: ('NA', 0), 11: ('NPV', None), 12: ('STDEV', None), 13: ('DOLLAR', None), 14: ('FIXED', None),
+    15: ('SIN', 1), 16: ('COS', 1), 17: ('TAN', 1), 18: ('ATAN', 1), 19: ('PI', 0), 20: ('SQRT', 1),
+    21: ('EXP', 1), 22: ('LN', 1), 23: ('LOG10', 1), 24: ('ABS', 1), 25: ('INT', 1), 26: ('SIGN', 1),
+    27: ('ROUND', 2), 28: ('LOOKUP', None), 29: ('INDEX', None), 30: ('REPT', 2), 31: ('MID', 3),
+    32: ('LEN', 1), 33: ('VALUE', 1), 34: ('TRUE', 0), 35: ('FALSE', 0), 36: ('AND', None), 37: ('OR', None),
+    38: ('NOT', 1), 39: ('MOD', 2), 40: ('DCOUNT', 3), 41: ('DSUM', 3), 42: ('DAVERAGE', 3), 43: ('DMIN', 3),
+    44: ('DMAX', 3), 45: ('DSTDEV', 3), 46: ('VAR', None), 47: ('DVAR', 3), 48: ('TEXT', 2),
+    49: ('LINEST', None), 50: ('TREND', None), 51: ('LOGEST', None), 52: ('GROWTH', None), 56: ('PV', None),
+    57: ('FV', None), 58: ('NPER', None), 59: ('PMT', None), 60: ('RATE', None), 61: ('MIRR', 3),
+    62: ('IRR', None), 63: ('RAND', 0), 64: ('MATCH', None), 65: ('DATE', 3), 66: ('TIME', 3), 67: ('DAY', 1),
+    68: ('MONTH', 1), 69: ('YEAR', 1), 70: ('WEEKDAY', None), 71: ('HOUR', 1), 72: ('MINUTE', 1),
+    73: ('SECOND', 1), 74: ('NOW', 0), 75: ('AREAS', 1), 76: ('ROWS', 1), 77: ('COLUMNS', 1),
+    78: ('OFFSET', None), 82: ('SEARCH', None), 83: ('TRANSPOSE', 1), 86: ('TYPE', 1), 97: ('ATAN2', 2),
+    98: ('ASIN', 1), 99: ('ACOS', 1), 100: ('CHOOSE', None), 101: ('HLOOKUP', None), 102: ('VLOOKUP', None),
+    105: ('ISREF', 1), 109: ('LOG', None), 111: ('CHAR', 1), 112: ('LOWER', 1), 113: ('UPPER', 1),
+    114: ('PROPER', 1), 115: ('LEFT', None), 116: ('RIGHT', None), 117: ('EXACT', 2), 118: ('TRIM', 1),
+    119: ('REPLACE', 4), 120: ('SUBSTITUTE', None), 121: ('CODE', 1), 124: ('FIND', None), 125: ('CELL', None),
+    126: ('ISERR', 1), 127: ('ISTEXT', 1), 128: ('ISNUMBER', 1), 129: ('ISBLANK', 1), 130: ('T', 1),
+    131: ('N', 1), 140: ('DATEVALUE', 1), 141: ('TIMEVALUE', 1), 142: ('SLN', 3), 143: ('SYD', 4),
+    144: ('DDB', None), 148: ('INDIRECT', None), 162: ('CLEAN', 1), 163: ('MDETERM', 1), 164: ('MINVERSE', 1),
+    165: ('MMULT', 2), 167: ('IPMT', None), 168: ('PPMT', None), 169: ('COUNTA', None), 183: ('PRODUCT', None),
+    184: ('FACT', 1), 189: ('DPRODUCT', 3), 190: ('ISNONTEXT', 1), 193: ('STDEVP', None), 194: ('VARP', None),
+    195: ('DSTDEVP', 3), 196: ('DVARP', 3), 197: ('TRUNC', None), 198: ('ISLOGICAL', 1), 199: ('DCOUNTA', 3),
+    212: ('ROUNDUP', 2), 213: ('ROUNDDOWN', 2), 216: ('RANK', None), 219: ('ADDRESS', None),
+    220: ('DAYS360', None), 221: ('TODAY', 0), 222: ('VDB', None), 227: ('MEDIAN', None),
+    228: ('SUMPRODUCT', None), 229: ('SINH', 1), 230: ('COSH', 1), 231: ('TANH', 1), 232: ('ASINH', 1),
+    233: ('ACOSH', 1), 234: ('ATANH', 1), 235: ('DGET', 3), 244: ('INFO', 1), 247: ('DB', None),
+    252: ('FREQUENCY', 2), 261: ('ERROR.TYPE', 1), 269: ('AVEDEV', None), 270: ('BETADIST', None),
+    271: ('GAMMALN', 1), 272: ('BETAINV', None), 273: ('BINOMDIST', 4), 274: ('CHIDIST', 2),
+    275: ('CHIINV', 2), 276: ('COMBIN', 2), 277: ('CONFIDENCE', 3), 278: ('CRITBINOM', 3), 279: ('EVEN', 1),
+    280: ('EXPONDIST', 3), 281: ('FDIST', 3), 282: ('FINV', 3), 283: ('FISHER', 1), 284: ('FISHERINV', 1),
+    285: ('FLOOR', 2), 286: ('GAMMADIST', 4), 287: ('GAMMAINV', 3), 288: ('CEILING', 2),
+    289: ('HYPGEOMDIST', 4), 290: ('LOGNORMDIST', 3), 291: ('LOGINV', 3), 292: ('NEGBINOMDIST', 3),
+    293: ('NORMDIST', 4), 294: ('NORMSDIST', 1), 295: ('NORMINV', 3), 296: ('NORMSINV', 1),
+    297: ('STANDARDIZE', 3), 298: ('ODD', 1), 299: ('PERMUT', 2), 300: ('POISSON', 3), 301: ('TDIST', 3),
+    302: ('WEIBULL', 4), 303: ('SUMXMY2', 2), 304: ('SUMX2MY2', 2), 305: ('SUMX2PY2', 2), 306: ('CHITEST', 2),
+    307: ('CORREL', 2), 308: ('COVAR', 2), 309: ('FORECAST', 3), 310: ('FTEST', 2), 311: ('INTERCEPT', 2),
+    312: ('PEARSON', 2), 313: ('RSQ', 2), 314: ('STEYX', 2), 315: ('SLOPE', 2), 316: ('TTEST', 4),
+    317: ('PROB', None), 318: ('DEVSQ', None), 319: ('GEOMEAN', None), 320: ('HARMEAN', None),
+    321: ('SUMSQ', None), 322: ('KURT', None), 323: ('SKEW', None), 324: ('ZTEST', None), 325: ('LARGE', 2),
+    326: ('SMALL', 2), 327: ('QUARTILE', 2), 328: ('PERCENTILE', 2), 329: ('PERCENTRANK', None),
+    330: ('MODE', None), 331: ('TRIMMEAN', 2), 332: ('TINV', 2), 336: ('CONCATENATE', None), 337: ('POWER', 2),
+    342: ('RADIANS', 1), 343: ('DEGREES', 1), 344: ('SUBTOTAL', None), 345: ('SUMIF', None),
+    346: ('COUNTIF', 2), 347: ('COUNTBLANK', 1), 350: ('ISPMT', 4), 354: ('ROMAN', None),
+    358: ('GETPIVOTDATA', 2), 359: ('HYPERLINK', None), 360: ('PHONETIC', 1), 361: ('AVERAGEA', None),
+    362: ('MAXA', None), 363: ('MINA', None), 364: ('STDEVPA', None), 365: ('VARPA', None),
+    366: ('STDEVA', None), 367: ('VARA', None),
+}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _biff_records(stream):
+    """(record type, data, [CONTINUE data]) for each record from the stream's position on."""
+    header = stream.read(4)
+    while len(header) == 4:
+        rtype, size = struct.unpack('<HH', header)
+        data = stream.read(size)
+        continues = []
+        header = stream.read(4)
+        while len(header) == 4 and struct.unpack_from('<H', header)[0] == RT_CONTINUE:
+            continues.append(stream.read(struct.unpack_from('<H', header, 2)[0]))
+            header = stream.read(4)
+        yield rtype, data, continues
+
+
+def _xl_string(data, pos, length_size=2):
+    """(text, position after it) for an XLUnicodeString (or the short form with length_size=1)."""
+    if length_size == 1:
+        cch = data[pos]
+    else:
+        cch = struct.unpack_from('<H', data, pos)[0]
+    flags = data[pos + length_size]
+    pos += length_size + 1
+    if flags & 0x01:
+        return data[pos:pos + 2 * cch].decode('utf-16-le', errors='replace'), pos + 2 * cch
+    return data[pos:pos + cch].decode('latin-1'), pos + cch
+
+
+class _Chunks:
+    """Reads strings across a record and its CONTINUE records.
+
+    Characters that run on into the next record restart it with a fresh
+    option byte saying whether they are 8- or 16-bit.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.index = 0
+        self.pos = 0
+
+    def _next_chunk(self):
+        self.index += 1
+        self.pos = 0
+        if self.index >= len(self.chunks):
+            raise ValueError("truncated string table")
+
+    def read(self, n):
+        out = b''
+        while n:
+            chunk = self.chunks[self.index]
+            if self.pos >= len(chunk):
+                self._next_chunk()
+                continue
+            piece = chunk[self.pos:self.pos + n]
+            self.pos += len(piece)
+            n -= len(piece)
+            out += piece
+        return out
+
+    def string(self):
+        cch, flags = struct.unpack('<HB', self.read(3))
+        runs = struct.unpack('<H', self.read(2))[0] if flags & 0x08 else 0
+        extra = struct.unpack('<I', self.read(4))[0] if flags & 0x04 else 0
+        wide = flags & 0x01
+        parts = []
+        while cch:
+            chunk = self.chunks[self.index]
+            if self.pos >= len(chunk):
+                self._next_chunk()
+                wide = self.chunks[self.index][0] & 0x01
+                self.pos = 1
+                continue
+            width = 2 if wide else 1
+            take = min(cch, (len(chunk) - self.pos) // width)
+            if not take:
+                self.pos = len(chunk)
+                continue
+            raw = chunk[self.pos:self.pos + take * width]
+            parts.append(raw.decode('utf-16-le', errors='replace') if wide else raw.decode('latin-1'))
+            self.pos += take * width
+            cch -= take
+        self.read(4 * runs + extra)  # formatting runs and phonetic data
+        return ''.join(parts)
+
+
+def _number(value):
+    """Cell value text for a float, as the .xlsx <v> element would hold it."""
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _rk(value):
+    if value & 0x02:
+        number = struct.unpack('<i', struct.pack('<I', value))[0] >> 2
+    else:
+        number = struct.unpack('<d', struct.pack('<Q', (value & 0xFFFFFFFC) << 32))[0]
+    return number / 100 if value & 0x01 else number
+
+
+class _Workbook:
+    """What the globals substream says: sheets, shared strings and what formulas refer to."""
+
+    def __init__(self):
+        self.sheets = []  # (name, substream offset, type) in BOUNDSHEET order
+        self.strings = []
+        self.names = []
+        self.xti = []  # (supporting book, first sheet, last sheet)
+        self.supbooks = []  # True for this workbook's own SUPBOOK
+
+    def sheet_prefix(self, ixti):
+        book, first, last = self.xti[ixti]
+        if not self.supbooks[book]:
+            raise _Unsupported("external reference")
+        if not (0 <= first < len(self.sheets) and 0 <= last < len(self.sheets)):
+            return '#REF!'
+        if first == last:
+            return cell_id(self.sheets[first][0], '')
+        return cell_id(f"{self.sheets[first][0]}:{self.sheets[last][0]}", '')
+
+
+def _read_globals(stream):
+    book = _Workbook()
+    for rtype, data, continues in _biff_records(stream):
+        if rtype == RT_BOF:
+            if struct.unpack_from('<H', data)[0] != BIFF8:
+                raise ValueError("Excel 5/95 or older workbooks are not supported")
+        elif rtype == RT_FILEPASS:
+            raise ValueError("workbook is encrypted")
+        elif rtype == RT_BOUNDSHEET:
+            offset, _state, kind = struct.unpack_from('<IBB', data)
+            book.sheets.append((_xl_string(data, 6, 1)[0], offset, kind))
+        elif rtype == RT_SST:
+            count = struct.unpack_from('<I', data, 4)[0]
+            chunks = _Chunks([data[8:]] + continues)
+            book.strings = [chunks.string() for _ in range(count)]
+        elif rtype == RT_NAME:
+            builtin = struct.unpack_from('<H', data)[0] & 0x0020
+            cch = data[3]
+            flags = data[14]
+            if flags & 0x01:
+                text = data[15:15 + 2 * cch].decode('utf-16-le', errors='replace')
+            else:
+                text = data[15:15 + cch].decode('latin-1')
+            if builtin and text:
+                text = BUILTIN_NAMES.get(ord(text[0]), f"_builtin{ord(text[0])}")
+            book.names.append(text)
+        elif rtype == RT_SUPBOOK:
+            book.supbooks.append(data[2:4] == b'\x01\x04')
+        elif rtype == RT_EXTERNSHEET:
+            data += b''.join(continues)
+            count = struct.unpack_from('<H', data)[0]
+            book.xti = [struct.unpack_from('<Hhh', data, 2 + 6 * i) for i in range(count)]
+        elif rtype == RT_EOF:
+            break
+    return book
+
+
+def _ref_text(rw, col_field, row, col, relative):
+    """A1 text for a cell location; RefN/AreaN locations are offsets from (row, col)."""
+    row_relative = col_field & 0x8000
+    col_relative = col_field & 0x4000
+    r, c = rw, col_field & 0xFF
+    if relative:
+        if row_relative:
+            r = (row + (r - 0x10000 if r & 0x8000 else r)) % 0x10000
+        if col_relative:
+            c = (col + (c - 0x100 if c & 0x80 else c)) % 0x100
+    return (('' if col_relative else '$') + index_to_col(c + 1),
+            ('' if row_relative else '$') + str(r + 1))
+
+
+def _area_text(rgce, pos, row, col, relative):
+    rw1, rw2, c1, c2 = struct.unpack_from('<HHHH', rgce, pos)
+    col1, row1 = _ref_text(rw1, c1, row, col, relative)
+    col2, row2 = _ref_text(rw2, c2, row, col, relative)
+    if rw1 == 0 and rw2 == 0xFFFF and not relative:
+        return f"{col1}:{col2}"
+    if c1 & 0xFF == 0 and c2 & 0xFF == 0xFF and not relative:
+        return f"{row1}:{row2}"
+    return f"{col1}{row1}:{col2}{row2}"
+
+
+def decode_formula(rgce, row, col, book):
+    """Formula text (without '=') for a BIFF8 token array at (row, col), or None."""
+    stack = []
+    pos = 0
+    try:
+        while pos < len(rgce):
+            ptg = rgce[pos]
+            pos += 1
+            if ptg in BINARY_OPERATORS:
+                right = stack.pop()
+                stack.append(stack.pop() + BINARY_OPERATORS[ptg] + right)
+            elif ptg == 0x12:
+                stack.append('+' + stack.pop())
+            elif ptg == 0x13:
+                stack.append('-' + stack.pop())
+            elif ptg == 0x14:
+                stack.append(stack.pop() + '%')
+            elif ptg == 0x15:
+                stack.append('(' + stack.pop() + ')')
+            elif ptg == 0x16:
+                stack.append('')
+            elif ptg == 0x17:
+                text, pos = _xl_string(rgce, pos, 1)
+                stack.append('"' + text.replace('"', '""') + '"')
+            elif ptg == 0x19:
+                attr = rgce[pos]
+                if attr & 0x04:  # CHOOSE jump table
+                    pos += 3 + 2 * (struct.unpack_from('<H', rgce, pos + 1)[0] + 1)
+                else:
+                    pos += 3
+                    if attr & 0x10:
+                        stack.append(f"SUM({stack.pop()})")
+            elif ptg == 0x1C:
+                stack.append(ERRORS.get(rgce[pos], '#N/A'))
+                pos += 1
+            elif ptg == 0x1D:
+                stack.append('TRUE' if rgce[pos] else 'FALSE')
+                pos += 1
+            elif ptg == 0x1E:
+                stack.append(str(struct.unpack_from('<H', rgce, pos)[0]))
+                pos += 2
+            elif ptg == 0x1F:
+                stack.append(_number(struct.unpack_from('<d', rgce, pos)[0]))
+                pos += 8
+            elif ptg < 0x20:
+                raise _Unsupported(ptg)
+            else:
+                base = (ptg & 0x1F) | 0x20  # reference, value and array classes share a layout
+                if base in (0x21, 0x22):
+                    if base == 0x21:
+                        index = struct.unpack_from('<H', rgce, pos)[0]
+                        name, argc = FUNCTIONS.get(index, (None, None))
+                        pos += 2
+                    else:
+                        argc = rgce[pos] & 0x7F
+                        index = struct.unpack_from('<H', rgce, pos + 1)[0] & 0x7FFF
+                        name = FUNCTIONS.get(index, (None, None))[0]
+                        pos += 3
+                    if name is None or argc is None:
+                        raise _Unsupported(index)
+                    args = stack[len(stack) - argc:] if argc else []
+                    if len(args) != argc:
+                        raise _Unsupported(name)
+                    del stack[len(stack) - argc:]
+                    stack.append(f"{name}({','.join(args)})")
+                elif base == 0x23:
+                    stack.append(book.names[struct.unpack_from('<H', rgce, pos)[0] - 1])
+                    pos += 4
+                elif base in (0x24, 0x2C):
+                    rw, c = struct.unpack_from('<HH', rgce, pos)
+                    stack.append(''.join(_ref_text(rw, c, row, col, base == 0x2C)))
+                    pos += 4
+                elif base in (0x25, 0x2D):
+                    stack.append(_area_text(rgce, pos, row, col, base == 0x2D))
+                    pos += 8
+                elif base in SKIPPED_TOKENS:
+                    pos += SKIPPED_TOKENS[base]
+                elif base in (0x2A, 0x2B):
+                    stack.append('#REF!')
+                    pos += 4 if base == 0x2A else 8
+                elif base == 0x3A:
+                    ixti, rw, c = struct.unpack_from('<HHH', rgce, pos)
+                    stack.append(book.sheet_prefix(ixti) + ''.join(_ref_text(rw, c, row, col, False)))
+                    pos += 6
+                elif base == 0x3B:
+                    ixti = struct.unpack_from('<H', rgce, pos)[0]
+                    stack.append(book.sheet_prefix(ixti) + _area_text(rgce, pos + 2, row, col, False))
+                    pos += 10
+                elif base in (0x3C, 0x3D):
+                    ixti = struct.unpack_from('<H', rgce, pos)[0]
+                    stack.append(book.sheet_prefix(ixti) + '#REF!')
+                    pos += 6 if base == 0x3C else 10
+                else:
+                    raise _Unsupported(ptg)
+    except (_Unsupported, IndexError, KeyError, struct.error):
+        return None
+    return stack[0] if len(stack) == 1 else None
+
+
+def _cell_values(rtype, data, book):
+    """(row, col, value, kind) for each cell a record holds; formulas are handled by the caller."""
+    if rtype == RT_MULRK:
+        row, first = struct.unpack_from('<HH', data)
+        count = (len(data) - 6) // 6
+        return [(row, first + i, _number(_rk(struct.unpack_from('<I', data, 4 + 6 * i + 2)[0])), 'n')
+                for i in range(count)]
+    row, col = struct.unpack_from('<HH', data)
+    if rtype == RT_LABELSST:
+        return [(row, col, book.strings[struct.unpack_from('<I', data, 6)[0]], 's')]
+    if rtype in (RT_LABEL, RT_RSTRING):
+        return [(row, col, _xl_string(data, 6)[0], 's')]
+    if rtype == RT_NUMBER:
+        return [(row, col, _number(struct.unpack_from('<d', data, 6)[0]), 'n')]
+    if rtype == RT_RK:
+        return [(row, col, _number(_rk(struct.unpack_from('<I', data, 6)[0])), 'n')]
+    if rtype == RT_BOOLERR:
+        value, is_error = data[6], data[7]
+        if is_error:
+            return [(row, col, ERRORS.get(value, '#N/A'), 'e')]
+        return [(row, col, '1' if value else '0', 'b')]
+    return []
+
+
+def _read_sheet(stream, offset, sheet, limit, book, records):
+    """Add a worksheet's cells and formulas to `records`, up to `limit` rows with values."""
+    stream.seek(offset)
+    shared = {}  # first cell of a shared or array formula -> token array
+    waiting = {}  # first cell -> formula records seen before their SHRFMLA/ARRAY record
+    string_result = None  # (cell, formula) whose value is in the next STRING record
+    previewed = 0
+    current_row, has_values = None, False
+    depth = 0
+
+    def add_cell(row, col, value, kind):
+        nonlocal has_values
+        if value is None:
+            return
+        ref = f"{index_to_col(col + 1)}{row + 1}"
+        records['cells'].append({'id': cell_id(sheet, ref), 'sheet': sheet, 'ref': ref,
+                                 'row': row + 1, 'type': kind, 'value': value})
+        has_values = True
+
+    for rtype, data, _continues in _biff_records(stream):
+        if rtype == RT_BOF:
+            depth += 1
+            continue
+        if rtype == RT_EOF:
+            depth -= 1
+            if depth <= 0:
+                break
+            continue
+        if depth > 1:
+            continue  # a chart substream inside the sheet
+        if rtype == RT_STRING and string_result is not None:
+            cell, formula = string_result
+            string_result = None
+            value = _xl_string(data, 0)[0] or None
+            formula['value'] = value
+            add_cell(cell[0], cell[1], value, 'str')
+            continue
+        if rtype in (RT_SHRFMLA, RT_ARRAY):
+            first_row, _last_row, first_col = struct.unpack_from('<HHB', data)
+            start = 10 if rtype == RT_SHRFMLA else 14
+            cce = struct.unpack_from('<H', data, start - 2)[0]
+            shared[(first_row, first_col)] = data[start:start + cce]
+            for formula, row, col in waiting.pop((first_row, first_col), []):
+                formula['formula'] = decode_formula(shared[(first_row, first_col)], row, col, book)
+                if formula['formula']:
+                    records['formulas'].append(formula)
+            continue
+        if rtype not in CELL_RECORDS:
+            continue
+
+        row = struct.unpack_from('<H', data)[0]
+        if row != current_row:
+            if has_values:
+                previewed += 1
+                if previewed >= limit:
+                    return previewed
+            current_row, has_values = row, False
+            string_result = None
+
+        if rtype != RT_FORMULA:
+            for cell in _cell_values(rtype, data, book):
+                add_cell(*cell)
+            continue
+
+        row, col = struct.unpack_from('<HH', data)
+        result = data[6:14]
+        ref = f"{index_to_col(col + 1)}{row + 1}"
+        formula = {'id': cell_id(sheet, ref), 'sheet': sheet, 'ref': ref, 'formula': None, 'value': None}
+        if result[6:8] == b'\xff\xff':
+            if result[0] == 0x00:
+                string_result = ((row, col), formula)
+            elif result[0] == 0x01:
+                formula['value'] = '1' if result[2] else '0'
+                add_cell(row, col, formula['value'], 'b')
+            elif result[0] == 0x02:
+                formula['value'] = ERRORS.get(result[2], '#N/A')
+                add_cell(row, col, formula['value'], 'e')
+        else:
+            formula['value'] = _number(struct.unpack('<d', result)[0])
+            add_cell(row, col, formula['value'], 'n')
+        cce = struct.unpack_from('<H', data, 20)[0]
+        rgce = data[22:22 + cce]
+        if rgce[:1] == b'\x01' and len(rgce) >= 5:  # PtgExp: part of a shared or array formula
+            master = struct.unpack_from('<HH', rgce, 1)
+            if master in shared:
+                formula['formula'] = decode_formula(shared[master], row, col, book)
+            else:
+                waiting.setdefault(master, []).append((formula, row, col))
+                continue
+        else:
+            formula['formula'] = decode_formula(rgce, row, col, book)
+        if formula['formula']:
+            records['formulas'].append(formula)
+
+    if has_values:
+        previewed += 1
+    return previewed
+
+
+def _workbook_stream(source):
+    """The BIFF8 Workbook stream of a compound file, or `source` itself if it is a bare stream."""
+    if hasattr(source, 'read'):
+        head = source.read(8)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            head = f.read(8)
+    if head[:2] == b'\x09\x08':  # BOF record: a Workbook stream on its own
+        return source if hasattr(source, 'read') else io.BytesIO(Path(source).read_bytes())
+    with olefile.OleFileIO(source) as ole:
+        if ole.exists('Workbook'):
+            return ole.openstream('Workbook')
+        if ole.exists('Book'):
+            raise ValueError("Excel 5/95 workbooks are not supported")
+        raise ValueError("no Workbook stream (not an Excel 97-2003 workbook)")
+
+
+def xls_records(source, max_rows=40, sheet_rows=None, name=None):
+    """Typed records for an Excel 97-2003 workbook (path or file-like object).
+
+    `source` may also be a bare Workbook stream, the way Word 97 stores an
+    embedded workbook. Returns the fields of xlsx_records() with 'type':
+    'xlsx' and 'format': 'xls'; 'charts' is empty and sheets have no 'part'.
+    """
+    name = name or Path(source).name
+    sheet_rows = sheet_rows or {}
+    records = {'type': 'xlsx', 'format': 'xls', 'file': name, 'sheets': [], 'cells': [],
+               'formulas': [], 'charts': [], 'strings': []}
+    try:
+        stream = _workbook_stream(source)
+        book = _read_globals(stream)
+        worksheets = [(sheet, offset) for sheet, offset, kind in book.sheets if kind == 0x00]
+        for index, (sheet, offset) in enumerate(worksheets, 1):
+            limit = sheet_rows.get(sheet, max_rows)
+            previewed = _read_sheet(stream, offset, sheet, limit, book, records) if limit else 0
+            records['sheets'].append({'id': f"sheet{index}", 'name': sheet, 'part': None,
+                                      'rows_previewed': previewed})
+    except Exception as exc:
+        return {'type': 'xlsx', 'format': 'xls', 'file': name, 'error': str(exc)}
+
+    seen = set()
+    for s in book.strings:
+        if s not in seen:
+            records['strings'].append(s)
+            seen.add(s)
+        if len(records['strings']) >= 200:
+            break
+    return records
+
+
+# --- Misnamed files ----------------------------------------------------------------
+
+ZIP_MAGIC = b'PK\x03\x04'
+RTF_MAGIC = b'{\\rtf'
+
+
+def sniff_format(path):
+    """'ole', 'zip' (a .docx or .xlsx), 'rtf' or None, from the first bytes of a .doc or .xls file.
+
+    Word happily saves RTF under a .doc name, and renamed .docx/.xlsx
+    files are common, so the extension alone does not pick the reader.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    if head.startswith(olefile.MAGIC):
+        return 'ole'
+    if head.startswith(ZIP_MAGIC):
+        return 'zip'
+    if head.startswith(RTF_MAGIC):
+        return 'rtf'
+    return None
+
+
+RTF_TOKEN = re.compile(rb"\\([a-zA-Z]+)(-?\d+)? ?|\\'([0-9a-fA-F]{2})|\\(.)|([{}])|[\r\n]+|([^\\{}\r\n]+)", re.DOTALL)
+# Destinations whose contents are not document text
+RTF_SKIP = {
+    'fonttbl', 'colortbl', 'stylesheet', 'info', 'pict', 'object', 'header', 'headerl', 'headerr', 'headerf',
+    'footer', 'footerl', 'footerr', 'footerf', 'fldinst', 'themedata', 'colorschememapping', 'latentstyles',
+    'datastore', 'xmlnstbl', 'listtable', 'listoverridetable', 'rsidtbl', 'generator', 'filetbl', 'revtbl',
+    'pgdsctbl', 'mmathPr', 'listtext', 'pntext',
+}
+RTF_CHARS = {
+    'par': '\n', 'line': '\n', 'sect': '\n', 'page': '\n', 'row': '\n', 'cell': '\t', 'tab': '\t',
+    'emdash': '\u2014', 'endash': '\u2013', 'lquote': '\u2018', 'rquote': '\u2019',
+    'ldblquote': '\u201c', 'rdblquote': '\u201d', 'bullet': '\u2022', 'emspace': ' ', 'enspace': ' ',
+}
+RTF_SYMBOLS = {'~': '\u00a0', '_': '\u2011', '-': '', '\\': '\\', '{': '{', '}': '}'}
+
+
+def rtf_text(data):
+    """Visible text of an RTF document; paragraphs end with newlines."""
+    out = []
+    codepage = 'cp1252'
+    skip, uc = False, 1
+    pending = 0  # fallback characters still to drop after a \uN
+    stack = []
+    group_start = False
+    for match in RTF_TOKEN.finditer(data):
+        word, arg, hexbyte, symbol, brace, text = match.groups()
+        if not (word or hexbyte or symbol or brace or text):
+            continue  # line breaks in the source are not text
+        at_start, group_start = group_start, False
+        if brace == b'{':
+            stack.append((skip, uc))
+            group_start = True
+        elif brace == b'}':
+            skip, uc = stack.pop() if stack else (False, 1)
+            pending = 0
+        elif word is not None:
+            word = word.decode('ascii')
+            if word in RTF_SKIP:
+                skip = True
+            elif word == 'ansicpg' and arg:
+                codepage = f"cp{int(arg)}"
+            elif word == 'uc' and arg:
+                uc = int(arg)
+            elif skip:
+                continue
+            elif word == 'u' and arg:
+                out.append(chr(int(arg) % 65536))
+                pending = uc
+            elif word in RTF_CHARS:
+                out.append(RTF_CHARS[word])
+        elif symbol == b'*' and at_start:
+            skip = True  # {\* ...}: an optional destination this reader does not know
+        elif skip:
+            continue
+        elif pending:
+            if text:
+                out.append(text[pending:].decode(codepage, errors='replace'))
+                pending = max(0, pending - len(text))
+            else:
+                pending -= 1
+        elif symbol is not None:
+            out.append(RTF_SYMBOLS.get(symbol.decode('latin1'), ''))
+        elif hexbyte is not None:
+            out.append(bytes([int(hexbyte, 16)]).decode(codepage, errors='replace'))
+        else:
+            out.append(text.decode(codepage, errors='replace'))
+    return ''.join(out)
+
+
+def rtf_records(source, name=None):
+    """Typed records for an RTF document (often saved as .doc): text only, no changes or comments.
+
+    Returns the fields of docx_records() with 'type': 'docx' and
+    'format': 'rtf'.
+    """
+    name = name or Path(source).name
+    try:
+        data = source.read() if hasattr(source, 'read') else Path(source).read_bytes()
+        builder = _DocumentBuilder([])
+        for line in rtf_text(data).split('\n'):
+            builder.add_text(line, None)
+            builder.end_paragraph()
+    except Exception as exc:
+        return {'type': 'docx', 'format': 'rtf', 'file': name, 'error': str(exc)}
+    return {
+        'type': 'docx',
+        'format': 'rtf',
+        'file': name,
+        'paragraphs': builder.paragraphs,
+        'insertions': [],
+        'deletions': [],
+        'comments': [],
+    }
+
+
+# --- Embedded OLE objects ---------------------------------------------------------
+
+
+def parse_ole10_native(data):
+    """(file name, payload) from an \\x01Ole10Native stream, or (None, None).
+
+    Packager layout: u32 size, u16 flags, label\\0, source path\\0, u32,
+    u32 temp path length, temp path\\0, u32 payload size, payload, then
+    optionally the temp path, label and source path again in UTF-16.
+    """
+    try:
+        pos = 4 + 2
+        end = data.index(b"\x00", pos)
+        label = data[pos:end].decode("latin1", errors="ignore")
+        pos = end + 1
+        end = data.index(b"\x00", pos)
+        source = data[pos:end].decode("latin1", errors="ignore")
+        pos = end + 1 + 4
+        temp_len = struct.unpack_from("<I", data, pos)[0]
+        pos += 4 + temp_len
+        size = struct.unpack_from("<I", data, pos)[0]
+        pos += 4
+        filedata = data[pos:pos + size]
+        if len(filedata) != size:
+            return None, None
+        pos += size
+        try:
+            unicode_names = []
+            for _ in range(3):
+                cch = struct.unpack_from("<I", data, pos)[0]
+                unicode_names.append(data[pos + 4:pos + 4 + 2 * cch].decode("utf-16-le"))
+                pos += 4 + 2 * cch
+            label = unicode_names[1] or label
+            source = unicode_names[2] or source
+        except (struct.error, UnicodeDecodeError):
+            pass  # ANSI names only
+        # Paths may be Windows paths; keep only the last component
+        filename = re.split(r"[\\/]", label or source)[-1]
+        return filename, filedata
+    except Exception:
+        return None, None
+
+
+def ole_object_file(ole, storage, base):
+    """(name, bytes) for the file an OLE object holds, or None.
+
+    `storage` is the object's storage path ([] for the root). Packager
+    objects give the packaged file, Office 2007+ objects their .xlsx or
+    .docx package, and Excel 97 objects their Workbook stream, named
+    `base`.xls.
+    """
+    def path(stream):
+        return '/'.join([*storage, stream])
+
+    if ole.exists(path('\x01Ole10Native')):
+        name, data = parse_ole10_native(ole.openstream(path('\x01Ole10Native')).read())
+        return (name or f"{base}.bin", data) if data else None
+    if ole.exists(path('Package')):
+        data = ole.openstream(path('Package')).read()
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as z:
+                names = set(z.namelist())
+        except zipfile.BadZipFile:
+            return None
+        suffix = '.xlsx' if 'xl/workbook.xml' in names else '.docx' if 'word/document.xml' in names else '.zip'
+        return f"{base}{suffix}", data
+    if ole.exists(path('Workbook')):
+        return f"{base}.xls", ole.openstream(path('Workbook')).read()
+    return None
+
+
+def doc_embedded_objects(source):
+    """(name, bytes) for each file embedded in a Word 97-2003 document (its ObjectPool)."""
+    objects = []
+    try:
+        with olefile.OleFileIO(source) as ole:
+            for entry in ole.listdir(streams=False, storages=True):
+                if len(entry) != 2 or entry[0] != 'ObjectPool':
+                    continue
+                try:
+                    found = ole_object_file(ole, entry, entry[1].lstrip('_'))
+                except Exception:
+                    continue
+                if found:
+                    objects.append(found)
+    except Exception:
+        return objects
+    return objects
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the records of a .doc or .xls file as JSON.')
+    parser.add_argument('path', help='Word or Excel 97-2003 file')
+    parser.add_argument('--max-rows', type=int, default=40, help='Rows to read per sheet (default: %(default)s)')
+    args = parser.parse_args()
+
+    path = Path(args.path)
+    if not path.is_file():
+        print(f"ERROR: {path} not found", file=sys.stderr)
+        sys.exit(1)
+    if path.suffix.lower() == '.xls':
+        records = xls_records(path, args.max_rows)
+    else:
+        records = doc_records(path)
+    print(json.dumps(records, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Submission manifest: one indexed SQLite table of every submitted file.
+
+A scan walks the submissions folder once and records each file's size,
+content hash, type, writer, Canvas assignment and submission IDs, late
+flag, round (a `round<N>` folder) and section (any other folder). The
+latest version of each file (highest submission ID for the same writer
+and original file name, per section and round; report.docx and
+report-1.docx are the same file, see submission_names.version_name) is
+flagged, so step 1b of the workflow is a query instead of a directory
+listing. Files whose names do not follow the Canvas convention
+(corpus.json, notes) are not submissions and are left out.
+
+Pipeline stages record their progress in the same database: a stage is
+done for a file at a given content hash, so a resubmitted or edited file
+becomes pending again. Rescans only hash files whose size or mtime
+changed.
+
+Usage:
+    python manifest.py scan [--root submissions]
+    python manifest.py status
+    python manifest.py pending extract|render|review [--round N] [--section S] [--writers]
+    python manifest.py writers [--round N] [--section S]
+    python manifest.py mark STAGE PATH... [--failed] [--detail TEXT]
+    python manifest.py mark review --writer USERNAME [--round N] [--section S]
+
+All commands take --db (default: wmf-manifest.sqlite in the current folder).
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from submission_names import parse_submission_name, version_name
+
+DEFAULT_DB = 'wmf-manifest.sqlite'
+
+KINDS = {
+    '.docx': 'document', '.doc': 'document',
+    '.pdf': 'pdf',
+    '.xlsx': 'workbook', '.xlsm': 'workbook', '.xls': 'workbook',
+    '.py': 'code', '.r': 'code', '.rmd': 'code', '.do': 'code', '.ipynb': 'code',
+}
+
+# File kinds each stage applies to
+STAGES = {
+    'extract': ('document', 'pdf', 'workbook'),
+    'render': ('workbook',),
+    'review': ('document', 'pdf', 'workbook', 'code', 'other'),
+}
+# Stages that read only some formats of their kinds: render_xlsx.py renders
+# .xlsx only, and extraction does not read .xlsm. Other files of those kinds
+# are never pending for the stage.
+STAGE_SUFFIXES = {
+    'extract': ('.docx', '.doc', '.pdf', '.xlsx', '.xls'),
+    'render': ('.xlsx',),
+}
+
+ROUND_RE = re.compile(r'round[_ -]?(\d+)', re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,      -- absolute path
+    rel TEXT NOT NULL,          -- path relative to the scanned root
+    name TEXT NOT NULL,
+    section TEXT NOT NULL,      -- '' outside section folders
+    round INTEGER NOT NULL,     -- 0 outside round folders
+    writer TEXT NOT NULL,
+    assignment INTEGER,
+    submission INTEGER NOT NULL,
+    original TEXT NOT NULL,
+    late INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    latest INTEGER NOT NULL DEFAULT 0,
+    scanned INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_writer ON files (section, round, writer, original);
+CREATE INDEX IF NOT EXISTS files_latest ON files (latest, kind);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+CREATE TABLE IF NOT EXISTS stages (
+    path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,       -- done or failed
+    hash TEXT NOT NULL,         -- file hash the status applies to
+    detail TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (path, stage)
+);
+CREATE INDEX IF NOT EXISTS stages_stage ON stages (stage, status);
+"""
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_kind(name):
+    if 'turnitin' in name.lower():
+        return 'turnitin'
+    return KINDS.get(Path(name).suffix.lower(), 'other')
+
+
+def _location(rel):
+    """(section, round) from the folders of a path relative to the root."""
+    section = []
+    round_number = 0
+    for part in Path(rel).parts[:-1]:
+        match = ROUND_RE.fullmatch(part)
+        if match:
+            round_number = int(match.group(1))
+        else:
+            section.append(part)
+    return '/'.join(section), round_number
+
+
+class Manifest:
+    """The manifest database. Use as a context manager, or call close()."""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db = sqlite3.connect(str(db_path))
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def root(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        return Path(row['value']) if row else None
+
+    def scan(self, root=None):
+        """Bring the manifest up to date with the files under `root`.
+
+        `root` defaults to the folder of the previous scan. Returns counts
+        of 'added', 'changed', 'unchanged', 'removed' and 'skipped' (not
+        Canvas-named) files.
+        """
+        root = Path(root or self.root or 'submissions').resolve()
+        if not root.is_dir():
+            raise FileNotFoundError(f"{root} is not a directory")
+        known = {row['path']: row for row in self.db.execute(
+            "SELECT path, size, mtime_ns, hash FROM files WHERE substr(path, 1, ?) = ?",
+            (len(str(root)) + 1, f"{root}{os.sep}"))}
+        generation = time.time_ns()
+        counts = {'added': 0, 'changed': 0, 'unchanged': 0, 'removed': 0, 'skipped': 0}
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (str(root),))
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+                for name in sorted(filenames):
+                    if name.startswith(('.', '~$')):
+                        continue
+                    parsed = parse_submission_name(name)
+                    if parsed is None:
+                        counts['skipped'] += 1
+                        continue
+                    path = Path(dirpath) / name
+                    stat = path.stat()
+                    row = known.get(str(path))
+                    if row and row['size'] == stat.st_size and row['mtime_ns'] == stat.st_mtime_ns:
+                        self.db.execute("UPDATE files SET scanned = ? WHERE path = ?", (generation, str(path)))
+                        counts['unchanged'] += 1
+                        continue
+                    counts['changed' if row else 'added'] += 1
+                    rel = path.relative_to(root).as_posix()
+                    section, round_number = _location(rel)
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO files (path, rel, name, section, round, writer, assignment, "
+                        "submission, original, late, kind, size, mtime_ns, hash, scanned) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (str(path), rel, name, section, round_number, parsed.writer, parsed.assignment,
+                         parsed.submission, parsed.original, int(parsed.late),
+                         file_kind(name), stat.st_size, stat.st_mtime_ns, file_hash(path), generation))
+            removed = self.db.execute(
+                "DELETE FROM files WHERE substr(path, 1, ?) = ? AND scanned != ?",
+                (len(str(root)) + 1, f"{root}{os.sep}", generation))
+            counts['removed'] = removed.rowcount
+            self.db.execute("DELETE FROM stages WHERE path NOT IN (SELECT path FROM files)")
+            self._flag_latest()
+        return counts
+
+    def _flag_latest(self):
+        """Flag the highest submission of each (section, round, writer, version_name(original))."""
+        best = {}
+        for row in self.db.execute("SELECT path, section, round, writer, original, submission FROM files"):
+            key = (row['section'], row['round'], row['writer'], version_name(row['original']))
+            if key not in best or row['submission'] > best[key][0]:
+                best[key] = (row['submission'], row['path'])
+        self.db.execute("UPDATE files SET latest = 0")
+        self.db.executemany("UPDATE files SET latest = 1 WHERE path = ?", [(path,) for _sub, path in best.values()])
+
+    def _where(self, round_number=None, section=None, writer=None, latest=True, prefix='f.'):
+        clauses, params = [], []
+        if latest:
+            clauses.append(f"{prefix}latest = 1")
+        for column, value in (('round', round_number), ('section', section), ('writer', writer)):
+            if value is not None:
+                clauses.append(f"{prefix}{column} = ?")
+                params.append(value)
+        return clauses, params
+
+    @staticmethod
+    def _applies(stage):
+        """(clauses, params) selecting the files `stage` processes."""
+        kinds = STAGES[stage]
+        clauses, params = [f"f.kind IN ({', '.join('?' * len(kinds))})"], list(kinds)
+        suffixes = STAGE_SUFFIXES.get(stage)
+        if suffixes:
+            clauses.append(f"({' OR '.join(['lower(f.name) LIKE ?'] * len(suffixes))})")
+            params.extend(f"%{suffix}" for suffix in suffixes)
+        return clauses, params
+
+    def files(self, round_number=None, section=None, writer=None, latest=True, stage=None):
+        """File rows (sqlite3.Row), latest versions only unless `latest` is False.
+
+        With `stage`, only the files that stage processes.
+        """
+        clauses, params = self._where(round_number, section, writer, latest)
+        if stage:
+            stage_clauses, stage_params = self._applies(stage)
+            clauses += stage_clauses
+            params += stage_params
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return self.db.execute(
+            f"SELECT f.* FROM files f {where} ORDER BY f.section, f.round, f.writer, f.name", params).fetchall()
+
+    def pending(self, stage, round_number=None, section=None):
+        """Latest files the stage applies to that are not done at their current hash."""
+        clauses, params = self._where(round_number, section)
+        stage_clauses, stage_params = self._applies(stage)
+        clauses += stage_clauses
+        params = [stage] + params + stage_params
+        return self.db.execute(
+            "SELECT f.* FROM files f LEFT JOIN stages s ON s.path = f.path AND s.stage = ? "
+            f"WHERE {' AND '.join(clauses)} AND (s.status IS NULL OR s.status != 'done' OR s.hash != f.hash) "
+            "ORDER BY f.section, f.round, f.writer, f.name", params).fetchall()
+
+    def mark(self, paths, stage, status='done', detail=None):
+        """Record a stage outcome for files; returns how many were known to the manifest."""
+        now = time.time()
+        marked = 0
+        with self.db:
+            for path in paths:
+                row = self.db.execute("SELECT path, hash FROM files WHERE path = ?",
+                                      (str(Path(path).resolve()),)).fetchone()
+                if row is None:
+                    continue
+                self.db.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)",
+                                (row['path'], stage, status, row['hash'], detail, now))
+                marked += 1
+        return marked
+
+    def mark_writer(self, writer, stage, status='done', round_number=None, section=None, detail=None):
+        """Record a stage outcome for all of a writer's latest files the stage applies to."""
+        rows = self.files(round_number, section, writer, stage=stage)
+        return self.mark([row['path'] for row in rows], stage, status, detail)
+
+    def status(self):
+        """Per (section, round): writers, latest files, and done/failed/pending counts per stage."""
+        groups = {}
+        for row in self.db.execute(
+                "SELECT section, round, COUNT(DISTINCT writer) AS writers, COUNT(*) AS files, SUM(late) AS late "
+                "FROM files WHERE latest = 1 AND kind != 'turnitin' GROUP BY section, round ORDER BY section, round"):
+            groups[(row['section'], row['round'])] = {**dict(row), 'stages': {}}
+        for stage in STAGES:
+            clauses, params = self._applies(stage)
+            for row in self.db.execute(
+                    "SELECT f.section, f.round, COUNT(*) AS total, "
+                    "SUM(s.status = 'done' AND s.hash = f.hash) AS done, "
+                    "SUM(s.status = 'failed' AND s.hash = f.hash) AS failed "
+                    "FROM files f LEFT JOIN stages s ON s.path = f.path AND s.stage = ? "
+                    f"WHERE f.latest = 1 AND {' AND '.join(clauses)} "
+                    "GROUP BY f.section, f.round", [stage, *params]):
+                done, failed = row['done'] or 0, row['failed'] or 0
+                groups[(row['section'], row['round'])]['stages'][stage] = {
+                    'done': done, 'failed': failed, 'pending': row['total'] - done}
+        return list(groups.values())
+
+
+def open_manifest(db_path, root=None):
+    """Open and rescan a manifest for a pipeline stage.
+
+    The rescan only hashes new or modified files, so it is cheap enough
+    to run at the start of every stage.
+    """
+    manifest = Manifest(db_path)
+    manifest.scan(root if manifest.root is None else None)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Submission manifest (SQLite).')
+    parser.add_argument('--db', default=DEFAULT_DB, help='Manifest database (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help='Scan the submissions folder')
+    scan.add_argument('--root', help='Submissions folder (default: the previous scan\'s, else submissions)')
+
+    commands.add_parser('status', help='Counts per section and round, with stage progress')
+
+    def add_filters(sub):
+        sub.add_argument('--round', type=int, dest='round_number')
+        sub.add_argument('--section')
+
+    pending = commands.add_parser('pending', help='Latest files a stage still has to process')
+    pending.add_argument('stage', choices=sorted(STAGES))
+    pending.add_argument('--writers', action='store_true', help='List writers instead of files')
+    add_filters(pending)
+
+    writers = commands.add_parser('writers', help='Writers and the latest version of each of their files')
+    add_filters(writers)
+
+    mark = commands.add_parser('mark', help='Record that a stage finished for files or a writer')
+    mark.add_argument('stage', choices=sorted(STAGES))
+    mark.add_argument('paths', nargs='*')
+    mark.add_argument('--writer')
+    mark.add_argument('--failed', action='store_true')
+    mark.add_argument('--detail')
+    add_filters(mark)
+    args = parser.parse_args()
+
+    with Manifest(args.db) as manifest:
+        if args.command == 'scan':
+            start = time.monotonic()
+            try:
+                counts = manifest.scan(args.root)
+            except FileNotFoundError as exc:
+                print(f"ERROR: {exc}", file=sys.stderr)
+                sys.exit(1)
+            print(f"{manifest.root}: {counts['added']} added, {counts['changed']} changed, "
+                  f"{counts['unchanged']} unchanged, {counts['removed']} removed, "
+                  f"{counts['skipped']} skipped (not Canvas-named) "
+                  f"in {time.monotonic() - start:.2f}s")
+        elif args.command == 'status':
+            for group in manifest.status():
+                where = ' / '.join(filter(None, [group['section'], f"round {group['round']}" if group['round'] else '']))
+                print(f"{where or '(all)'}: {group['writers']} writers, {group['files']} files"
+                      + (f", {group['late']} late" if group['late'] else ''))
+                for stage, counts in group['stages'].items():
+                    print(f"  {stage:<8} {counts['done']} done, {counts['pending']} pending"
+                          + (f" ({counts['failed']} failed)" if counts['failed'] else ''))
+        elif args.command == 'pending':
+            rows = manifest.pending(args.stage, args.round_number, args.section)
+            if args.writers:
+                for writer in dict.fromkeys(row['writer'] for row in rows):
+                    print(writer)
+            else:
+                for row in rows:
+                    print(row['path'])
+        elif args.command == 'writers':
+            current = None
+            for row in manifest.files(args.round_number, args.section):
+                if row['writer'] != current:
+                    current = row['writer']
+                    print(current)
+                print(f"  {row['rel']}" + (' (late)' if row['late'] else ''))
+        elif args.command == 'mark':
+            status = 'failed' if args.failed else 'done'
+            if args.writer:
+                marked = manifest.mark_writer(args.writer, args.stage, status, args.round_number,
+                                              args.section, args.detail)
+            else:
+                marked = manifest.mark(args.paths, args.stage, status, args.detail)
+            print(f"Marked {marked} file(s) {status} for {args.stage}")
+            if not marked:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
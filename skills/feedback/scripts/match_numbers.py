@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Check numbers quoted in a writer's document against their workbooks.
+
+Every numeric claim in the DOCX/DOC/PDF text ("grew 3.4%", "$2.1 million",
+"1,250 households") is parsed with its percent sign, scale word and
+currency, and looked up among every numeric cell (values and cached
+formula results) of the writer's workbooks, including workbooks embedded
+in the document. Cell values are kept in one sorted list, so each lookup
+is a bisection.
+
+Each claim is reported as
+- matched: a cell rounds to the number as written. "3.4%" matches 0.034
+  or 3.4; "2.1 million" matches 2100000 or 2.1 (a table in millions)
+- near: a cell is within the tolerance but rounds differently (0.0347
+  for "3.4%"), or matches after a factor of 1,000, 1e6 or 1e9 (3200 for
+  "3.2 million")
+- unmatched: neither; the nearest cell is shown
+
+Bare years (1800-2100), integers below 10 and numbers after "Figure",
+"Table", "page" and similar are not treated as claims.
+
+Files are grouped by writer using the Canvas naming convention (see
+submission_names.py); only the final version of each file is used.
+
+Usage:
+    python match_numbers.py --input submissions/ [--out report.json] [--tolerance 0.02]
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import zipfile
+
+from extract_submission_text import S_C, S_ROW, S_V, docx_records, embedded_objects, pdf_records
+from legacy_office import doc_embedded_objects, doc_records, rtf_records, sniff_format, xls_records
+from ooxml import cell_id, workbook_sheets
+from submission_names import group_by_writer
+
+DOCUMENT_SUFFIXES = {'.docx', '.doc', '.pdf'}
+WORKBOOK_SUFFIXES = {'.xlsx', '.xlsm', '.xls'}
+
+CLAIM_RE = re.compile(
+    r"""(?<![\w.,/$€£¥-])
+        (?P<sign>[-−+])?
+        (?P<currency>[$€£¥])?
+        (?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)
+        (?:
+            (?P<letter>[kKmMbB]|bn|mn)\b
+          | \s?(?P<word>%|percentage\ points?|per\ ?cent|pp|p\.p\.|bps|basis\ points?
+                |thousand|million|billion|trillion)(?![A-Za-z])
+        )?
+        (?![A-Za-z0-9]|[-/.,:]\d)""",
+    re.VERBOSE | re.IGNORECASE,
+)
+UNIT_RE = re.compile(
+    r"\s*(dollars|usd|euros?|eur|pounds|gbp|yen|jpy|tons?|tonnes?|kg|km|people|persons|workers|households|firms)\b",
+    re.IGNORECASE,
+)
+# A number that labels something rather than quoting a value
+LABEL_RE = re.compile(
+    r"(?:\bfig(?:ure)?s?\.?|\btables?|\bpages?|\bpp?\.|\bsections?|\bchapters?|\bappendix|\beq(?:uation)?s?\.?"
+    r"|\bno\.|\bsteps?|\bquestions?|\bpart|\bcolumns?|\brows?|\bweek|\bmodel)\s*\(?$",
+    re.IGNORECASE,
+)
+
+SCALES = {
+    'k': 1e3, 'thousand': 1e3,
+    'm': 1e6, 'mn': 1e6, 'million': 1e6,
+    'b': 1e9, 'bn': 1e9, 'billion': 1e9,
+    'trillion': 1e12,
+}
+# Factors a number is commonly off by when a sheet is kept in other units
+SCALE_FACTORS = (1e3, 1e-3, 1e6, 1e-6, 1e9, 1e-9)
+CONTEXT_CHARS = 40
+
+
+def parse_claims(text):
+    """Numeric claims in a block of text.
+
+    Each claim is {'text', 'start', 'value', 'decimals', 'percent',
+    'scale', 'unit'}: `value` is the number as written with its sign,
+    `decimals` the digits shown after the point, `percent` 0.01 for
+    percentages and percentage points, 1e-4 for basis points and None
+    otherwise, and `scale` the multiplier of a scale word (1 when absent).
+    """
+    claims = []
+    for match in CLAIM_RE.finditer(text):
+        number = match.group('number')
+        suffix = (match.group('letter') or match.group('word') or '').lower()
+        currency = match.group('currency')
+        decimals = len(number.partition('.')[2])
+        value = float(number.replace(',', ''))
+        percent = None
+        scale = 1.0
+        if suffix in SCALES:
+            scale = SCALES[suffix]
+        elif suffix.startswith(('bps', 'basis')):
+            percent = 1e-4
+        elif suffix:
+            percent = 1e-2
+        if not (suffix or currency or decimals or ',' in number):
+            if value < 10 or 1800 <= value <= 2100:
+                continue
+        if LABEL_RE.search(text, max(0, match.start() - 16), match.start()):
+            continue
+        unit = UNIT_RE.match(text, match.end())
+        if match.group('sign') in ('-', '−'):
+            value = -value
+        claims.append({
+            'text': match.group(0).strip(),
+            'start': match.start(),
+            'value': value,
+            'decimals': decimals,
+            'percent': percent,
+            'scale': scale,
+            'unit': currency or (unit.group(1).lower() if unit else None),
+        })
+    return claims
+
+
+class NumberIndex:
+    """Numeric cells sorted by magnitude, for tolerance lookups by bisection."""
+
+    def __init__(self, numbers):
+        """`numbers` is a list of (value, workbook label or None, sheet, ref)."""
+        self.entries = sorted(numbers, key=lambda entry: abs(entry[0]))
+        self.keys = [abs(entry[0]) for entry in self.entries]
+
+    def cell(self, i):
+        _value, label, sheet, ref = self.entries[i]
+        return f"{label}:{cell_id(sheet, ref)}" if label else cell_id(sheet, ref)
+
+    def value(self, i):
+        return self.entries[i][0]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def within(self, lo, hi):
+        """Indexes of cells whose magnitude lies in [lo, hi]."""
+        return range(bisect_left(self.keys, lo), bisect_right(self.keys, hi))
+
+    def nearest(self, target):
+        """Index of the cell whose magnitude is closest to `target`, or None."""
+        i = bisect_left(self.keys, target)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.keys)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda j: abs(self.keys[j] - target))
+
+
+def readings(claim):
+    """(magnitude, rounding half-width, label) for each way a cell may hold the claim."""
+    size = abs(claim['value'])
+    half = 0.5 * 10 ** -claim['decimals']
+    if claim['percent']:
+        return [(size * claim['percent'], half * claim['percent'], 'fraction'), (size, half, 'as written')]
+    if claim['scale'] != 1:
+        return [(size * claim['scale'], half * claim['scale'], 'as written'), (size, half, 'unscaled')]
+    return [(size, half, 'as written')]
+
+
+def match_claim(claim, index, tolerance):
+    """{'status', 'reason', 'cell', 'cell_value', 'also'} for one claim."""
+    base = readings(claim)
+
+    def found(status, reason, hits):
+        first = hits[0]
+        return {'status': status, 'reason': reason, 'cell': index.cell(first),
+                'cell_value': index.value(first), 'also': len(hits) - 1}
+
+    for size, half, label in base:
+        hits = index.within(size - half - 1e-12 * size, size + half + 1e-12 * size)
+        if len(hits):
+            return found('matched', label, hits)
+
+    best = None
+    for size, half, _label in base:
+        nearest = index.nearest(size)
+        if nearest is not None and size and abs(index.keys[nearest] - size) <= max(tolerance * size, half):
+            off = abs(index.keys[nearest] - size) / size
+            if best is None or off < best[0]:
+                best = (off, nearest)
+    if best:
+        off, nearest = best
+        return found('near', f"rounding ({off:.1%} off)", [nearest])
+
+    size, half, _label = base[0]
+    if not claim['percent']:  # a percent's factor of 100 is already one of its readings
+        for factor in SCALE_FACTORS:
+            hits = index.within((size - half) * factor, (size + half) * factor)
+            if len(hits):
+                return found('near', f"scale x{factor:g}", hits)
+
+    nearest = index.nearest(size)
+    return {'status': 'unmatched', 'reason': None,
+            'cell': index.cell(nearest) if nearest is not None else None,
+            'cell_value': index.value(nearest) if nearest is not None else None, 'also': 0}
+
+
+def workbook_numbers(source, label=None):
+    """(number, label, sheet, ref) for every numeric cell of a workbook, cached formula results included.
+
+    Only <c> and <v> are looked at, so this is a much lighter pass than
+    iter_sheet_rows: text cells are skipped without resolving shared strings.
+    """
+    numbers = []
+    with zipfile.ZipFile(source) as z:
+        for sheet_name, part in workbook_sheets(z):
+            with z.open(part) as f:
+                for _event, elem in ET.iterparse(f):
+                    if elem.tag == S_C:
+                        if elem.get('t', 'n') == 'n':
+                            v = elem.find(S_V)
+                            if v is not None and v.text:
+                                try:
+                                    numbers.append((float(v.text), label, sheet_name, elem.get('r')))
+                                except ValueError:
+                                    pass
+                    elif elem.tag == S_ROW:
+                        elem.clear()
+    return numbers
+
+
+def xls_numbers(source, label=None):
+    """workbook_numbers() for an Excel 97-2003 workbook (path, or bare stream as Word embeds it)."""
+    records = xls_records(source, max_rows=sys.maxsize)
+    if 'error' in records:
+        raise ValueError(records['error'])
+    return [(float(cell['value']), label, cell['sheet'], cell['ref'])
+            for cell in records['cells'] if cell['type'] == 'n']
+
+
+def legacy_format(path):
+    """sniff_format() for a .doc or .xls path, None for anything else (see extract_records)."""
+    if isinstance(path, Path) and path.suffix.lower() in ('.doc', '.xls'):
+        return sniff_format(path)
+    return None
+
+
+def document_passages(path):
+    """(location id, text) for each paragraph of a DOCX or DOC, or page of a PDF."""
+    if path.suffix.lower() in ('.docx', '.doc'):
+        actual = legacy_format(path)
+        if path.suffix.lower() == '.docx' or actual == 'zip':
+            records = docx_records(path)
+        elif actual == 'rtf':
+            records = rtf_records(path)
+        else:
+            records = doc_records(path)
+        key = 'paragraphs'
+    else:
+        records = pdf_records(path)
+        key = 'pages'
+    if 'error' in records and not records.get(key):
+        raise ValueError(records['error'])
+    return [(item['id'], item['text']) for item in records[key]]
+
+
+def check_writer(writer, paths, tolerance=0.02):
+    """Match every claim in a writer's documents against their workbooks."""
+    documents = [p for p in paths if p.suffix.lower() in DOCUMENT_SUFFIXES]
+    workbooks = [p for p in paths if p.suffix.lower() in WORKBOOK_SUFFIXES]
+    report = {'writer': writer, 'documents': [p.name for p in documents],
+              'workbooks': [p.name for p in workbooks], 'cells': 0, 'claims': [], 'errors': []}
+
+    numbers = []
+    for path in documents:
+        suffix, actual = path.suffix.lower(), legacy_format(path)
+        if suffix == '.docx' or actual == 'zip':
+            objects = embedded_objects(path)
+        elif suffix == '.doc' and actual == 'ole':
+            objects = doc_embedded_objects(path)
+        else:
+            continue
+        for name, data in objects:
+            if Path(name).suffix.lower() in WORKBOOK_SUFFIXES:
+                workbooks.append(io.BytesIO(data))
+                report['workbooks'].append(f"{path.name}/{name}")
+    for source, name in zip(workbooks, report['workbooks']):
+        label = name if len(workbooks) > 1 else None
+        try:
+            if name.lower().endswith('.xls') and legacy_format(source) != 'zip':
+                numbers.extend(xls_numbers(source, label))
+            else:
+                numbers.extend(workbook_numbers(source, label))
+        except Exception as exc:
+            report['errors'].append(f"{name}: {exc}")
+    if not documents or not numbers:
+        return report
+
+    index = NumberIndex(numbers)
+    report['cells'] = len(index)
+    for path in documents:
+        try:
+            passages = document_passages(path)
+        except Exception as exc:
+            report['errors'].append(f"{path.name}: {exc}")
+            continue
+        for location, text in passages:
+            for claim in parse_claims(text):
+                start = claim.pop('start')
+                context = text[max(0, start - CONTEXT_CHARS):start + len(claim['text']) + CONTEXT_CHARS]
+                report['claims'].append({
+                    'file': path.name, 'location': location, **claim,
+                    **match_claim(claim, index, tolerance),
+                    'context': ' '.join(context.split()),
+                })
+    return report
+
+
+def _check_job(writer, paths, tolerance):
+    """Worker entry point. Never raises, so one bad writer cannot stop a batch."""
+    try:
+        return check_writer(writer, paths, tolerance)
+    except Exception as exc:
+        return {'writer': writer, 'documents': [], 'workbooks': [], 'cells': 0, 'claims': [],
+                'errors': [f"{type(exc).__name__}: {exc}"]}
+
+
+def check_all(groups, tolerance=0.02, jobs=1):
+    """Reports for {writer: [paths]}, in writer order."""
+    if jobs <= 1 or len(groups) <= 1:
+        return [_check_job(writer, paths, tolerance) for writer, paths in groups.items()]
+    reports = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(_check_job, writer, paths, tolerance): writer for writer, paths in groups.items()}
+        for future in as_completed(futures):
+            reports[futures[future]] = future.result()
+    return [reports[writer] for writer in groups]
+
+
+def format_report(report, show_matched=False):
+    counts = {status: 0 for status in ('matched', 'near', 'unmatched')}
+    for claim in report['claims']:
+        counts[claim['status']] += 1
+    out = [
+        f"{report['writer']}: {len(report['claims'])} claims - {counts['matched']} matched, "
+        f"{counts['near']} near, {counts['unmatched']} unmatched "
+        f"({', '.join(report['documents']) or 'no document'} vs {report['cells']:,} numeric cells in "
+        f"{', '.join(report['workbooks']) or 'no workbook'})"
+    ]
+    for error in report['errors']:
+        out.append(f"  ERROR: {error}")
+    order = {'near': 0, 'unmatched': 1, 'matched': 2}
+    for claim in sorted(report['claims'], key=lambda c: order[c['status']]):
+        if claim['status'] == 'matched' and not show_matched:
+            continue
+        where = f"{claim['file']}#{claim['location']}"
+        if claim['cell'] is None:
+            found = "no numeric cells"
+        else:
+            found = f"{claim['cell']} = {claim['cell_value']:g}"
+            if claim['also']:
+                found += f" (+{claim['also']} more)"
+        if claim['status'] == 'unmatched':
+            found = f"nearest {found}"
+        elif claim['reason']:
+            found = f"{claim['reason']}: {found}"
+        out.append(f"  {claim['status'].upper():<9} {where}  \"{claim['text']}\"  {found}")
+        out.append(f"            ...{claim['context']}...")
+    return "\n".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Match numbers quoted in documents against the same writer\'s workbooks.')
+    parser.add_argument('--input', required=True, help='Submissions directory, or a single writer\'s files')
+    parser.add_argument('--out', help='Write the full report as JSON to this path')
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='Relative difference still reported as a near miss (default: %(default)s)')
+    parser.add_argument('--matched', action='store_true', help='List matched claims too')
+    parser.add_argument('--all-versions', action='store_true',
+                        help='Use every submitted version, not only the final one')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    in_path = Path(args.input)
+    if not in_path.exists():
+        print(f"ERROR: {in_path} not found", file=sys.stderr)
+        sys.exit(1)
+    suffixes = DOCUMENT_SUFFIXES | WORKBOOK_SUFFIXES
+    paths = [p for p in sorted(in_path.iterdir()) if p.suffix.lower() in suffixes] if in_path.is_dir() else [in_path]
+    groups = group_by_writer(paths, final_only=not args.all_versions)
+
+    start = time.monotonic()
+    reports = check_all(groups, args.tolerance, args.jobs)
+    claims = sum(len(report['claims']) for report in reports)
+    print(f"Checked {claims:,} claims for {len(reports)} writers in {time.monotonic() - start:.1f}s", file=sys.stderr)
+
+    print("\n\n".join(format_report(report, args.matched) for report in reports if report['claims'] or report['errors']))
+    if args.out:
+        Path(args.out).write_text(json.dumps(reports, indent=2, ensure_ascii=False), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Per-file, per-stage metrics for the extraction and render scripts.
+
+While a file is being recorded (recording()), code marks its stages with
+`with stage('docx'):` and runs external tools through run(), which times
+the tool as its own stage (pdftotext, pdftoppm, tesseract, soffice).
+Stages nest: each reports its own time, excluding inner stages, so the
+stages of a file add up to its total. Stages run in other threads (OCR
+pages) are attached to the file with bind() and overlap in wall time.
+
+For every stage the record holds:
+- wall and CPU seconds (CPU of the calling thread)
+- the child CPU and peak RSS of tools it ran (exact per process on
+  POSIX, via wait4)
+- bytes read and written by this process (Linux only)
+
+For every file it also holds the peak RSS of the worker while that file
+was processed (Linux; elsewhere, the worker's peak so far).
+
+Records are plain dicts. MetricsLog appends them to a JSONL file and
+prints an end-of-run table of where the time went, by stage. When
+nothing is being recorded, stage() and run() cost next to nothing.
+
+profile_call() runs one call under cProfile (or pyinstrument, if
+installed) for a closer look at a single file.
+
+Usage:
+    python extract_submission_text.py --input submissions --out feedback_extracted --metrics metrics.jsonl
+    python metrics.py metrics.jsonl            # summary table of a saved run
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_local = threading.local()
+_PROC_IO = Path('/proc/self/io')
+_PROC_STATUS = Path('/proc/self/status')
+_CLEAR_REFS = Path('/proc/self/clear_refs')
+
+
+def _io_bytes():
+    """(bytes read, bytes written) by this process so far, or (0, 0) where unavailable."""
+    try:
+        fields = dict(line.split(':') for line in _PROC_IO.read_text().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, ValueError, KeyError):
+        return 0, 0
+
+
+def _reset_peak_rss():
+    try:
+        _CLEAR_REFS.write_text('5')  # Linux: reset VmHWM to the current RSS
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(reset_worked):
+    if reset_worked:
+        try:
+            for line in _PROC_STATUS.read_text().splitlines():
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+        except (OSError, ValueError):
+            pass
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class FileRecord:
+    """Stage totals for one file. Safe to update from several threads."""
+
+    FIELDS = ('wall', 'cpu', 'child_wall', 'child_cpu', 'read_bytes', 'write_bytes')
+
+    def __init__(self, file):
+        self.file = str(file)
+        self.stages = {}
+        self.peak_rss_mb = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, calls=1, child_peak_rss_mb=0.0, **values):
+        with self._lock:
+            entry = self.stages.setdefault(name, dict.fromkeys(self.FIELDS, 0.0) | {'calls': 0,
+                                                                               'child_peak_rss_mb': 0.0})
+            entry['calls'] += calls
+            entry['child_peak_rss_mb'] = max(entry['child_peak_rss_mb'], child_peak_rss_mb)
+            for key, value in values.items():
+                entry[key] += value
+
+    def merge(self, other, share=1.0):
+        """Add another record's stages, scaled by `share` (a batch split across its files)."""
+        for name, entry in other.stages.items():
+            self.add(name, calls=entry['calls'], child_peak_rss_mb=entry['child_peak_rss_mb'],
+                     **{key: entry[key] * share for key in self.FIELDS})
+
+
+def current():
+    """The FileRecord being recorded in this thread, or None."""
+    return getattr(_local, 'record', None)
+
+
+@contextmanager
+def bind(record):
+    """Record this thread's stages into `record` (e.g. in a pool thread working on the file)."""
+    saved = getattr(_local, 'record', None), getattr(_local, 'stack', None)
+    _local.record, _local.stack = record, []
+    try:
+        yield record
+    finally:
+        _local.record, _local.stack = saved
+
+
+@contextmanager
+def stage(name):
+    record = getattr(_local, 'record', None)
+    if record is None:
+        yield
+        return
+    frame = {'wall': 0.0, 'cpu': 0.0, 'read_bytes': 0, 'write_bytes': 0}  # time spent in inner stages
+    _local.stack.append(frame)
+    wall0, cpu0 = time.perf_counter(), time.thread_time()
+    read0, written0 = _io_bytes()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall0, time.thread_time() - cpu0
+        read, written = _io_bytes()
+        read, written = read - read0, written - written0
+        _local.stack.pop()
+        if _local.stack:
+            parent = _local.stack[-1]
+            parent['wall'] += wall
+            parent['cpu'] += cpu
+            parent['read_bytes'] += read
+            parent['write_bytes'] += written
+        record.add(name, wall=wall - frame['wall'], cpu=cpu - frame['cpu'],
+                   read_bytes=read - frame['read_bytes'], write_bytes=written - frame['write_bytes'])
+
+
+@contextmanager
+def recording(file, into=None):
+    """Record the stages of one file; yields its FileRecord (or `into`).
+
+    Time not covered by any stage is reported as the 'other' stage.
+    """
+    record = into or FileRecord(file)
+    reset = _reset_peak_rss()
+    with bind(record):
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        read0, written0 = _io_bytes()
+        _local.stack.append({'wall': 0.0, 'cpu': 0.0, 'read_bytes': 0, 'write_bytes': 0})
+        try:
+            yield record
+        finally:
+            frame = _local.stack.pop()
+            read, written = _io_bytes()
+            record.add('other', calls=0, wall=time.perf_counter() - wall0 - frame['wall'],
+                       cpu=time.thread_time() - cpu0 - frame['cpu'],
+                       read_bytes=read - read0 - frame['read_bytes'],
+                       write_bytes=written - written0 - frame['write_bytes'])
+            record.peak_rss_mb = max(record.peak_rss_mb, _peak_rss_mb(reset))
+
+
+def as_dict(record, step, status=None, **extra):
+    """A JSON-ready line for a finished FileRecord."""
+    stages = {name: {key: round(value, 4) if isinstance(value, float) else value for key, value in entry.items()}
+              for name, entry in sorted(record.stages.items())}
+    totals = {key: round(sum(entry[key] for entry in record.stages.values()), 4) for key in FileRecord.FIELDS}
+    return {'step': step, 'file': record.file, 'status': status, **totals,
+            'peak_rss_mb': round(record.peak_rss_mb, 1),
+            'child_peak_rss_mb': round(max((e['child_peak_rss_mb'] for e in record.stages.values()), default=0), 1),
+            'stages': stages, **extra}
+
+
+def _kill(proc, group):
+    if group:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)  # and every helper it started
+            return
+        except OSError:
+            pass
+    proc.kill()
+
+
+def _reap(proc, flags=0):
+    """os.wait4 for `proc`: True and its resource usage once it has exited, (False, None) before.
+
+    Setting returncode keeps Popen from trying to reap it again.
+    """
+    try:
+        pid, status, usage = os.wait4(proc.pid, flags)
+    except ChildProcessError:  # SIGCHLD ignored: the status is gone, as Popen.wait() also assumes
+        proc.returncode = 0
+        return True, None
+    if not pid:
+        return False, None
+    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return True, usage
+
+
+def _communicate(proc, timeout, group):
+    """(stdout, stderr, rusage, timed out) for a tool: proc.communicate(), but reaped with os.wait4.
+
+    Both pipes are drained in threads until the tool closes them. After a
+    timeout the tool (with `group`, its process group) is killed, and its
+    output up to then is still returned.
+    """
+    output = {}
+
+    def drain(stream):
+        with stream:
+            output[stream] = stream.read()
+
+    readers = [threading.Thread(target=drain, args=(stream,), daemon=True) for stream in (proc.stdout, proc.stderr)]
+    for reader in readers:
+        reader.start()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    for reader in readers:
+        reader.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    timed_out = any(reader.is_alive() for reader in readers)
+    delay = 0.0005
+    while deadline is not None and not timed_out:
+        # The pipes are closed, but the tool may still be running: poll like Popen.wait(timeout)
+        done, usage = _reap(proc, os.WNOHANG)
+        if done:
+            return output[proc.stdout], output[proc.stderr], usage, False
+        timed_out = time.monotonic() >= deadline
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 0.05)
+    if timed_out:
+        _kill(proc, group)
+        for reader in readers:
+            reader.join()
+    _done, usage = _reap(proc)
+    return output[proc.stdout], output[proc.stderr], usage, timed_out
+
+
+def run(cmd, check=True, env=None, timeout=None, name=None, new_session=False):
+    """subprocess.run(capture_output=True, text=True), recorded as a stage named after the tool.
+
+    With `new_session`, the tool runs in its own session and a timeout kills
+    its whole process group, so helpers it forked (soffice.bin) go with it.
+    """
+    group = new_session and hasattr(os, 'killpg')
+    record = getattr(_local, 'record', None)
+    if record is None and not group:
+        return subprocess.run(cmd, capture_output=True, text=True, check=check, env=env, timeout=timeout)
+    name = name or Path(cmd[0]).name
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env,
+                            start_new_session=group)
+    usage = None
+    try:
+        with proc:
+            if hasattr(os, 'wait4'):
+                stdout, stderr, usage, timed_out = _communicate(proc, timeout, group)
+                if timed_out:
+                    raise subprocess.TimeoutExpired(cmd, timeout, stdout, stderr)
+            else:
+                try:
+                    stdout, stderr = proc.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    _kill(proc, group)
+                    proc.communicate()
+                    raise
+    finally:
+        if record is not None:
+            wall = time.perf_counter() - start
+            child_cpu = usage.ru_utime + usage.ru_stime if usage else 0.0
+            child_rss = (usage.ru_maxrss / (1024 * 1024) if sys.platform == 'darwin' else usage.ru_maxrss / 1024) \
+                if usage else 0.0
+            record.add(name, wall=wall, child_wall=wall, child_cpu=child_cpu, child_peak_rss_mb=child_rss)
+            if _local.stack:
+                _local.stack[-1]['wall'] += wall  # not the enclosing stage's own time
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def summary_table(lines):
+    """Where the time went, by stage, across metric lines (dicts from as_dict)."""
+    stages = {}
+    total_wall = 0.0
+    files = 0
+    peak = child_peak = 0.0
+    for line in lines:
+        files += 1
+        total_wall += line['wall']
+        peak = max(peak, line.get('peak_rss_mb', 0.0))
+        child_peak = max(child_peak, line.get('child_peak_rss_mb', 0.0))
+        for name, entry in line['stages'].items():
+            agg = stages.setdefault((line['step'], name), {'files': 0, 'calls': 0, 'walls': [], 'cpu': 0.0,
+                                                           'child_cpu': 0.0, 'read': 0, 'written': 0})
+            agg['files'] += 1
+            agg['calls'] += entry['calls']
+            agg['walls'].append(entry['wall'])
+            agg['cpu'] += entry['cpu']
+            agg['child_cpu'] += entry['child_cpu']
+            agg['read'] += entry['read_bytes']
+            agg['written'] += entry['write_bytes']
+    out = [f"{'step':<8}{'stage':<16}{'files':>6}{'calls':>7}{'wall s':>9}{'share':>7}{'p95 ms':>9}"
+           f"{'cpu s':>8}{'tool cpu':>9}{'read MB':>9}{'write MB':>9}"]
+    for (step, name), agg in sorted(stages.items(), key=lambda item: -sum(item[1]['walls'])):
+        wall = sum(agg['walls'])
+        walls = sorted(agg['walls'])
+        out.append(f"{step:<8}{name:<16}{agg['files']:>6}{agg['calls']:>7}{wall:>9.2f}"
+                   f"{(wall / total_wall if total_wall else 0):>7.0%}{_percentile(walls, 95) * 1000:>9.1f}"
+                   f"{agg['cpu']:>8.2f}{agg['child_cpu']:>9.2f}{agg['read'] / 1e6:>9.1f}{agg['written'] / 1e6:>9.1f}")
+    out.append(f"{files} files, {total_wall:.2f}s recorded; peak RSS {peak:.0f} MB per worker, "
+               f"{child_peak:.0f} MB per external tool")
+    return '\n'.join(out)
+
+
+class MetricsLog:
+    """Collects metric lines, appends them to a JSONL file, and summarizes them."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.lines = []
+        self._lock = threading.Lock()
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def add(self, line):
+        line = {'run': self.run_id, **line}
+        with self._lock:
+            self.lines.append(line)
+            if self.path:
+                with self.path.open('a', encoding='utf-8') as f:
+                    f.write(json.dumps(line) + '\n')
+
+    def summary(self):
+        return summary_table(self.lines)
+
+
+def profile_call(func, out_path, tool='cprofile', top=25):
+    """Run func() under a profiler, save the profile to out_path, and print the top entries."""
+    out_path = Path(out_path)
+    if tool == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("pyinstrument is not installed (pip install pyinstrument)")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return func()
+        finally:
+            profiler.stop()
+            out_path.write_text(profiler.output_html(), encoding='utf-8')
+            print(profiler.output_text(unicode=True, color=False), file=sys.stderr)
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(out_path)
+        pstats.Stats(str(out_path), stream=sys.stderr).sort_stats('cumulative').print_stats(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a metrics JSONL file by stage.')
+    parser.add_argument('metrics', help='JSONL written with --metrics')
+    parser.add_argument('--run', help='Only this run id (default: the last run in the file)')
+    parser.add_argument('--all-runs', action='store_true', help='Summarize every run in the file')
+    args = parser.parse_args()
+
+    lines = [json.loads(raw) for raw in Path(args.metrics).read_text(encoding='utf-8').splitlines() if raw.strip()]
+    if not lines:
+        print(f"ERROR: no metrics in {args.metrics}", file=sys.stderr)
+        sys.exit(1)
+    if not args.all_runs:
+        wanted = args.run or lines[-1]['run']
+        lines = [line for line in lines if line['run'] == wanted]
+    print(summary_table(lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Package-level helpers for Office Open XML workbooks: relationship parts,
+sheet names, and which sheets host charts.
+
+Shared by the extractor and the renderers, so it only uses the standard
+library.
+"""
+
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+
+S_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+
+
+def cell_id(sheet, ref):
+    """Qualified cell reference, quoting sheet names the way Excel does."""
+    if re.fullmatch(r'[A-Za-z_][A-Za-z0-9_.]*', sheet):
+        return f"{sheet}!{ref}"
+    return "'" + sheet.replace("'", "''") + f"'!{ref}"
+
+
+def _resolve_target(base_dir, target):
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+
+def read_rels(z, part, rel_type=None):
+    """Map relationship ids to resolved part names for a package part.
+
+    `rel_type` filters on the last segment of the relationship Type
+    (e.g. 'worksheet', 'drawing', 'chart').
+    """
+    base_dir, name = posixpath.split(part)
+    rels_name = posixpath.join(base_dir, '_rels', name + '.rels')
+    if rels_name not in z.namelist():
+        return {}
+    with z.open(rels_name) as f:
+        tree = ET.parse(f)
+    rels = {}
+    for rel in tree.iter(PKG_REL):
+        if rel.attrib.get('TargetMode') == 'External':
+            continue
+        if rel_type and rel.attrib.get('Type', '').rsplit('/', 1)[-1] != rel_type:
+            continue
+        rels[rel.attrib.get('Id')] = _resolve_target(base_dir, rel.attrib.get('Target', ''))
+    return rels
+
+
+def workbook_sheets(z, include_chartsheets=False):
+    """Return [(sheet name, sheet part)] in workbook order.
+
+    Only worksheets are returned unless `include_chartsheets` is set.
+    """
+    names = set(z.namelist())
+    if 'xl/workbook.xml' not in names:
+        return []
+    kinds = ('worksheet', 'chartsheet') if include_chartsheets else ('worksheet',)
+    rels = {}
+    for kind in kinds:
+        rels.update(read_rels(z, 'xl/workbook.xml', kind))
+    with z.open('xl/workbook.xml') as f:
+        tree = ET.parse(f)
+    sheets = []
+    for sh in tree.iter(f'{{{S_NS}}}sheet'):
+        part = rels.get(sh.attrib.get(f'{{{REL_NS}}}id'))
+        if sh.attrib.get('name') and part in names:
+            sheets.append((sh.attrib['name'], part))
+    return sheets
+
+
+def sheet_charts(z):
+    """Return {sheet name: [chart parts]} for every sheet that hosts a chart.
+
+    Follows sheet -> drawing -> chart relationships, which covers charts
+    embedded in worksheets as well as dedicated chart sheets.
+    """
+    charts = {}
+    for sheet_name, part in workbook_sheets(z, include_chartsheets=True):
+        found = []
+        for drawing in read_rels(z, part, 'drawing').values():
+            found.extend(sorted(read_rels(z, drawing, 'chart').values()))
+        if found:
+            charts[sheet_name] = found
+    return charts
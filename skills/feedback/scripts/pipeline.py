@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Run the batch stages (extract, then render) with a job journal, so an
+interrupted batch resumes where it stopped.
+
+Every finished file is recorded in the journal as it completes, and
+outputs are written through a temporary file and a rename. Rerunning the
+same command after a crash, a kill or a reboot skips everything already
+done, retries on its own whatever was running when the batch died, and
+gives up on a file that keeps taking the process down (see journal.py).
+
+Usage:
+    python pipeline.py --input submissions --extracted feedback_extracted --rendered feedback_rendered
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from journal import DEFAULT_MAX_ATTEMPTS, Journal
+from manifest import open_manifest
+from metrics import MetricsLog
+
+STAGES = ('extract', 'render')
+EXTRACT_SUFFIXES = {'.docx', '.doc', '.xlsx', '.xls', '.pdf'}
+
+
+def run_pipeline(paths, extracted_dir, rendered_dir, journal, stages=STAGES, jobs=1, render_jobs=2,
+                 manifest=None, metrics=None):
+    """Run the stages over `paths`; returns {stage: {path: failure message}}.
+
+    With `metrics` (a metrics.MetricsLog), both stages add per-file timings to it.
+    Each stage imports its module when it runs, so a render-only run does
+    not load the extractor (and the reverse).
+    """
+    failures = {}
+    if 'extract' in stages:
+        from extract_submission_text import extract_all
+
+        extracted_dir.mkdir(parents=True, exist_ok=True)
+        results = extract_all(paths, extracted_dir, extracted_dir / '.extract_cache', jobs=jobs, journal=journal,
+                              metrics=metrics)
+        failures['extract'] = {path: error for path, (status, error) in results.items() if status == 'failed'}
+        if manifest:
+            for path, (status, error) in results.items():
+                manifest.mark([path], 'extract', 'failed' if status == 'failed' else 'done', error)
+
+    if 'render' in stages:
+        from render_xlsx import render_many
+
+        workbooks = [path for path in paths if path.suffix.lower() == '.xlsx']
+        start = time.monotonic()
+        outcomes = render_many(workbooks, rendered_dir, jobs=render_jobs, journal=journal,
+                               metrics=metrics) if workbooks else {}
+        failures['render'] = {path: str(o) for path, o in outcomes.items() if isinstance(o, Exception)}
+        counts = {status: 0 for status in ('rendered', 'cached', 'no charts')}
+        for outcome in outcomes.values():
+            if not isinstance(outcome, Exception):
+                counts[outcome] += 1
+        print(
+            f"Rendered: {counts['rendered']} rendered, {counts['cached']} unchanged, "
+            f"{counts['no charts']} without charts, {len(failures['render'])} failed "
+            f"in {time.monotonic() - start:.1f}s",
+            file=sys.stderr,
+        )
+        if manifest:
+            for path, outcome in outcomes.items():
+                failed = isinstance(outcome, Exception)
+                manifest.mark([path], 'render', 'failed' if failed else 'done', str(outcome))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable extract + render batch.')
+    parser.add_argument('--input', required=True, help='Submissions folder')
+    parser.add_argument('--extracted', default='feedback_extracted', help='Extraction output folder')
+    parser.add_argument('--rendered', default='feedback_rendered', help='Render output folder')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='Comma-separated stages to run (default: %(default)s)')
+    parser.add_argument('--journal', help='Journal file (default: EXTRACTED/.journal.jsonl)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help='Interrupted attempts before a file is given up on (default: %(default)s)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Extraction worker processes (default: CPU count)')
+    parser.add_argument('--render-jobs', type=int, default=2,
+                        help='Concurrent LibreOffice processes (default: %(default)s)')
+    parser.add_argument('--manifest', metavar='DB', help='Also record outcomes in this manifest (see manifest.py)')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='Append per-file, per-stage timings to this JSONL file and print where the time went')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    in_path = Path(args.input)
+    if not in_path.is_dir():
+        print(f"ERROR: {in_path} is not a directory", file=sys.stderr)
+        sys.exit(1)
+    extracted_dir = Path(args.extracted)
+    journal = Journal(args.journal or extracted_dir / '.journal.jsonl', max_attempts=args.max_attempts)
+    paths = [p for p in sorted(in_path.iterdir()) if p.suffix.lower() in EXTRACT_SUFFIXES]
+    manifest = open_manifest(args.manifest, in_path) if args.manifest else None
+    metrics = MetricsLog(args.metrics) if args.metrics else None
+
+    try:
+        failures = run_pipeline(paths, extracted_dir, Path(args.rendered), journal, stages,
+                                jobs=args.jobs, render_jobs=args.render_jobs, manifest=manifest,
+                                metrics=metrics)
+    except RuntimeError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if manifest:
+            manifest.close()
+    if metrics:
+        print(metrics.summary(), file=sys.stderr)
+    for stage, failed in failures.items():
+        for path, error in sorted(failed.items()):
+            print(f"  FAILED {stage} {path.name}: {error}", file=sys.stderr)
+    if any(failures.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1175 @@
+#!/usr/bin/env python3
+"""
+Recalculate workbook formulas offline and compare with Excel's cached values.
+
+Every formula cell in an XLSX file stores the value Excel computed when
+the file was last saved (<v> next to <f>). This script recomputes the
+common function subset itself and reports cells where the two disagree:
+a stale value (calculation set to manual), a value pasted over a
+formula's result, or a workbook edited by a tool that does not
+recalculate.
+
+Formulas are evaluated in dependency order (formula_graph.py). A column
+filled down with one formula is evaluated as a NumPy array in a single
+step instead of cell by cell; a running column that reads its own
+earlier rows (=A2*1.01, =A3*1.01, ...) is evaluated row by row. Cells
+that use unsupported functions or defined names keep their cached value,
+so they do not disturb the rest of the recalculation.
+
+Supported: + - * / ^ & % and comparisons, SUM, AVERAGE, MIN, MAX, COUNT,
+PRODUCT, SUMPRODUCT, LN, LOG, LOG10, EXP, ABS, SQRT, POWER, ROUND,
+ROUNDUP, ROUNDDOWN, INT, IF, IFERROR, AND, OR, NOT, INDEX, MATCH,
+GROWTH, TREND, PI.
+
+Requires NumPy (pip install numpy).
+
+Usage:
+    python recalc.py workbook.xlsx [--out report.json]
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+import zipfile
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from cellrefs import MAX_ROW, index_to_col, split_ref, unquote_sheet
+from extract_submission_text import SharedStrings, iter_sheet_rows
+from formula_graph import FormulaGraph
+from ooxml import cell_id, workbook_sheets
+
+# Recomputed and cached numbers closer than this (relative) are a match.
+REL_TOLERANCE = 1e-6
+ABS_TOLERANCE = 1e-9
+
+
+class XLError(Exception):
+    """A spreadsheet error value such as #DIV/0!, usable as a value or raised."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, XLError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+
+class Unsupported(Exception):
+    """The formula uses something this evaluator does not implement."""
+
+
+class Fallback(Exception):
+    """A column cannot be evaluated as a vector; evaluate it cell by cell."""
+
+
+# -- Parsing ---------------------------------------------------------------
+
+TOKEN_RE = re.compile(
+    r"""\s*(?:
+        (?P<string>"(?:[^"]|"")*")
+      | (?P<error>\#(?:DIV/0!|N/A|NAME\?|NULL!|NUM!|REF!|VALUE!))
+      | (?P<ref>(?:(?:'(?:[^']|'')+'|[A-Za-z_][A-Za-z0-9_.]*)!)?
+                (?:\$?[A-Z]{1,3}\$?[0-9]+(?::\$?[A-Z]{1,3}\$?[0-9]+)?
+                 |\$?[A-Z]{1,3}:\$?[A-Z]{1,3}
+                 |\$?[0-9]+:\$?[0-9]+)
+                (?![A-Za-z0-9_(!]))
+      | (?P<number>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+      | (?P<func>[A-Za-z_][A-Za-z0-9_.]*)\(
+      | (?P<name>[A-Za-z_\\][A-Za-z0-9_.\[\]]*)
+      | (?P<op><=|>=|<>|[-+*/^&=<>%(),:])
+    )""",
+    re.VERBOSE,
+)
+
+BINARY = {
+    '=': 1, '<>': 1, '<': 1, '>': 1, '<=': 1, '>=': 1,
+    '&': 2,
+    '+': 3, '-': 3,
+    '*': 4, '/': 4,
+    '^': 5,
+}
+
+_REF_PART = re.compile(r'(\$?)([A-Z]{1,3})?(\$?)([0-9]+)?')
+
+
+def tokenize(formula):
+    tokens = []
+    pos = 0
+    text = formula.lstrip('=')
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            if text[pos:].strip() == '':
+                break
+            raise Unsupported(f"cannot parse {text[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _parse_ref(text):
+    """('ref', sheet, c1, r1, c2, r2, r1_relative, r2_relative, single_cell) from a reference token."""
+    sheet = None
+    if '!' in text:
+        sheet, _sep, text = text.rpartition('!')
+        sheet = unquote_sheet(sheet)
+    first, _sep, last = text.partition(':')
+    parts = []
+    for piece in (first, last or first):
+        c_abs, col, r_abs, row = _REF_PART.fullmatch(piece).groups()
+        parts.append((col, row, bool(r_abs)))
+    (col1, row1, abs1), (col2, row2, abs2) = parts
+    if col1 is None:  # whole rows (3:5)
+        c1, c2 = 1, 16384
+    else:
+        c1, c2 = split_ref(f"{col1}1")[0], split_ref(f"{col2}1")[0]
+    if row1 is None:  # whole columns (A:C)
+        r1, r2, rel1, rel2 = 1, MAX_ROW, False, False
+    else:
+        r1, r2, rel1, rel2 = int(row1), int(row2), not abs1, not abs2
+        if r1 > r2:
+            r1, r2, rel1, rel2 = r2, r1, rel2, rel1
+    return ('ref', sheet, min(c1, c2), r1, max(c1, c2), r2, rel1, rel2, not last)
+
+
+def parse(formula):
+    """Parse a formula into a small tuple AST."""
+    tokens = tokenize(formula)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take():
+        nonlocal pos
+        token = peek()
+        pos += 1
+        return token
+
+    def expression(min_prec=1):
+        left = unary()
+        while True:
+            kind, value = peek()
+            if kind != 'op' or value not in BINARY or BINARY[value] < min_prec:
+                return left
+            take()
+            # Every binary operator is left-associative in Excel, ^ included
+            right = expression(BINARY[value] + 1)
+            left = ('bin', value, left, right)
+
+    def unary():
+        kind, value = peek()
+        if kind == 'op' and value in ('-', '+'):
+            take()
+            operand = unary()
+            return ('neg', operand) if value == '-' else operand
+        return postfix(primary())
+
+    def postfix(node):
+        while peek() == ('op', '%'):
+            take()
+            node = ('pct', node)
+        return node
+
+    def primary():
+        kind, value = take()
+        if kind == 'number':
+            return ('num', float(value))
+        if kind == 'string':
+            return ('str', value[1:-1].replace('""', '"'))
+        if kind == 'error':
+            return ('err', value)
+        if kind == 'ref':
+            return _parse_ref(value)
+        if kind == 'func':
+            name = value.upper()
+            if name.startswith('_XLFN.'):
+                name = name[6:]
+            args = []
+            if peek() == ('op', ')'):
+                take()
+                return ('fn', name, args)
+            while True:
+                if peek() in (('op', ','), ('op', ')')):
+                    args.append(('blank',))
+                else:
+                    args.append(expression())
+                kind, value = take()
+                if value == ')':
+                    return ('fn', name, args)
+                if value != ',':
+                    raise Unsupported("unbalanced parentheses")
+        if kind == 'name':
+            if value.upper() in ('TRUE', 'FALSE'):
+                return ('bool', value.upper() == 'TRUE')
+            raise Unsupported(f"defined name {value}")
+        if (kind, value) == ('op', '('):
+            node = expression()
+            if take() != ('op', ')'):
+                raise Unsupported("unbalanced parentheses")
+            return node
+        raise Unsupported(f"unexpected {value!r}")
+
+    node = expression()
+    if pos != len(tokens):
+        raise Unsupported(f"unexpected {tokens[pos][1]!r}")
+    return node
+
+
+# -- Cell values -----------------------------------------------------------
+
+class Block:
+    """The values of a rectangular range: numbers as floats (NaN for blanks), or objects."""
+
+    def __init__(self, values):
+        self.values = values  # 2-D: rows x cols
+
+    def numbers(self):
+        """Numeric entries only, as aggregates see them (text, booleans and blanks skipped)."""
+        if self.values.dtype == object:
+            flat = [v for v in self.values.ravel() if isinstance(v, float)]
+            return np.array([v for v in flat if not math.isnan(v)], dtype=float)
+        flat = self.values.ravel()
+        return flat[~np.isnan(flat)]
+
+    def flat(self):
+        return self.values.ravel()
+
+    def first_error(self):
+        if self.values.dtype == object:
+            for v in self.values.ravel():
+                if isinstance(v, XLError):
+                    return v
+        return None
+
+
+class Window:
+    """In vector mode, a range whose rows shift with the formula's row.
+
+    Row i of the column being computed reads rows r1[i]..r2[i]. Sums and
+    counts come from prefix sums over each column, so a running total or
+    moving average over n rows costs O(n), not O(n * window).
+    """
+
+    def __init__(self, store, sheet, c1, c2, r1, r2):
+        self.store = store
+        self.sheet = sheet
+        self.cols = range(c1, c2 + 1)
+        self.r1 = r1
+        self.r2 = r2
+
+    def _prefix(self, present):
+        top = int(self.r2.max())
+        total = np.zeros(len(self.r1))
+        for col in self.cols:
+            values = self.store.column(self.sheet, col, 1, top)  # raises Fallback on text
+            if present:
+                raw = self.store.numbers.get((self.sheet, col))
+                values = np.zeros(top)
+                if raw is not None:
+                    stop = min(top + 1, len(raw))
+                    values[:stop - 1] = ~np.isnan(raw[1:stop])
+            prefix = np.concatenate(([0.0], np.cumsum(values)))
+            total += prefix[np.clip(self.r2, 0, top)] - prefix[np.clip(self.r1 - 1, 0, top)]
+        return total
+
+    def sums(self):
+        return self._prefix(present=False)
+
+    def counts(self):
+        return self._prefix(present=True)
+
+
+class CellStore:
+    """Cell values per column: a float array for numbers and a dict for everything else."""
+
+    def __init__(self, sizes):
+        self.numbers = {key: np.full(size + 1, np.nan) for key, size in sizes.items()}
+        self.other = {}        # (sheet, col, row) -> str, bool or XLError
+        self.other_rows = {}   # (sheet, col) -> sorted rows present in `other`
+
+    def get(self, sheet, col, row):
+        value = self.other.get((sheet, col, row))
+        if value is not None:
+            return value
+        column = self.numbers.get((sheet, col))
+        if column is None or row >= len(column) or math.isnan(column[row]):
+            return None
+        return float(column[row])
+
+    def set(self, sheet, col, row, value):
+        key = (sheet, col)
+        column = self.numbers[key]
+        if isinstance(value, float) and not isinstance(value, bool):
+            column[row] = value
+            if self.other.pop((sheet, col, row), None) is not None:
+                rows = self.other_rows[key]
+                rows.pop(bisect_left(rows, row))
+        else:
+            column[row] = np.nan
+            if value is None:
+                if self.other.pop((sheet, col, row), None) is not None:
+                    rows = self.other_rows[key]
+                    rows.pop(bisect_left(rows, row))
+                return
+            if (sheet, col, row) not in self.other:
+                insort(self.other_rows.setdefault(key, []), row)
+            self.other[(sheet, col, row)] = value
+
+    def set_column(self, sheet, col, first, values):
+        """Store a computed vector; non-finite entries become #DIV/0! / #NUM! errors."""
+        column = self.numbers[(sheet, col)]
+        last = first + len(values) - 1
+        # Clear text/errors left in these rows (cached values being replaced)
+        rows = self.other_rows.get((sheet, col), [])
+        for row in rows[bisect_left(rows, first):bisect_right(rows, last)]:
+            self.set(sheet, col, row, None)
+        column[first:last + 1] = values
+        for i in np.flatnonzero(~np.isfinite(values)):
+            self.set(sheet, col, first + int(i), XLError('#DIV/0!' if np.isinf(values[i]) else '#NUM!'))
+
+    def column(self, sheet, col, first, count):
+        """Numbers in rows first..first+count-1 of a column, blanks as 0.
+
+        Raises Fallback when any of those cells holds text, a boolean or an
+        error, which only cell-by-cell evaluation handles correctly.
+        """
+        rows = self.other_rows.get((sheet, col))
+        if rows and bisect_left(rows, first) < bisect_right(rows, first + count - 1):
+            raise Fallback()
+        column = self.numbers.get((sheet, col))
+        out = np.zeros(count)
+        if column is not None:
+            stop = min(first + count, len(column))
+            if stop > first:
+                out[:stop - first] = np.nan_to_num(column[first:stop], nan=0.0)
+        return out
+
+    def block(self, sheet, c1, r1, c2, r2):
+        last = max((len(self.numbers.get((sheet, c), ())) - 1 for c in range(c1, c2 + 1)), default=0)
+        r2 = min(r2, max(last, r1))
+        height = r2 - r1 + 1
+        columns = []
+        has_other = False
+        for c in range(c1, c2 + 1):
+            column = self.numbers.get((sheet, c))
+            values = np.full(height, np.nan)
+            if column is not None and r1 < len(column):
+                stop = min(r2 + 1, len(column))
+                values[:stop - r1] = column[r1:stop]
+            columns.append(values)
+            rows = self.other_rows.get((sheet, c))
+            if rows and bisect_left(rows, r1) < bisect_right(rows, r2):
+                has_other = True
+        values = np.column_stack(columns) if columns else np.zeros((0, 0))
+        if has_other:
+            values = values.astype(object)
+            for j, c in enumerate(range(c1, c2 + 1)):
+                rows = self.other_rows.get((sheet, c), [])
+                for row in rows[bisect_left(rows, r1):bisect_right(rows, r2)]:
+                    values[row - r1, j] = self.other[(sheet, c, row)]
+        return Block(values)
+
+
+def cached_value(value, kind):
+    """A cell's stored <v> as the evaluator's value type."""
+    if value is None:
+        return None
+    if kind == 'b':
+        return value == '1'
+    if kind == 'e':
+        return XLError(value)
+    if kind in ('s', 'str', 'inlineStr'):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+# -- Evaluation ------------------------------------------------------------
+
+def _scalar_number(value):
+    if isinstance(value, XLError):
+        raise value
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, float):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            raise XLError('#VALUE!')
+    if isinstance(value, Block):
+        if value.values.size == 1:
+            return _scalar_number(value.values.ravel()[0] if value.values.dtype == object
+                                  else (None if np.isnan(value.values[0, 0]) else float(value.values[0, 0])))
+        raise XLError('#VALUE!')
+    return value  # a vector
+
+
+def _text(value):
+    if isinstance(value, XLError):
+        raise value
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return f"{value:.15g}"
+    return str(value)
+
+
+def _excel_round(x, digits, mode='half'):
+    scale = np.power(10.0, digits)
+    if mode == 'half':
+        return np.sign(x) * np.floor(np.abs(x) * scale + 0.5) / scale
+    if mode == 'up':
+        return np.sign(x) * np.ceil(np.abs(x) * scale - 1e-9) / scale
+    return np.sign(x) * np.floor(np.abs(x) * scale + 1e-9) / scale
+
+
+def _fit(known_y, known_x, log):
+    y = known_y.numbers()
+    x = known_x.numbers() if known_x is not None else np.arange(1.0, len(y) + 1)
+    if len(x) != len(y) or len(y) == 0:
+        raise XLError('#REF!')
+    if log:
+        if np.any(y <= 0):
+            raise XLError('#NUM!')
+        y = np.log(y)
+    return x, y
+
+
+class Evaluator:
+    """Evaluates parsed formulas against a CellStore.
+
+    With `rows` (a count), relative references become vectors over that
+    many rows, starting at the formula's own row, and the result is a
+    vector: this is how a filled-down column is computed in one step.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def evaluate(self, node, sheet, rows=None):
+        self.sheet = sheet
+        self.rows = rows
+        with np.errstate(all='ignore'):
+            return self._eval(node)
+
+    def _eval(self, node):
+        kind = node[0]
+        if kind == 'num':
+            return node[1]
+        if kind == 'str':
+            if self.rows is not None:
+                raise Fallback()
+            return node[1]
+        if kind == 'bool':
+            return node[1]
+        if kind == 'err':
+            return XLError(node[1])
+        if kind == 'blank':
+            return None
+        if kind == 'ref':
+            return self._ref(node)
+        if kind == 'neg':
+            return -self._num(self._eval(node[1]))
+        if kind == 'pct':
+            return self._num(self._eval(node[1])) / 100.0
+        if kind == 'bin':
+            return self._binary(node[1], node[2], node[3])
+        if kind == 'fn':
+            handler = FUNCTIONS.get(node[1])
+            if handler is None:
+                raise Unsupported(node[1])
+            return handler(self, node[2])
+        raise Unsupported(kind)
+
+    def _ref(self, node):
+        _kind, sheet, c1, r1, c2, r2, rel1, rel2, single = node
+        sheet = sheet or self.sheet
+        if single:
+            if self.rows is not None and rel1:
+                return self.store.column(sheet, c1, r1, self.rows)
+            value = self.store.get(sheet, c1, r1)
+            if self.rows is not None and isinstance(value, (str, XLError)):
+                raise Fallback()
+            return value
+        if self.rows is not None and (rel1 or rel2):
+            # A range that moves or grows with the row (a moving average, a running total)
+            step = np.arange(self.rows)
+            return Window(self.store, sheet, c1, c2, r1 + step * rel1, r2 + step * rel2)
+        return self.store.block(sheet, c1, r1, c2, r2)
+
+    def _num(self, value):
+        return _scalar_number(value)
+
+    def _binary(self, op, left, right):
+        a = self._eval(left)
+        b = self._eval(right)
+        if op == '&':
+            if self.rows is not None:
+                raise Fallback()
+            return _text(a) + _text(b)
+        if op in ('=', '<>', '<', '>', '<=', '>='):
+            return self._compare(op, a, b)
+        x, y = self._num(a), self._num(b)
+        if op == '+':
+            return x + y
+        if op == '-':
+            return x - y
+        if op == '*':
+            return x * y
+        if op == '/':
+            if self.rows is None and y == 0:
+                raise XLError('#DIV/0!')
+            return x / y
+        if self.rows is None:
+            try:
+                result = math.pow(x, y)
+            except (ValueError, OverflowError):
+                raise XLError('#NUM!')
+            return result
+        return np.power(x, y)
+
+    def _compare(self, op, a, b):
+        if self.rows is None:
+            for v in (a, b):
+                if isinstance(v, XLError):
+                    raise v
+            if isinstance(a, str) or isinstance(b, str):
+                a, b = _text(a).lower(), _text(b).lower()
+            else:
+                a, b = self._num(a), self._num(b)
+        else:
+            a, b = self._num(a), self._num(b)
+        return {
+            '=': lambda: a == b, '<>': lambda: a != b, '<': lambda: a < b,
+            '>': lambda: a > b, '<=': lambda: a <= b, '>=': lambda: a >= b,
+        }[op]()
+
+    # Helpers used by the function table
+
+    def values(self, args):
+        return [self._eval(arg) for arg in args]
+
+    def aggregate_parts(self, args, windows=False):
+        """Arguments of an aggregate, split by kind.
+
+        Returns (numbers or vectors from direct arguments, numbers from
+        ranges, windows). Windows are only accepted when `windows` is set.
+        """
+        direct = []
+        ranged = []
+        moving = []
+        for value in self.values(args):
+            if isinstance(value, Block):
+                error = value.first_error()
+                if error:
+                    raise error
+                ranged.append(value.numbers())
+            elif isinstance(value, Window):
+                if not windows:
+                    raise Fallback()
+                moving.append(value)
+            elif value is not None:
+                direct.append(self._num(value))
+        return direct, np.concatenate(ranged) if ranged else np.zeros(0), moving
+
+    def truth(self, value):
+        if isinstance(value, XLError):
+            raise value
+        if isinstance(value, str):
+            raise XLError('#VALUE!')
+        if self.rows is not None and isinstance(value, np.ndarray):
+            return value.astype(bool)
+        return bool(self._num(value)) if value is not None else False
+
+
+def _fn_sum(ev, args):
+    direct, ranged, moving = ev.aggregate_parts(args, windows=True)
+    return sum(direct + [w.sums() for w in moving], float(ranged.sum()))
+
+
+def _fn_average(ev, args):
+    direct, ranged, moving = ev.aggregate_parts(args, windows=True)
+    count = len(direct) + len(ranged) + sum(w.counts() for w in moving)
+    if ev.rows is None and count == 0:
+        raise XLError('#DIV/0!')
+    return sum(direct + [w.sums() for w in moving], float(ranged.sum())) / count
+
+
+def _fn_min(ev, args):
+    direct, ranged, _moving = ev.aggregate_parts(args)
+    parts = direct + ([float(ranged.min())] if len(ranged) else [])
+    return np.minimum.reduce(np.broadcast_arrays(*parts)) if parts else 0.0
+
+
+def _fn_max(ev, args):
+    direct, ranged, _moving = ev.aggregate_parts(args)
+    parts = direct + ([float(ranged.max())] if len(ranged) else [])
+    return np.maximum.reduce(np.broadcast_arrays(*parts)) if parts else 0.0
+
+
+def _fn_count(ev, args):
+    count = 0
+    for value in ev.values(args):
+        if isinstance(value, Block):
+            count += len(value.numbers())
+        elif isinstance(value, Window):
+            count = count + value.counts()
+        elif isinstance(value, (float, np.ndarray)) and not isinstance(value, bool):
+            count += 1
+    return float(count) if ev.rows is None else count
+
+
+def _fn_product(ev, args):
+    direct, ranged, _moving = ev.aggregate_parts(args)
+    result = float(np.prod(ranged)) if len(ranged) else 1.0
+    for value in direct:
+        result = result * value
+    return result
+
+
+def _fn_sumproduct(ev, args):
+    blocks = ev.values(args)
+    if not all(isinstance(b, Block) for b in blocks):
+        raise Unsupported('SUMPRODUCT')
+    arrays = []
+    for block in blocks:
+        values = block.values
+        if values.dtype == object:
+            values = np.array([v if isinstance(v, float) else np.nan for v in values.ravel()]).reshape(values.shape)
+        arrays.append(np.nan_to_num(values, nan=0.0))
+    if any(a.shape != arrays[0].shape for a in arrays):
+        raise XLError('#VALUE!')
+    return float(np.prod(arrays, axis=0).sum())
+
+
+def _unary(func, domain=None):
+    def handler(ev, args):
+        x = ev._num(ev._eval(args[0]))
+        if ev.rows is None:
+            if domain is not None and not domain(x):
+                raise XLError('#NUM!')
+            return float(func(x))
+        return func(x)
+    return handler
+
+
+def _fn_log(ev, args):
+    x = ev._num(ev._eval(args[0]))
+    base = ev._num(ev._eval(args[1])) if len(args) > 1 else 10.0
+    if ev.rows is None and (x <= 0 or base <= 0 or base == 1):
+        raise XLError('#NUM!')
+    return np.log(x) / np.log(base) if ev.rows is not None else math.log(x) / math.log(base)
+
+
+def _fn_power(ev, args):
+    return ev._binary('^', args[0], args[1])
+
+
+def _rounder(mode):
+    def handler(ev, args):
+        x = ev._num(ev._eval(args[0]))
+        digits = ev._num(ev._eval(args[1])) if len(args) > 1 else 0.0
+        result = _excel_round(x, digits, mode)
+        return float(result) if ev.rows is None else result
+    return handler
+
+
+def _fn_int(ev, args):
+    x = ev._num(ev._eval(args[0]))
+    return float(math.floor(x)) if ev.rows is None else np.floor(x)
+
+
+def _fn_if(ev, args):
+    condition = ev.truth(ev._eval(args[0]))
+    if ev.rows is None:
+        if condition:
+            return ev._eval(args[1]) if len(args) > 1 else True
+        return ev._eval(args[2]) if len(args) > 2 else False
+    yes = ev._num(ev._eval(args[1])) if len(args) > 1 else 1.0
+    no = ev._num(ev._eval(args[2])) if len(args) > 2 else 0.0
+    return np.where(condition, yes, no)
+
+
+def _fn_iferror(ev, args):
+    if ev.rows is None:
+        try:
+            value = ev._eval(args[0])
+            if isinstance(value, float) and not math.isfinite(value):
+                raise XLError('#NUM!')
+            if isinstance(value, XLError):
+                raise value
+            return value
+        except XLError:
+            return ev._eval(args[1])
+    value = ev._num(ev._eval(args[0]))
+    fallback = ev._num(ev._eval(args[1]))
+    return np.where(np.isfinite(value), value, fallback)
+
+
+def _fn_and(ev, args):
+    if ev.rows is not None:
+        raise Fallback()
+    return all(ev.truth(ev._eval(arg)) for arg in args)
+
+
+def _fn_or(ev, args):
+    if ev.rows is not None:
+        raise Fallback()
+    return any(ev.truth(ev._eval(arg)) for arg in args)
+
+
+def _fn_not(ev, args):
+    value = ev.truth(ev._eval(args[0]))
+    return ~value if isinstance(value, np.ndarray) else not value
+
+
+def _fn_index(ev, args):
+    block = ev._eval(args[0])
+    if not isinstance(block, Block):
+        raise Unsupported('INDEX without a range')
+    row = ev._num(ev._eval(args[1])) if len(args) > 1 and args[1] != ('blank',) else None
+    col = ev._num(ev._eval(args[2])) if len(args) > 2 and args[2] != ('blank',) else None
+    values = block.values
+    height, width = values.shape
+    if col is None:
+        if height == 1 and width > 1:
+            row, col = 1.0, row  # INDEX(row range, n) picks the n-th column
+        elif width == 1:
+            col = 1.0
+        else:
+            raise Unsupported('INDEX without a column on a 2-D range')
+    if row is None:
+        if height != 1:
+            raise Unsupported('INDEX without a row on a 2-D range')
+        row = 1.0
+    if ev.rows is not None:
+        if values.dtype == object:
+            raise Fallback()
+        r = np.asarray(row, dtype=int) - 1
+        c = np.asarray(col, dtype=int) - 1
+        if np.any((r < 0) | (r >= height) | (c < 0) | (c >= width)):
+            raise Fallback()
+        return np.nan_to_num(values[r, c], nan=0.0)
+    r, c = int(row) - 1, int(col) - 1
+    if not (0 <= r < height and 0 <= c < width):
+        raise XLError('#REF!')
+    value = values[r, c]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value if values.dtype == object else float(value)
+
+
+def _fn_match(ev, args):
+    lookup = ev._eval(args[0])
+    block = ev._eval(args[1])
+    kind = ev._num(ev._eval(args[2])) if len(args) > 2 else 1.0
+    if not isinstance(block, Block) or 1 not in block.values.shape:
+        raise XLError('#N/A')
+    flat = block.flat()
+    if ev.rows is not None:
+        if flat.dtype == object or kind not in (0, 1) or np.isnan(flat).any():
+            raise Fallback()
+        if kind == 0:
+            first = {}
+            for i, v in enumerate(flat):
+                if not math.isnan(v):
+                    first.setdefault(v, i + 1)
+            return np.array([first.get(v, np.nan) for v in lookup], dtype=float)
+        positions = np.searchsorted(flat, lookup, side='right').astype(float)
+        positions[positions == 0] = np.nan
+        return positions
+    if isinstance(lookup, XLError):
+        raise lookup
+    key = lookup.lower() if isinstance(lookup, str) else lookup
+    found = None
+    for i, v in enumerate(flat, 1):
+        v = v.lower() if isinstance(v, str) else (None if isinstance(v, float) and math.isnan(v) else v)
+        if v is None:
+            continue
+        if kind == 0:
+            if v == key:
+                return float(i)
+        elif type(v) is type(key):
+            if (kind > 0 and v <= key) or (kind < 0 and v >= key):
+                found = i
+            elif found is not None:
+                break
+    if found is None:
+        raise XLError('#N/A')
+    return float(found)
+
+
+def _regression(log):
+    def handler(ev, args):
+        known_y = ev._eval(args[0])
+        known_x = ev._eval(args[1]) if len(args) > 1 and args[1] != ('blank',) else None
+        new_x = ev._eval(args[2]) if len(args) > 2 and args[2] != ('blank',) else None
+        const = ev.truth(ev._eval(args[3])) if len(args) > 3 else True
+        if not isinstance(known_y, Block) or (known_x is not None and not isinstance(known_x, Block)):
+            raise Unsupported('GROWTH/TREND without ranges')
+        x, y = _fit(known_y, known_x, log)
+        if const:
+            slope = np.sum((x - x.mean()) * (y - y.mean())) / np.sum((x - x.mean()) ** 2)
+            intercept = y.mean() - slope * x.mean()
+        else:
+            slope, intercept = np.sum(x * y) / np.sum(x * x), 0.0
+        if new_x is None:
+            target = x[0]
+        elif isinstance(new_x, Block):
+            target = new_x.numbers()[0]  # implicit intersection: the first value
+        else:
+            target = ev._num(new_x)
+        result = intercept + slope * target
+        result = np.exp(result) if log else result
+        return float(result) if ev.rows is None else result
+    return handler
+
+
+FUNCTIONS = {
+    'SUM': _fn_sum,
+    'AVERAGE': _fn_average,
+    'MIN': _fn_min,
+    'MAX': _fn_max,
+    'COUNT': _fn_count,
+    'PRODUCT': _fn_product,
+    'SUMPRODUCT': _fn_sumproduct,
+    'LN': _unary(np.log, lambda x: x > 0),
+    'LOG10': _unary(np.log10, lambda x: x > 0),
+    'LOG': _fn_log,
+    'EXP': _unary(np.exp),
+    'ABS': _unary(np.abs),
+    'SQRT': _unary(np.sqrt, lambda x: x >= 0),
+    'POWER': _fn_power,
+    'ROUND': _rounder('half'),
+    'ROUNDUP': _rounder('up'),
+    'ROUNDDOWN': _rounder('down'),
+    'INT': _fn_int,
+    'IF': _fn_if,
+    'IFERROR': _fn_iferror,
+    'AND': _fn_and,
+    'OR': _fn_or,
+    'NOT': _fn_not,
+    'INDEX': _fn_index,
+    'MATCH': _fn_match,
+    'GROWTH': _regression(log=True),
+    'TREND': _regression(log=False),
+    'PI': lambda ev, args: math.pi,
+}
+
+
+# -- Workbook recalculation ------------------------------------------------
+
+def load_workbook(source):
+    """Read a workbook's cells: (FormulaGraph, CellStore, {cell: (cached value, kind)})."""
+    graph = FormulaGraph(Path(source).name if not hasattr(source, 'read') else None)
+    cells = []
+    sizes = {}
+    with zipfile.ZipFile(source) as z:
+        strings = SharedStrings()
+        if 'xl/sharedStrings.xml' in z.namelist():
+            with z.open('xl/sharedStrings.xml') as f:
+                strings = SharedStrings.read(f)
+        for sheet, part in workbook_sheets(z):
+            graph.sheets.append(sheet)
+            with z.open(part) as f:
+                for row, row_cells in iter_sheet_rows(f, strings):
+                    for ref, value, formula, kind in row_cells:
+                        if not ref:
+                            continue
+                        col, _row = split_ref(ref)
+                        if formula:
+                            graph.add(sheet, ref, formula, value)
+                        cells.append((sheet, col, row, cached_value(value, kind), kind))
+                        key = (sheet, col)
+                        if row > sizes.get(key, 0):
+                            sizes[key] = row
+    store = CellStore(sizes)
+    cached = {}
+    for sheet, col, row, value, kind in cells:
+        store.set(sheet, col, row, value)
+        if (sheet, col, row) in graph.formulas:
+            cached[(sheet, col, row)] = value
+    return graph, store, cached
+
+
+def _run_blocks(graph, run):
+    """The union of the ranges each cell in a run reads, one block per reference."""
+    sheet, col, first, last = run[:4]
+    first_blocks = graph.blocks[(sheet, col, first)]
+    last_blocks = graph.blocks[(sheet, col, last)]
+    return [(a[0], min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3]), max(a[4], b[4]))
+            for a, b in zip(first_blocks, last_blocks)], first_blocks, last_blocks
+
+
+def plan_runs(graph):
+    """Order runs of filled-down formulas so each run's inputs are computed first.
+
+    Returns (steps, leftover): steps are (run, sequential) in evaluation
+    order, where `sequential` marks runs that read their own earlier rows
+    and so must go row by row. Runs caught in cycles with other runs are
+    left over for cell-by-cell evaluation in graph order.
+    """
+    runs = graph.runs()
+    by_column = {}
+    for index, run in enumerate(runs):
+        by_column.setdefault((run[0], run[1]), []).append((run[2], run[3], index))
+    for entries in by_column.values():
+        entries.sort()
+    sheet_columns = {}
+    for sheet, col in by_column:
+        sheet_columns.setdefault(sheet, []).append(col)
+    for cols in sheet_columns.values():
+        cols.sort()
+
+    upstream = {}
+    sequential = set()
+    blocked = set()
+    for index, run in enumerate(runs):
+        sheet, col, first, last = run[:4]
+        sources = set()
+        union, first_blocks, last_blocks = _run_blocks(graph, run)
+        for i, (b_sheet, c1, r1, c2, r2) in enumerate(union):
+            cols = sheet_columns.get(b_sheet, [])
+            for c in cols[bisect_left(cols, c1):bisect_right(cols, c2)]:
+                entries = by_column[(b_sheet, c)]
+                stop = bisect_right(entries, (r2, MAX_ROW + 1, len(runs)))
+                for e_first, e_last, other in entries[:stop]:
+                    if e_last < r1:
+                        continue
+                    if other != index:
+                        sources.add(other)
+                    elif not (first_blocks[i][4] < first and last_blocks[i][4] < last):
+                        blocked.add(index)  # reads its own column at or below the current row
+                    else:
+                        sequential.add(index)
+        upstream[index] = sources
+
+    downstream = {index: [] for index in upstream}
+    waiting = {}
+    for index, sources in upstream.items():
+        waiting[index] = len(sources)
+        for source in sources:
+            downstream[source].append(index)
+    ready = deque(index for index, n in waiting.items() if n == 0 and index not in blocked)
+    steps = []
+    done = set()
+    while ready:
+        index = ready.popleft()
+        steps.append((runs[index], index in sequential))
+        done.add(index)
+        for child in downstream[index]:
+            waiting[child] -= 1
+            if waiting[child] == 0 and child not in blocked:
+                ready.append(child)
+    leftover = [run for index, run in enumerate(runs) if index not in done]
+    return steps, leftover
+
+
+def _agrees(computed, cached):
+    if cached is None:
+        return True
+    if isinstance(cached, XLError):
+        return isinstance(computed, XLError)
+    if isinstance(computed, XLError):
+        return False
+    if isinstance(cached, bool) or isinstance(computed, bool):
+        return bool(computed) == bool(cached) and type(computed) is type(cached)
+    if isinstance(cached, float):
+        if not isinstance(computed, float):
+            return False
+        return math.isclose(computed, cached, rel_tol=REL_TOLERANCE, abs_tol=ABS_TOLERANCE)
+    return _text(computed) == _text(cached)
+
+
+def recalculate(source):
+    """Recompute every formula in a workbook and compare with the cached values.
+
+    Returns a report dict: counts, mismatches (with whether the cell is
+    the origin of the difference or inherits it from a precedent),
+    unsupported cells and cells on circular references.
+    """
+    graph, store, cached = load_workbook(source)
+    evaluator = Evaluator(store)
+    parsed = {}
+    computed = {}
+    unsupported = {}
+    stats = {'vectorized': 0, 'cell_by_cell': 0}
+
+    def parse_cached(formula):
+        if formula not in parsed:
+            try:
+                parsed[formula] = parse(formula)
+            except Unsupported as exc:
+                parsed[formula] = exc
+        return parsed[formula]
+
+    def eval_cell(node):
+        sheet, col, row = node
+        ast = parse_cached(graph.formulas[node])
+        try:
+            if isinstance(ast, Unsupported):
+                raise ast
+            value = evaluator.evaluate(ast, sheet)
+            if isinstance(value, Block):
+                value = value.values.ravel()[0] if value.values.size else None
+                if isinstance(value, float) and math.isnan(value):
+                    value = None
+            if isinstance(value, np.ndarray):
+                value = value.ravel()[0] if value.size else None
+            if isinstance(value, (np.floating, np.integer)):
+                value = float(value)
+            if isinstance(value, np.bool_):
+                value = bool(value)
+            if value is None:
+                value = 0.0  # a formula pointing at a blank shows 0
+            if isinstance(value, float) and not math.isfinite(value):
+                value = XLError('#NUM!')
+        except XLError as error:
+            value = error
+        except (Unsupported, Fallback) as exc:
+            unsupported[node] = str(exc) or type(exc).__name__
+            return  # keep the cached value in the store
+        computed[node] = value
+        store.set(sheet, col, row, value)
+        stats['cell_by_cell'] += 1
+
+    steps, leftover = plan_runs(graph)
+    for run, sequential in steps:
+        sheet, col, first, last, formula, _pattern = run
+        count = last - first + 1
+        if count > 1 and not sequential:
+            ast = parse_cached(formula)
+            if not isinstance(ast, Unsupported):
+                try:
+                    values = np.asarray(evaluator.evaluate(ast, sheet, rows=count))
+                    if values.dtype == bool:
+                        raise Fallback()  # TRUE/FALSE results are compared cell by cell
+                    values = np.broadcast_to(values.astype(float), (count,)).copy()
+                except (Fallback, XLError, Unsupported, TypeError, ValueError):
+                    values = None
+                if values is not None:
+                    store.set_column(sheet, col, first, values)
+                    for row in range(first, last + 1):
+                        computed[(sheet, col, row)] = store.get(sheet, col, row)
+                    stats['vectorized'] += count
+                    continue
+        for row in range(first, last + 1):
+            eval_cell((sheet, col, row))
+
+    if leftover:
+        remaining = {(run[0], run[1], row) for run in leftover for row in range(run[2], run[3] + 1)}
+        ordered, circular = graph.order()
+        for node in ordered:
+            if node in remaining:
+                eval_cell(node)
+    else:
+        circular = []
+
+    mismatches = []
+    for node, value in computed.items():
+        if not _agrees(value, cached.get(node)):
+            mismatches.append(node)
+    mismatched_rows = {}
+    for sheet, col, row in sorted(mismatches):
+        mismatched_rows.setdefault((sheet, col), []).append(row)
+
+    def origin(node):
+        """True when none of the formula cells this one reads is itself a mismatch."""
+        for block in graph.blocks[node]:
+            for col, rows, lo, hi in graph._block_columns(*block):
+                bad = mismatched_rows.get((block[0], col))
+                if bad and lo < hi and bisect_left(bad, rows[lo]) < bisect_right(bad, rows[hi - 1]):
+                    return False
+        return True
+
+    def show(value):
+        if isinstance(value, XLError):
+            return value.code
+        return value
+
+    def label(node):
+        sheet, col, row = node
+        return cell_id(sheet, f"{index_to_col(col)}{row}")
+
+    return {
+        'file': graph.file,
+        'formulas': len(graph.formulas),
+        'recalculated': len(computed),
+        'vectorized': stats['vectorized'],
+        'cell_by_cell': stats['cell_by_cell'],
+        'mismatches': [
+            {
+                'cell': label(node),
+                'formula': graph.formulas[node],
+                'cached': show(cached.get(node)),
+                'recalculated': show(computed[node]),
+                'origin': origin(node),
+            }
+            for node in sorted(mismatches, key=graph._sort_key)
+        ],
+        'unsupported': [{'cell': label(node), 'formula': graph.formulas[node], 'reason': reason}
+                        for node, reason in sorted(unsupported.items(), key=lambda item: graph._sort_key(item[0]))],
+        'circular': [label(node) for node in circular],
+    }
+
+
+def format_report(report, limit=50):
+    out = []
+    out.append(f"{report['file']}: {report['formulas']:,} formula cells, {report['recalculated']:,} recalculated "
+               f"({report['vectorized']:,} as column vectors), {len(report['unsupported']):,} unsupported, "
+               f"{len(report['circular']):,} circular")
+    mismatches = report['mismatches']
+    origins = [m for m in mismatches if m['origin']]
+    if mismatches:
+        out.append(f"MISMATCHES ({len(mismatches)}; {len(origins)} where every input matched, listed first):")
+        for m in (origins + [m for m in mismatches if not m['origin']])[:limit]:
+            tag = 'origin' if m['origin'] else 'inherited'
+            out.append(f"  {m['cell']} ={m['formula']}  cached {m['cached']}  recalculated {m['recalculated']}  [{tag}]")
+        if len(mismatches) > limit:
+            out.append(f"  ... and {len(mismatches) - limit} more")
+    else:
+        out.append("No mismatches between cached and recalculated values.")
+    if report['unsupported']:
+        reasons = {}
+        for item in report['unsupported']:
+            reasons[item['reason']] = reasons.get(item['reason'], 0) + 1
+        out.append("Not recalculated (cached value kept): "
+                   + ', '.join(f"{reason} ({count})" for reason, count in sorted(reasons.items())))
+    return '\n'.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recalculate XLSX formulas offline and flag stale cached values.')
+    parser.add_argument('workbook', help='XLSX file')
+    parser.add_argument('--out', help='Also write the full report as JSON to this file')
+    args = parser.parse_args()
+
+    report = recalculate(Path(args.workbook))
+    print(format_report(report))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding='utf-8')
+    if report['mismatches']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,73 +1,417 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import html
+import json
 import os
+import re
+import shutil
 import subprocess
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
+from backends import find_soffice, record_speed
+from journal import Journal, journal_key
+from manifest import open_manifest
+from metrics import FileRecord, MetricsLog, as_dict, recording, stage
+from metrics import run as run_tool
+from ooxml import sheet_charts, workbook_sheets
 
-def run(cmd, check=True, env=None):
-    return subprocess.run(cmd, capture_output=True, text=True, check=check, env=env)
+# Bump whenever rendering output changes so cached renders are invalidated.
+RENDER_VERSION = '1'
 
+def run(cmd, check=True, env=None, timeout=None, name=None, new_session=False):
+    return run_tool(cmd, check=check, env=env, timeout=timeout, name=name, new_session=new_session)
 
-def render_xlsx(path, out_dir):
-    out_dir.mkdir(parents=True, exist_ok=True)
-    # Convert to PDF using LibreOffice
-    user_profile = out_dir / 'lo-profile'
-    user_profile.mkdir(parents=True, exist_ok=True)
-    cmd = [
-        '/Applications/LibreOffice.app/Contents/MacOS/soffice',
-        '--headless',
-        '--nologo',
-        '--nofirststartwizard',
-        '--norestore',
-        '--nodefault',
-        '--nolockcheck',
-        '--invisible',
-        f'-env:UserInstallation=file://{user_profile}',
-        '--convert-to', 'pdf',
-        '--outdir', str(out_dir),
-        str(path)
-    ]
-    env = os.environ.copy()
-    env['SAL_USE_VCLPLUGIN'] = 'gen'
-    env['HOME'] = str(out_dir)
-    result = run(cmd, check=False, env=env)
-    if result.returncode != 0:
-        details = f"returncode={result.returncode} stdout={result.stdout.strip()} stderr={result.stderr.strip()}"
-        raise RuntimeError(
-            "LibreOffice failed. Open LibreOffice once to complete first-run setup, "
-            "then retry. Details: " + details
-        )
-
-    pdf_path = out_dir / f"{path.stem}.pdf"
-    if not pdf_path.exists():
-        raise RuntimeError(f"PDF not created for {path.name}")
 
+class LibreOfficeWorker:
+    """A LibreOffice instance with its own persistent profile.
+
+    Each call to convert() starts soffice once for a whole batch of files, so
+    startup is paid per batch instead of per workbook, and the profile stays
+    warm across batches and runs.
+
+    Each soffice start gets the same `timeout`, however many files it
+    converts, and runs in its own session so a timeout kills soffice.bin
+    along with the wrapper. soffice converts files in argument order, so
+    after a timeout the first unfinished file is the one that hung: the
+    rest of the batch is restarted without it, and it is retried on its own
+    only if it did not already have a start to itself. If soffice crashes,
+    the files it did not finish are retried one at a time, so a single bad
+    workbook cannot take the rest down with it.
+    """
+
+    def __init__(self, soffice, profile_dir, timeout=120):
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+        self.timeout = timeout
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+    def _invoke(self, paths, pdf_dir):
+        """Run soffice once over paths; returns (error detail or None, timed out)."""
+        cmd = [
+            self.soffice,
+            '--headless',
+            '--nologo',
+            '--nofirststartwizard',
+            '--norestore',
+            '--nodefault',
+            '--nolockcheck',
+            '--invisible',
+            f'-env:UserInstallation={self.profile_dir.resolve().as_uri()}',
+            '--convert-to', 'pdf',
+            '--outdir', str(pdf_dir),
+        ] + [str(path) for path in paths]
+        env = os.environ.copy()
+        env['SAL_USE_VCLPLUGIN'] = 'gen'
+        env['HOME'] = str(self.profile_dir)
+        try:
+            result = run(cmd, check=False, env=env, timeout=self.timeout, name='soffice', new_session=True)
+        except subprocess.TimeoutExpired:
+            return f"LibreOffice timed out after {self.timeout}s", True
+        if result.returncode != 0:
+            return f"returncode={result.returncode} stdout={result.stdout.strip()} stderr={result.stderr.strip()}", False
+        return None, False
+
+    def convert(self, paths, pdf_dir):
+        """Convert workbooks to PDF. Returns {path: pdf path or RuntimeError}."""
+        results = {}
+        details = {}
+        for path in paths:
+            (pdf_dir / f"{path.stem}.pdf").unlink(missing_ok=True)  # never mistake a stale PDF for success
+        pending = list(paths)
+        retry = []
+        while pending:
+            detail, timed_out = self._invoke(pending, pdf_dir)
+            for path in pending:
+                details[path] = detail
+                pdf_path = pdf_dir / f"{path.stem}.pdf"
+                if pdf_path.exists():
+                    results[path] = pdf_path
+            left = [path for path in pending if path not in results]
+            if not timed_out or not left:
+                if len(pending) > 1:
+                    retry += left
+                break
+            hung = left[0]
+            if hung is not pending[0]:
+                retry.append(hung)  # it started late in the call; give it a full limit of its own
+            pending = left[1:]
+        for path in retry:
+            details[path], _timed_out = self._invoke([path], pdf_dir)
+            pdf_path = pdf_dir / f"{path.stem}.pdf"
+            if pdf_path.exists():
+                results[path] = pdf_path
+        for path in paths:
+            if path not in results:
+                results[path] = RuntimeError(
+                    f"PDF not created for {path.name}. If this is the first run, open LibreOffice once "
+                    f"to complete first-run setup, then retry. Details: {details[path]}"
+                )
+        return results
+
+
+def rasterize(pdf_path, out_dir, stem):
     # Convert PDF pages to PNG for visual review
     run([
         'pdftoppm',
         '-r', '200',
         '-png',
         str(pdf_path),
-        str(out_dir / path.stem)
+        str(out_dir / stem)
     ])
 
 
+def publish(pdf_path, png_dir, out_dir, stem):
+    """Move a workbook's rendered PDF and PNGs into out_dir; returns their names.
+
+    Each file is renamed into place, so out_dir never holds a half-written
+    image, and PNGs left over from an earlier render with more pages are
+    removed. Only pdftoppm's page names for this stem ({stem}-N.png) count
+    as ours: model-final-1.png belongs to model-final.xlsx, not model.xlsx.
+    """
+    page = re.compile(rf'{re.escape(stem)}-\d+\.png')
+    pngs = sorted(png for png in png_dir.glob(f"{stem}-*.png") if page.fullmatch(png.name))
+    fresh = {png.name for png in pngs}
+    for stale in out_dir.glob(f"{stem}-*.png"):
+        if page.fullmatch(stale.name) and stale.name not in fresh:
+            stale.unlink()
+    for png in pngs:
+        os.replace(png, out_dir / png.name)
+    os.replace(pdf_path, out_dir / pdf_path.name)
+    return [pdf_path.name] + sorted(fresh)
+
+
+def workbook_digest(path):
+    h = hashlib.sha256()
+    h.update(RENDER_VERSION.encode('utf-8'))
+    h.update(b'\0' + path.name.encode('utf-8') + b'\0')
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cached_outputs(cache_dir, digest, out_dir):
+    entry = cache_dir / f"{digest}.json"
+    if not entry.exists():
+        return None
+    outputs = json.loads(entry.read_text(encoding='utf-8'))
+    if all((out_dir / name).exists() for name in outputs):
+        return outputs
+    return None
+
+
+def _record_outputs(cache_dir, digest, outputs):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f".{digest}.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(outputs), encoding='utf-8')
+    os.replace(tmp, cache_dir / f"{digest}.json")
+
+
+_SHEET_TAG = re.compile(rb'<(?:\w+:)?sheet\b[^>]*?/?>')
+_NAME_ATTR = re.compile(rb'\sname="([^"]*)"')
+_STATE_ATTR = re.compile(rb'\sstate="[^"]*"')
+
+
+def chart_only_copy(path, keep, dest):
+    """Write a copy of the workbook with every sheet not in `keep` hidden.
+
+    LibreOffice does not print hidden sheets, so the PDF contains only the
+    chart-bearing sheets. Charts still read their data from the hidden
+    sheets. workbook.xml is edited textually so every other byte of the
+    package is left as Excel wrote it.
+    """
+    def hide(match):
+        tag = match.group(0)
+        name = _NAME_ATTR.search(tag)
+        if name and html.unescape(name.group(1).decode('utf-8')) in keep:
+            return tag
+        tag = _STATE_ATTR.sub(b'', tag)
+        end = -2 if tag.endswith(b'/>') else -1
+        return tag[:end] + b' state="hidden"' + tag[end:]
+
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(dest, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            data = src.read(info.filename)
+            if info.filename == 'xl/workbook.xml':
+                data = _SHEET_TAG.sub(hide, data)
+                # The active tab must be visible or the export may come out empty
+                data = re.sub(rb'\sactiveTab="\d+"', b'', data)
+            dst.writestr(info, data)
+
+
+def render_many(paths, out_dir, jobs=2, batch_size=20, timeout=120, cache=True, journal=None, on_result=None,
+                metrics=None):
+    """Render the chart-bearing sheets of each workbook to PDF and PNG.
+
+    Workbooks without charts are skipped, sheets without charts are hidden
+    before conversion, and workbooks whose rendered output is still on disk
+    from an earlier run (same content hash) are not rendered again.
+    Outputs are published as each batch finishes, so an interrupted run
+    keeps everything rendered before it stopped.
+
+    With a `journal` (see journal.py), workbooks that were being rendered
+    when an earlier run died are retried in batches of one, and given up
+    on after repeated interruptions. `on_result(path, outcome)` is called
+    as each workbook finishes (from worker threads).
+
+    With `metrics` (a metrics.MetricsLog), every workbook adds a line with
+    its per-stage timings; a batch's soffice run is split evenly across
+    the workbooks in it. The wall time per rendered workbook goes to
+    backends.record_speed, so renderer choice reflects real runs.
+
+    Returns {path: 'rendered' | 'cached' | 'no charts' | the error}.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir = out_dir / '.render_cache'
+    work_dir = out_dir / '.render_tmp'
+    shutil.rmtree(work_dir, ignore_errors=True)  # leftovers of an interrupted run
+    results = {}
+    digests = {}
+    sources = {}
+    keys = {}
+    suspects = set()
+    records = {path: FileRecord(path) for path in paths} if metrics is not None else {}
+
+    def track(path):
+        return recording(path, into=records[path]) if path in records else nullcontext()
+
+    if journal is not None:
+        keys = {path: journal_key(path, RENDER_VERSION) for path in paths}
+        _done, suspect_list, _todo, given_up = journal.plan('render', paths, keys, out_dir)
+        suspects = set(suspect_list)
+        for path in given_up:
+            results[path] = RuntimeError(journal.state('render', path, keys[path])['error'])
+
+    def finish(path, outcome, outputs=()):
+        results[path] = outcome
+        if journal is not None:
+            error = str(outcome) if isinstance(outcome, Exception) else None
+            journal.finish('render', path, keys[path], outputs, error)
+        if on_result:
+            on_result(path, outcome)
+
+    for path in paths:
+        if path in results:
+            continue
+        with track(path):
+            with stage('hash'):
+                digests[path] = digest = workbook_digest(path)
+            cached = _cached_outputs(cache_dir, digest, out_dir) if cache else None
+            if cached is not None:
+                finish(path, 'cached', cached)
+                continue
+            try:
+                with zipfile.ZipFile(path) as z, stage('inspect'):
+                    charts = sheet_charts(z)
+                    all_sheets = len(workbook_sheets(z, include_chartsheets=True))
+            except Exception as exc:
+                finish(path, exc)
+                continue
+            if not charts:
+                _record_outputs(cache_dir, digest, [])
+                finish(path, 'no charts')
+            elif len(charts) == all_sheets:
+                sources[path] = path
+            else:
+                (work_dir / 'src').mkdir(parents=True, exist_ok=True)
+                sources[path] = work_dir / 'src' / path.name
+                with stage('hide sheets'):
+                    chart_only_copy(path, set(charts), sources[path])
+
+    todo = [path for path in paths if path in sources]
+    if todo:
+        soffice = find_soffice()
+        start = time.perf_counter()
+        jobs = max(1, min(jobs, len(todo)))
+        workers = [LibreOfficeWorker(soffice, out_dir / f'.lo-profile-{i}', timeout) for i in range(jobs)]
+        # Workbooks interrupted in an earlier run go first, one per batch
+        batches = [[path] for path in todo if path in suspects]
+        rest = [path for path in todo if path not in suspects]
+        batches += [rest[i:i + batch_size] for i in range(0, len(rest), batch_size)]
+
+        def render_batch(worker, index, batch):
+            pdf_dir = work_dir / f'pdf-{index}'
+            png_dir = work_dir / f'png-{index}'
+            pdf_dir.mkdir(parents=True, exist_ok=True)
+            png_dir.mkdir(parents=True, exist_ok=True)
+            if journal is not None:
+                for path in batch:
+                    journal.start('render', path, keys[path])
+            shared = FileRecord(f'batch {index}')
+            with recording(shared.file, into=shared) if records else nullcontext():
+                converted = worker.convert([sources[path] for path in batch], pdf_dir)
+            for path in batch:
+                if records:
+                    records[path].merge(shared, share=1 / len(batch))
+                outcome = converted[sources[path]]
+                if isinstance(outcome, Exception):
+                    finish(path, outcome)
+                    continue
+                with track(path):
+                    try:
+                        rasterize(outcome, png_dir, path.stem)
+                        with stage('publish'):
+                            outputs = publish(outcome, png_dir, out_dir, path.stem)
+                    except Exception as exc:
+                        finish(path, exc)
+                        continue
+                _record_outputs(cache_dir, digests[path], outputs)
+                finish(path, 'rendered', outputs)
+
+        def render_batches(i, worker):
+            for index in range(i, len(batches), jobs):
+                render_batch(worker, index, batches[index])
+
+        # A worker's profile can only be used by one soffice process at a time,
+        # so each worker takes every jobs-th batch and runs them in sequence.
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for future in [pool.submit(render_batches, i, worker) for i, worker in enumerate(workers)]:
+                future.result()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        rendered = sum(1 for path in todo if results[path] == 'rendered')
+        if rendered:
+            record_speed('render', 'libreoffice', (time.perf_counter() - start) / rendered)
+    for path, record in records.items():
+        outcome = results[path]
+        metrics.add(as_dict(record, 'render', 'failed' if isinstance(outcome, Exception) else outcome))
+    return {path: results[path] for path in paths}
+
+
+def render_xlsx(path, out_dir):
+    outcome = render_many([path], out_dir, jobs=1)[path]
+    if isinstance(outcome, Exception):
+        raise RuntimeError(f"LibreOffice failed for {path.name}: {outcome}")
+    return outcome
+
+
 def main():
     parser = argparse.ArgumentParser(description='Render XLSX to PDF and PNGs for chart review.')
     parser.add_argument('--input', required=True, help='XLSX file or directory')
     parser.add_argument('--out', required=True, help='Output directory')
+    parser.add_argument('--jobs', '-j', type=int, default=2,
+                        help='Concurrent LibreOffice processes (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='Workbooks converted per LibreOffice start (default: %(default)s)')
+    parser.add_argument('--timeout', type=int, default=120,
+                        help='Seconds allowed per LibreOffice start before it is killed and the batch '
+                             'restarted without the workbook that hung (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='Re-render workbooks even if unchanged')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='Job journal (see journal.py): retry workbooks an interrupted run was rendering '
+                             'on their own, and give up on ones that keep crashing')
+    parser.add_argument('--manifest', metavar='DB',
+                        help='Submission manifest (see manifest.py): render only workbooks it lists as pending, '
+                             'and record each outcome')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='Append per-workbook, per-stage timings to this JSONL file and print where the time went')
     args = parser.parse_args()
 
     in_path = Path(args.input)
     out_dir = Path(args.out)
 
     if in_path.is_dir():
-        for path in sorted(in_path.iterdir()):
-            if path.suffix.lower() == '.xlsx':
-                render_xlsx(path, out_dir)
+        paths = [p for p in sorted(in_path.iterdir()) if p.suffix.lower() == '.xlsx']
     else:
-        render_xlsx(in_path, out_dir)
+        paths = [in_path]
+    manifest = None
+    if args.manifest:
+        manifest = open_manifest(args.manifest, in_path if in_path.is_dir() else in_path.parent)
+        pending = {row['path'] for row in manifest.pending('render')}
+        paths = [p for p in paths if str(p.resolve()) in pending]
+    if not paths:
+        return
+
+    metrics = MetricsLog(args.metrics) if args.metrics else None
+    results = render_many(paths, out_dir, jobs=args.jobs, batch_size=args.batch_size,
+                          timeout=args.timeout, cache=not args.no_cache,
+                          journal=Journal(args.journal) if args.journal else None, metrics=metrics)
+    if manifest:
+        for path, outcome in results.items():
+            failed = isinstance(outcome, Exception)
+            manifest.mark([path], 'render', 'failed' if failed else 'done', str(outcome))
+        manifest.close()
+    failed = {path: error for path, error in results.items() if isinstance(error, Exception)}
+    counts = {status: 0 for status in ('rendered', 'cached', 'no charts')}
+    for outcome in results.values():
+        if not isinstance(outcome, Exception):
+            counts[outcome] += 1
+    print(
+        f"Done: {counts['rendered']} rendered, {counts['cached']} unchanged, "
+        f"{counts['no charts']} without charts, {len(failed)} failed",
+        file=sys.stderr,
+    )
+    for path, error in failed.items():
+        print(f"  FAILED {path.name}: {error}", file=sys.stderr)
+    if metrics:
+        print(metrics.summary(), file=sys.stderr)
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
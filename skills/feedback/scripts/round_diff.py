@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Diff each writer's submission against their previous round.
+
+For a resubmission, only what changed needs a second look. Files are
+paired per writer (same original name, otherwise same type) between the
+previous and current round, then:
+
+- documents (DOCX and DOC paragraphs, PDF paragraphs split on blank lines) are
+  hashed per paragraph and the two hash sequences aligned with difflib,
+  so unchanged paragraphs cost one hash comparison; changed paragraphs
+  are shown as a word diff ([-old-]{+new+}) with one paragraph of context
+- workbooks are compared cell by cell (value and formula): changed input
+  values and formulas are listed, and formula cells whose cached result
+  changed are counted and sampled
+
+Each writer gets NAME.diff.txt (or .json with --format json) in --out.
+
+Usage:
+    python round_diff.py --prev submissions/round1 --curr submissions/round2 --out feedback_diff_round2
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import re
+import sys
+import zipfile
+from pathlib import Path
+
+from extract_submission_text import SharedStrings, docx_records, iter_sheet_rows, pdf_records, write_text
+from legacy_office import doc_records, rtf_records, sniff_format, xls_records
+from ooxml import cell_id, workbook_sheets
+from submission_names import group_by_writer, parse_submission_name, version_name
+
+DOCUMENT_SUFFIXES = {'.docx', '.doc', '.pdf'}
+WORKBOOK_SUFFIXES = {'.xlsx', '.xlsm', '.xls'}
+CONTEXT_CHARS = 160
+MAX_RESULT_CHANGES = 20  # formula cells with a changed cached value listed per workbook
+
+
+def _paragraph_key(text):
+    """Hash of a paragraph's text with whitespace normalized."""
+    return hashlib.blake2b(' '.join(text.split()).encode('utf-8'), digest_size=8).digest()
+
+
+def document_paragraphs(path):
+    """[(id, text)] for the non-empty paragraphs of a DOCX, DOC or PDF."""
+    suffix = path.suffix.lower()
+    if suffix in ('.docx', '.doc'):
+        # A .doc may really be a renamed .docx, or RTF saved by Word (see extract_records)
+        actual = sniff_format(path) if suffix == '.doc' else 'zip'
+        if actual == 'zip':
+            records = docx_records(path)
+        elif actual == 'rtf':
+            records = rtf_records(path)
+        else:
+            records = doc_records(path)
+        if 'error' in records:
+            raise ValueError(records['error'])
+        return [(p['id'], p['text']) for p in records['paragraphs'] if p['text'].strip()]
+    records = pdf_records(path)
+    if 'error' in records and not records['pages']:
+        raise ValueError(records['error'])
+    paragraphs = []
+    for page in records['pages']:
+        for n, text in enumerate(re.split(r'\n\s*\n', page['text']), 1):
+            if text.strip():
+                paragraphs.append((f"{page['id']}.{n}", ' '.join(text.split())))
+    return paragraphs
+
+
+def workbook_cells(path):
+    """{cell id: (value, formula)} for every non-empty cell of a workbook."""
+    if path.suffix.lower() == '.xls' and sniff_format(path) != 'zip':
+        return legacy_workbook_cells(path)
+    cells = {}
+    with zipfile.ZipFile(path) as z:
+        strings = SharedStrings()
+        if 'xl/sharedStrings.xml' in z.namelist():
+            with z.open('xl/sharedStrings.xml') as f:
+                strings = SharedStrings.read(f)
+        for sheet_name, part in workbook_sheets(z):
+            with z.open(part) as f:
+                for _row, row_cells in iter_sheet_rows(f, strings):
+                    for ref, value, formula, _kind in row_cells:
+                        if value is not None or formula:
+                            cells[cell_id(sheet_name, ref)] = (value, formula)
+    return cells
+
+
+def legacy_workbook_cells(path):
+    """workbook_cells() for an Excel 97-2003 workbook."""
+    records = xls_records(path, max_rows=sys.maxsize)
+    if 'error' in records:
+        raise ValueError(records['error'])
+    formulas = {formula['id']: formula['formula'] for formula in records['formulas']}
+    cells = {cell['id']: (cell['value'], formulas.get(cell['id'])) for cell in records['cells']}
+    for cell, formula in formulas.items():
+        cells.setdefault(cell, (None, formula))
+    return cells
+
+
+def word_diff(old, new):
+    """Inline word diff: unchanged words as-is, [-removed-] and {+added+}."""
+    a, b = old.split(), new.split()
+    out = []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == 'equal':
+            out.extend(a[i1:i2])
+            continue
+        if i2 > i1:
+            out.append('[-' + ' '.join(a[i1:i2]) + '-]')
+        if j2 > j1:
+            out.append('{+' + ' '.join(b[j1:j2]) + '+}')
+    return ' '.join(out)
+
+
+def diff_paragraphs(old, new):
+    """Changes between two [(id, text)] lists.
+
+    Returns {'unchanged': n, 'changes': [...]}, each change a dict with
+    'op' ('changed', 'added', 'removed'), 'id' (current round; previous
+    round for removals), 'was' (previous id), 'text' or 'diff', and
+    'before' (the nearest unchanged paragraph above, for context).
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [_paragraph_key(t) for _i, t in old], [_paragraph_key(t) for _i, t in new], autojunk=False)
+    changes = []
+    unchanged = 0
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'equal':
+            unchanged += i2 - i1
+            continue
+        before = new[j1 - 1][1][:CONTEXT_CHARS] if j1 > 0 else None
+        paired = min(i2 - i1, j2 - j1) if op == 'replace' else 0
+        for k in range(paired):
+            (old_id, old_text), (new_id, new_text) = old[i1 + k], new[j1 + k]
+            changes.append({'op': 'changed', 'id': new_id, 'was': old_id,
+                            'diff': word_diff(old_text, new_text), 'before': before})
+            before = None
+        for new_id, text in new[j1 + paired:j2]:
+            changes.append({'op': 'added', 'id': new_id, 'text': text, 'before': before})
+            before = None
+        for old_id, text in old[i1 + paired:i2]:
+            changes.append({'op': 'removed', 'id': old_id, 'was': old_id, 'text': text, 'before': before})
+            before = None
+    return {'unchanged': unchanged, 'changes': changes}
+
+
+def diff_cells(old, new):
+    """Cell changes between two {cell id: (value, formula)} maps.
+
+    Inputs and formulas that were edited, added or removed are listed in
+    full. Formula cells whose formula is the same but whose cached value
+    changed follow from other edits; they are counted and the first
+    MAX_RESULT_CHANGES listed.
+    """
+    changes = []
+    results = []
+    for cell in sorted(old.keys() | new.keys(), key=_cell_order):
+        before, after = old.get(cell), new.get(cell)
+        if before == after:
+            continue
+        if before is None:
+            changes.append({'op': 'added', 'cell': cell, 'value': after[0], 'formula': after[1]})
+        elif after is None:
+            changes.append({'op': 'removed', 'cell': cell, 'value': before[0], 'formula': before[1]})
+        elif before[1] and before[1] == after[1]:
+            results.append({'op': 'result', 'cell': cell, 'was': before[0], 'value': after[0], 'formula': after[1]})
+        else:
+            changes.append({'op': 'changed', 'cell': cell, 'was': before[0], 'value': after[0],
+                            'was_formula': before[1], 'formula': after[1]})
+    unchanged = sum(1 for cell in old.keys() & new.keys() if old[cell] == new[cell])
+    return {'unchanged': unchanged, 'changes': changes,
+            'results': len(results), 'result_samples': results[:MAX_RESULT_CHANGES]}
+
+
+def _cell_order(cell):
+    sheet, _sep, ref = cell.rpartition('!')
+    match = re.fullmatch(r'([A-Z]+)([0-9]+)', ref)
+    return (sheet, int(match.group(2)), len(match.group(1)), match.group(1)) if match else (sheet, 0, 0, ref)
+
+
+def pair_files(prev_paths, curr_paths):
+    """[(previous path or None, current path or None)] for one writer.
+
+    Files pair by original name first, report.docx and report-1.docx
+    counting as the same name (see version_name); what is left pairs by
+    type (document with document, workbook with workbook) in name order.
+    """
+    def original(path):
+        parsed = parse_submission_name(path.name)
+        return version_name(parsed.original if parsed else path.name)
+
+    def kind(path):
+        return 'document' if path.suffix.lower() in DOCUMENT_SUFFIXES else 'workbook'
+
+    prev_left = {original(p): p for p in prev_paths}
+    pairs = []
+    unpaired = []
+    for path in curr_paths:
+        match = prev_left.pop(original(path), None)
+        if match:
+            pairs.append((match, path))
+        else:
+            unpaired.append(path)
+    for path in unpaired:
+        match = next((p for p in prev_left.values() if kind(p) == kind(path)), None)
+        if match:
+            del prev_left[original(match)]
+        pairs.append((match, path))
+    pairs.extend((path, None) for path in prev_left.values())
+    return pairs
+
+
+def diff_writer(writer, prev_paths, curr_paths):
+    """Round diff for one writer: {'writer', 'files': [...]}."""
+    files = []
+    for prev, curr in pair_files(prev_paths, curr_paths):
+        entry = {'previous': prev.name if prev else None, 'current': curr.name if curr else None}
+        files.append(entry)
+        if prev is None or curr is None:
+            continue
+        try:
+            if curr.suffix.lower() in DOCUMENT_SUFFIXES:
+                old, new = document_paragraphs(prev), document_paragraphs(curr)
+                entry.update(kind='document', paragraphs=len(new), **diff_paragraphs(old, new))
+            else:
+                old, new = workbook_cells(prev), workbook_cells(curr)
+                entry.update(kind='workbook', cells=len(new), **diff_cells(old, new))
+        except Exception as exc:
+            entry['error'] = f"{type(exc).__name__}: {exc}"
+    return {'writer': writer, 'files': files}
+
+
+def _show(value, formula=None):
+    if formula:
+        return f"={formula} ({value})" if value is not None else f"={formula}"
+    return 'blank' if value is None else repr(value)
+
+
+def _clip(text, limit=CONTEXT_CHARS):
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def summarize(entry):
+    """One-line summary of a file's diff."""
+    if 'error' in entry:
+        return f"ERROR: {entry['error']}"
+    if entry['previous'] is None:
+        return "new file (no previous round)"
+    if entry['current'] is None:
+        return "not resubmitted"
+    counts = {'changed': 0, 'added': 0, 'removed': 0}
+    for change in entry['changes']:
+        counts[change['op']] += 1
+    if entry['kind'] == 'document':
+        total = entry['paragraphs']
+        share = entry['unchanged'] / total if total else 1.0
+        return (f"{entry['unchanged']} of {total} paragraphs unchanged ({share:.0%}); "
+                f"{counts['changed']} changed, {counts['added']} added, {counts['removed']} removed")
+    return (f"{entry['cells']:,} cells; {counts['changed']} changed, {counts['added']} added, "
+            f"{counts['removed']} removed, {entry['results']} formula results changed")
+
+
+def render_diff(report, prev_label='previous', curr_label='current'):
+    """The .diff.txt view of a writer's round diff."""
+    out = [f"ROUND DIFF: {report['writer']} ({prev_label} -> {curr_label})"]
+    for entry in report['files']:
+        out.append("")
+        out.append(f"FILE: {entry['previous'] or '-'} -> {entry['current'] or '-'}")
+        out.append(f"  {summarize(entry)}")
+        if 'changes' not in entry:
+            continue
+        if entry['kind'] == 'document':
+            for change in entry['changes']:
+                if change['before'] is not None:
+                    out.append(f"  ... {_clip(change['before'])}")
+                if change['op'] == 'changed':
+                    out.append(f"~ {change['id']} (was {change['was']}): {change['diff']}")
+                elif change['op'] == 'added':
+                    out.append(f"+ {change['id']}: {change['text']}")
+                else:
+                    out.append(f"- {change['id']} (removed): {change['text']}")
+        else:
+            for change in entry['changes']:
+                if change['op'] == 'changed':
+                    out.append(f"~ {change['cell']}: {_show(change['was'], change['was_formula'])} -> "
+                               f"{_show(change['value'], change['formula'])}")
+                elif change['op'] == 'added':
+                    out.append(f"+ {change['cell']}: {_show(change['value'], change['formula'])}")
+                else:
+                    out.append(f"- {change['cell']}: {_show(change['value'], change['formula'])}")
+            if entry['results']:
+                out.append(f"  RESULTS: {entry['results']} formula cells now evaluate differently"
+                           + (f" (first {len(entry['result_samples'])})" if entry['results'] > len(entry['result_samples']) else ''))
+                for change in entry['result_samples']:
+                    out.append(f"  = {change['cell']} ={change['formula']}: {change['was']} -> {change['value']}")
+    return "\n".join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff each writer's submission against the previous round.")
+    parser.add_argument('--prev', required=True, help='Previous round submissions folder (e.g. submissions/round1)')
+    parser.add_argument('--curr', required=True, help='Current round submissions folder (e.g. submissions/round2)')
+    parser.add_argument('--out', required=True, help='Output directory for NAME.diff.txt files')
+    parser.add_argument('--format', choices=['text', 'json'], default='text',
+                        help='text (.diff.txt, default) or json (.diff.json)')
+    args = parser.parse_args()
+
+    prev_dir, curr_dir, out_dir = Path(args.prev), Path(args.curr), Path(args.out)
+    for folder in (prev_dir, curr_dir):
+        if not folder.is_dir():
+            print(f"ERROR: {folder} is not a directory", file=sys.stderr)
+            sys.exit(1)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    suffixes = DOCUMENT_SUFFIXES | WORKBOOK_SUFFIXES
+    prev = group_by_writer([p for p in sorted(prev_dir.iterdir()) if p.suffix.lower() in suffixes])
+    curr = group_by_writer([p for p in sorted(curr_dir.iterdir()) if p.suffix.lower() in suffixes])
+    for writer, paths in curr.items():
+        report = diff_writer(writer, prev.get(writer, []), paths)
+        if args.format == 'json':
+            write_text(out_dir / f"{writer}.diff.json", json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            write_text(out_dir / f"{writer}.diff.txt", render_diff(report, prev_dir.name, curr_dir.name))
+        print(f"{writer}: " + "; ".join(
+            f"{entry['current'] or entry['previous']}: {summarize(entry)}" for entry in report['files']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
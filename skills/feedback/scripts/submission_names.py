@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Canvas submission file names.
+
+Canvas exports name each file
+
+    username_assignmentID_submissionID_originalFilename
+    username_LATE_assignmentID_submissionID_originalFilename
+
+The username groups a writer's files. Every file gets its own
+submission ID, so versions are compared per original file name: a
+higher submission ID for the same name is a later version. Canvas
+renames a resubmitted report.docx to report-1.docx, report-2.docx and
+so on, so that suffix is ignored when matching names (version_name).
+"""
+
+import re
+from collections import namedtuple
+from pathlib import Path
+
+CANVAS_NAME_RE = re.compile(r'(?P<writer>[^_]+)_(?P<late>LATE_)?(?P<assignment>\d+)_(?P<submission>\d+)_(?P<original>.+)')
+
+RESUBMISSION_RE = re.compile(r'-\d+(?=\.[^.]*$|$)')
+
+SubmissionName = namedtuple('SubmissionName', 'writer assignment submission original late')
+
+
+def parse_submission_name(name):
+    """SubmissionName for a Canvas export file name, or None for any other name."""
+    match = CANVAS_NAME_RE.fullmatch(Path(name).name)
+    if not match:
+        return None
+    return SubmissionName(
+        match.group('writer'), int(match.group('assignment')), int(match.group('submission')),
+        match.group('original'), bool(match.group('late')),
+    )
+
+
+def version_name(original):
+    """The name versions of a file share: lowercased, without Canvas's -N resubmission suffix."""
+    return RESUBMISSION_RE.sub('', original.lower(), count=1)
+
+
+def group_by_writer(paths, final_only=True):
+    """{writer: [paths]} for submission files.
+
+    Files that do not follow the Canvas convention are grouped by their
+    stem. With `final_only`, a file submitted more than once keeps only
+    its highest submission ID (the final version); report.docx and
+    report-1.docx count as the same file (see version_name).
+    """
+    groups = {}
+    for path in paths:
+        parsed = parse_submission_name(path.name)
+        if parsed:
+            key = (parsed.writer, version_name(parsed.original))
+            version = parsed.submission
+        else:
+            key = (Path(path).stem, Path(path).name.lower())
+            version = 0
+        groups.setdefault(key, []).append((version, path))
+    result = {}
+    for (writer, _original), entries in sorted(groups.items()):
+        if final_only:
+            entries = [max(entries)]
+        result.setdefault(writer, []).extend(path for _version, path in entries)
+    return {writer: sorted(found) for writer, found in result.items()}
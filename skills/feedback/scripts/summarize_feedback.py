@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Collect scores from every feedback file and write the FEEDBACK_SUMMARY.md skeleton.
+
+Reads the "## Score: X/Y" line and the "### Rubric Breakdown" table of
+each writer's feedback (Section B format), matches the criteria to the
+"### N. Name (P points)" headings in rubric.md, and fills in the parts
+of the summary that are arithmetic: the score table sorted highest to
+lowest, mean/median/range/standard deviation, per-criterion means and
+percentiles, and outliers (robust z-score of at least 3.5 on the total
+or any criterion, from the median and median absolute deviation).
+
+The per-writer paragraphs and the common issues are left as placeholders
+for the summary agent. Each writer's "## Summary" text is quoted under
+their heading, and the most frequent concern titles are listed, as a
+starting point. Files missing a score, sub-scores that do not add up to
+the total, and criteria that match nothing in the rubric are listed
+under "Parsing issues" so they can be fixed before the summary is
+finished.
+
+Requires NumPy (pip install numpy).
+
+Usage:
+    python summarize_feedback.py --feedback feedback --rubric rubric.md [--assignment assignment.md]
+"""
+
+import argparse
+import difflib
+import json
+import re
+import sys
+import warnings
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+SUMMARY_NAME = 'FEEDBACK_SUMMARY.md'
+OUTLIER_Z = 3.5
+PERCENTILES = (10, 25, 75, 90)
+
+CRITERION_HEADING_RE = re.compile(
+    r'^#{2,4}\s*(?:\d+[.)]\s*)?(?P<name>.+?)\s*\(\s*(?P<points>\d+(?:\.\d+)?)\s*(?:points?|pts?\.?)\s*\)\s*$',
+    re.IGNORECASE)
+TOTAL_POINTS_RE = re.compile(r'^#{1,4}\s*Total Points:\s*(?P<points>\d+(?:\.\d+)?)', re.IGNORECASE)
+TITLE_RE = re.compile(r'^#\s+(?P<title>.+?)\s*$')
+WRITER_HEADING_RE = re.compile(r'^#\s+(?P<name>.+?)\s+[-–—]+\s+Feedback\s*$', re.IGNORECASE | re.MULTILINE)
+SCORE_RE = re.compile(
+    r'^#{1,4}\s*(?:Total\s+)?Score:\s*\**\s*(?P<score>\d+(?:\.\d+)?)\s*(?:/\s*(?P<out_of>\d+(?:\.\d+)?))?',
+    re.IGNORECASE | re.MULTILINE)
+RUBRIC_HEADING_RE = re.compile(r'^#{2,4}\s*Rubric Breakdown.*$', re.IGNORECASE | re.MULTILINE)
+SUMMARY_HEADING_RE = re.compile(r'^##\s*Summary\s*$', re.IGNORECASE | re.MULTILINE)
+PARAGRAPH_END_RE = re.compile(r'\n\s*\n|\n(?=#|---)')
+FRACTION_RE = re.compile(r'(?P<score>-?\d+(?:\.\d+)?)\s*(?:/\s*(?P<out_of>\d+(?:\.\d+)?))?')
+CONCERN_SECTION_RE = re.compile(r'^##\s*(?:Major|Minor) Concerns.*$', re.IGNORECASE | re.MULTILINE)
+CONCERN_RE = re.compile(r'^\s*(?:\d+\.|[-*])\s*\*\*(?P<title>[^*\n]+?)\*\*', re.MULTILINE)
+NEXT_SECTION_RE = re.compile(r'^(?:#{1,2}\s|---)', re.MULTILINE)
+
+
+def normalize(name):
+    return re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+
+
+def parse_rubric(path):
+    """([(criterion, points)], total points or None) from rubric.md."""
+    criteria = []
+    total = None
+    for line in Path(path).read_text(encoding='utf-8', errors='replace').splitlines():
+        match = TOTAL_POINTS_RE.match(line)
+        if match:
+            total = float(match.group('points'))
+            continue
+        match = CRITERION_HEADING_RE.match(line)
+        if match:
+            criteria.append((match.group('name').strip(), float(match.group('points'))))
+    return criteria, total
+
+
+def table_cells(line):
+    return [cell.strip() for cell in line.strip().strip('|').split('|')]
+
+
+def parse_feedback(path):
+    """Score, rubric rows, summary text and concern titles from one feedback file."""
+    text = Path(path).read_text(encoding='utf-8', errors='replace')
+    record = {'writer': path.stem, 'name': path.stem, 'score': None, 'out_of': None,
+              'rows': [], 'summary': '', 'concerns': []}
+    match = WRITER_HEADING_RE.search(text)
+    if match:
+        record['name'] = match.group('name').strip('[] ')
+    match = SCORE_RE.search(text)
+    if match:
+        record['score'] = float(match.group('score'))
+        record['out_of'] = float(match.group('out_of')) if match.group('out_of') else None
+
+    match = RUBRIC_HEADING_RE.search(text)
+    if match:
+        header = True
+        for line in text[match.end():].lstrip('\n').splitlines():
+            line = line.strip()
+            if not line.startswith('|'):
+                break
+            cells = table_cells(line)
+            if header or len(cells) < 2 or set(cells[0]) <= set('-: '):
+                header = False
+                continue
+            score = FRACTION_RE.search(cells[1])
+            if score:
+                out_of = score.group('out_of')
+                record['rows'].append((cells[0].strip('* '), float(score.group('score')),
+                                       float(out_of) if out_of else None))
+
+    match = SUMMARY_HEADING_RE.search(text)
+    if match:
+        paragraph = PARAGRAPH_END_RE.split(text[match.end():].lstrip('\n'), maxsplit=1)[0]
+        record['summary'] = ' '.join(line.strip() for line in paragraph.splitlines())
+
+    for match in CONCERN_SECTION_RE.finditer(text):
+        end = NEXT_SECTION_RE.search(text, match.end())
+        section = text[match.end():end.start() if end else len(text)]
+        record['concerns'] += [title.strip(' :') for title in CONCERN_RE.findall(section)]
+    return record
+
+
+def match_criteria(names, criteria):
+    """{feedback criterion name: rubric criterion name or None}."""
+    by_norm = {normalize(name): name for name, _points in criteria}
+    matched = {}
+    for name in names:
+        norm = normalize(name)
+        if norm in by_norm:
+            matched[name] = by_norm[norm]
+            continue
+        prefixed = [rubric for key, rubric in by_norm.items() if key.startswith(norm) or norm.startswith(key)]
+        if len(prefixed) == 1:
+            matched[name] = prefixed[0]
+            continue
+        close = difflib.get_close_matches(norm, list(by_norm), n=1, cutoff=0.6)
+        matched[name] = by_norm[close[0]] if close else None
+    return matched
+
+
+def summarize(records, criteria, total_points=None):
+    """Score matrix, statistics, outliers and issues for parsed feedback records."""
+    names = [name for name, _points in criteria]
+    points = np.array([p for _name, p in criteria], dtype=float)
+    issues = []
+    mapping = match_criteria({row[0] for r in records for row in r['rows']}, criteria)
+    for name, rubric in sorted(mapping.items()):
+        if rubric is None:
+            writers = sorted(r['writer'] for r in records if any(row[0] == name for row in r['rows']))
+            issues.append(f"Criterion '{name}' is not in rubric.md ({', '.join(writers[:5])}"
+                          f"{', ...' if len(writers) > 5 else ''})")
+
+    index = {name: i for i, name in enumerate(names)}
+    scores = np.full((len(records), len(names)), np.nan)
+    totals = np.full(len(records), np.nan)
+    out_of = total_points or (float(points.sum()) if len(points) else None)
+    for i, record in enumerate(records):
+        for name, score, _row_out_of in record['rows']:
+            rubric = mapping.get(name)
+            if rubric is not None:
+                scores[i, index[rubric]] = score
+        if record['score'] is not None:
+            totals[i] = record['score']
+            if record['out_of'] and out_of and record['out_of'] != out_of:
+                issues.append(f"{record['writer']}: scored out of {record['out_of']:g}, rubric total is {out_of:g}")
+        elif record['rows']:
+            totals[i] = np.nansum(scores[i])
+            issues.append(f"{record['writer']}: no '## Score:' line; total taken from the rubric breakdown")
+        else:
+            issues.append(f"{record['writer']}: no score found")
+        filled = ~np.isnan(scores[i])
+        if filled.any() and not np.isnan(totals[i]):
+            if filled.all() and abs(scores[i].sum() - totals[i]) > 1e-6:
+                issues.append(f"{record['writer']}: rubric sub-scores add up to {scores[i].sum():g}, "
+                              f"total says {totals[i]:g}")
+            elif not filled.all():
+                missing = [names[j] for j in np.flatnonzero(~filled)]
+                issues.append(f"{record['writer']}: no score for {', '.join(missing)}")
+        over = np.flatnonzero(scores[i] > points)
+        for j in over:
+            issues.append(f"{record['writer']}: {names[j]} scored {scores[i, j]:g} of {points[j]:g}")
+
+    scored = ~np.isnan(totals)
+    stats = {'count': int(scored.sum()), 'out_of': out_of}
+    if scored.any():
+        valid = totals[scored]
+        stats.update({
+            'mean': float(valid.mean()), 'median': float(np.median(valid)),
+            'min': float(valid.min()), 'max': float(valid.max()),
+            'std': float(valid.std(ddof=1)) if len(valid) > 1 else 0.0,
+            'percentiles': dict(zip(PERCENTILES, np.percentile(valid, PERCENTILES).tolist())),
+        })
+
+    per_criterion = []
+    if len(names):
+        counts = (~np.isnan(scores)).sum(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # criteria nobody was scored on
+            means = np.nanmean(scores, axis=0)
+            medians = np.nanmedian(scores, axis=0)
+            pct = np.nanpercentile(scores, PERCENTILES, axis=0)
+        for j, name in enumerate(names):
+            per_criterion.append({
+                'criterion': name, 'points': float(points[j]), 'count': int(counts[j]),
+                'mean': None if not counts[j] else float(means[j]),
+                'median': None if not counts[j] else float(medians[j]),
+                'percentiles': None if not counts[j] else dict(zip(PERCENTILES, pct[:, j].tolist())),
+            })
+
+    outliers = []
+    for label, column in [('Total', totals)] + [(name, scores[:, j]) for j, name in enumerate(names)]:
+        z = robust_z(column)
+        for i in np.flatnonzero(np.abs(z) >= OUTLIER_Z):
+            outliers.append({'writer': records[i]['writer'], 'criterion': label,
+                             'score': float(column[i]), 'z': round(float(z[i]), 1)})
+    outliers.sort(key=lambda o: -abs(o['z']))
+
+    concerns = Counter()
+    labels = {}
+    for record in records:
+        titles = {}
+        for title in record['concerns']:
+            titles.setdefault(normalize(title), title)
+        concerns.update(titles.keys())
+        for key, title in titles.items():
+            labels.setdefault(key, title)
+    common = [(labels[key], n) for key, n in concerns.most_common(10) if n > 1]
+
+    return {'criteria': names, 'points': points, 'scores': scores, 'totals': totals, 'stats': stats,
+            'per_criterion': per_criterion, 'outliers': outliers, 'issues': issues, 'common_concerns': common}
+
+
+def robust_z(values):
+    """Median/MAD z-scores (0.6745 scales MAD to a standard deviation); NaN stays 0."""
+    valid = ~np.isnan(values)
+    z = np.zeros(len(values))
+    if valid.sum() < 5:
+        return z
+    median = np.median(values[valid])
+    mad = np.median(np.abs(values[valid] - median))
+    if mad == 0:
+        return z
+    z[valid] = 0.6745 * (values[valid] - median) / mad
+    return z
+
+
+def fmt(value):
+    return '–' if value is None or (isinstance(value, float) and np.isnan(value)) else f"{value:g}"
+
+
+def render_summary(records, result, title='[Assignment Name]'):
+    names, points = result['criteria'], result['points']
+    stats = result['stats']
+    out_of = stats['out_of']
+    lines = [f"# Feedback Summary — {title}", '', '## Score Overview', '']
+    header = ['Writer'] + [f"{name} (/{p:g})" for name, p in zip(names, points)] + [f"Total (/{fmt(out_of)})"]
+    lines.append('| ' + ' | '.join(header) + ' |')
+    lines.append('|' + '|'.join('---' for _ in header) + '|')
+    order = sorted(range(len(records)),
+                   key=lambda i: (np.isnan(result['totals'][i]), -np.nan_to_num(result['totals'][i]),
+                                  records[i]['name'].lower()))
+    for i in order:
+        cells = [records[i]['name']] + [fmt(v) for v in result['scores'][i]] + [fmt(result['totals'][i])]
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    lines.append('')
+    if stats['count']:
+        lines.append(f"**Mean:** {stats['mean']:.1f} | **Median:** {stats['median']:g} | "
+                     f"**Range:** {stats['min']:g}–{stats['max']:g} | **Std Dev:** {stats['std']:.1f} | "
+                     f"**Scored:** {stats['count']} of {len(records)}")
+        lines.append('')
+    if result['per_criterion']:
+        lines += ['### By Criterion', '',
+                  '| Criterion | Points | Mean | Mean % | Median | ' +
+                  ' | '.join(f"P{p}" for p in PERCENTILES) + ' |',
+                  '|---|---|---|---|---|' + '---|' * len(PERCENTILES)]
+        for c in result['per_criterion']:
+            if c['mean'] is None:
+                lines.append(f"| {c['criterion']} | {c['points']:g} | – | – | – |" + ' – |' * len(PERCENTILES))
+                continue
+            share = f"{c['mean'] / c['points']:.0%}" if c['points'] else '–'
+            lines.append(f"| {c['criterion']} | {c['points']:g} | {c['mean']:.1f} | {share} | {c['median']:g} | " +
+                         ' | '.join(f"{c['percentiles'][p]:.1f}" for p in PERCENTILES) + ' |')
+        lines.append('')
+    if result['outliers']:
+        lines += ['### Outliers', '']
+        names_by_writer = {r['writer']: r['name'] for r in records}
+        for o in result['outliers']:
+            lines.append(f"- {names_by_writer[o['writer']]}: {o['criterion']} {o['score']:g} (robust z {o['z']:+.1f})")
+        lines.append('')
+    if result['issues']:
+        lines += ['### Parsing issues', '', '(Fix these in the feedback files and re-run before finishing the summary.)', '']
+        lines += [f"- {issue}" for issue in result['issues']]
+        lines.append('')
+
+    lines += ['## Individual Summaries', '']
+    for i in order:
+        record = records[i]
+        lines.append(f"### {record['name']} — {fmt(result['totals'][i])}/{fmt(out_of)}")
+        if record['summary']:
+            lines.append(f"> {record['summary']}")
+            lines.append('')
+        lines += ['[One paragraph: key strength, primary concern, notable observation.]', '']
+
+    lines += ['## Common Issues Across Submissions', '']
+    if result['common_concerns']:
+        lines.append('<!-- Concern titles used most often: ' +
+                     '; '.join(f"{title} ({n})" for title, n in result['common_concerns']) + ' -->')
+    lines += ['1. [Most frequent issue and count]', '2. [Second most frequent]', '3. [Third most frequent]', '']
+    return '\n'.join(lines)
+
+
+def feedback_files(feedback_dir):
+    return [p for p in sorted(feedback_dir.glob('*.md')) if p.name != SUMMARY_NAME]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate feedback scores into the FEEDBACK_SUMMARY.md skeleton.')
+    parser.add_argument('--feedback', default='feedback', help='Feedback folder (default: %(default)s)')
+    parser.add_argument('--rubric', default='rubric.md', help='Rubric file (default: %(default)s)')
+    parser.add_argument('--assignment', help='assignment.md; its first heading becomes the summary title')
+    parser.add_argument('--out', help=f'Output file (default: FEEDBACK/{SUMMARY_NAME})')
+    parser.add_argument('--format', choices=['markdown', 'json'], default='markdown')
+    parser.add_argument('--force', action='store_true', help='Overwrite an existing summary')
+    args = parser.parse_args()
+
+    feedback_dir = Path(args.feedback)
+    if not feedback_dir.is_dir():
+        print(f"ERROR: {feedback_dir} is not a directory", file=sys.stderr)
+        sys.exit(1)
+    rubric_path = Path(args.rubric)
+    if not rubric_path.exists():
+        print(f"ERROR: {rubric_path} not found", file=sys.stderr)
+        sys.exit(1)
+    criteria, total_points = parse_rubric(rubric_path)
+    if not criteria:
+        print(f"WARNING: no '### N. Criterion (P points)' headings in {rubric_path}; "
+              "only totals will be summarized", file=sys.stderr)
+
+    records = [parse_feedback(path) for path in feedback_files(feedback_dir)]
+    if not records:
+        print(f"ERROR: no feedback files in {feedback_dir}", file=sys.stderr)
+        sys.exit(1)
+    result = summarize(records, criteria, total_points)
+
+    if args.format == 'json':
+        payload = {
+            'stats': result['stats'], 'per_criterion': result['per_criterion'], 'outliers': result['outliers'],
+            'issues': result['issues'], 'common_concerns': result['common_concerns'],
+            'writers': [{'writer': r['writer'], 'name': r['name'],
+                         'total': None if np.isnan(t) else float(t),
+                         'scores': {n: None if np.isnan(v) else float(v) for n, v in zip(result['criteria'], row)}}
+                        for r, t, row in zip(records, result['totals'], result['scores'])],
+        }
+        text = json.dumps(payload, indent=2)
+    else:
+        title = '[Assignment Name]'
+        if args.assignment and Path(args.assignment).exists():
+            for line in Path(args.assignment).read_text(encoding='utf-8', errors='replace').splitlines():
+                match = TITLE_RE.match(line)
+                if match:
+                    title = match.group('title')
+                    break
+        text = render_summary(records, result, title)
+
+    if args.out == '-':
+        print(text)
+        return
+    out_path = Path(args.out) if args.out else feedback_dir / (SUMMARY_NAME if args.format == 'markdown'
+                                                                 else 'feedback_summary.json')
+    if out_path.exists() and not args.force:
+        print(f"ERROR: {out_path} exists (edited summaries are not overwritten; use --force)", file=sys.stderr)
+        sys.exit(1)
+    out_path.write_text(text + '\n', encoding='utf-8')
+    stats = result['stats']
+    print(f"Done: {len(records)} feedback files, {stats['count']} scored, {len(result['outliers'])} outliers, "
+          f"{len(result['issues'])} parsing issues -> {out_path}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Generate a deterministic synthetic submission corpus for benchmarking.
+
+Writes Canvas-named DOCX, XLSX and PDF files built from scratch with the
+standard library, so the same seed and sizes always produce the same
+bytes, on any machine, without Office or network access:
+
+- DOCX: paragraphs of filler prose, a share of them carrying tracked
+  insertions/deletions, anchored comments, and embedded workbooks
+  (as an .xlsx package part, or wrapped in an OLE object the way Word
+  stores objects pasted from Excel)
+- XLSX: several sheets of rows with a pool of repeated labels (the
+  shared-string cardinality), filled-down formula columns and line charts;
+  cached formula results and chart caches hold what the cells compute, so
+  recalc.py and match_numbers.py find the same agreement as in real files
+- PDF: text-only, image-only (one bitmap per page, as a scan) or mixed
+
+A corpus.json next to the files records the sizes and seed used, so
+benchmark results can be compared only against the same corpus.
+
+Usage:
+    python synth_corpus.py --out corpus --preset small
+    python synth_corpus.py --out corpus --docx 20 --paragraphs 2000 --xlsx 20 --rows 50000 --pdf 0
+"""
+
+import argparse
+import io
+import json
+import random
+import struct
+import sys
+import zipfile
+import zlib
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+PRESETS = {
+    'small': {'docx': 10, 'xlsx': 10, 'pdf': 6, 'paragraphs': 60, 'track_changes': 0.1, 'comments': 5,
+              'embedded': 1, 'rows': 200, 'sheets': 2, 'strings': 50, 'formulas': 2, 'charts': 1, 'pages': 3},
+    'medium': {'docx': 40, 'xlsx': 40, 'pdf': 12, 'paragraphs': 400, 'track_changes': 0.1, 'comments': 20,
+               'embedded': 1, 'rows': 5000, 'sheets': 3, 'strings': 500, 'formulas': 3, 'charts': 2, 'pages': 10},
+    'large': {'docx': 40, 'xlsx': 40, 'pdf': 12, 'paragraphs': 3000, 'track_changes': 0.2, 'comments': 100,
+              'embedded': 3, 'rows': 50000, 'sheets': 4, 'strings': 5000, 'formulas': 4, 'charts': 3, 'pages': 40},
+}
+PDF_KINDS = ('text', 'image', 'mixed')
+
+WORDS = (
+    'the economy growth rate inflation output capital labor productivity investment consumption '
+    'savings interest policy model data estimate trend cycle shock demand supply market price wage '
+    'employment unemployment government spending tax debt deficit exports imports exchange currency '
+    'real nominal index per capita average annual percent increase decrease compared relative '
+    'because therefore however suggests indicates shows evidence analysis result figure table'
+).split()
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+S_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CT_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+C_NS = 'http://schemas.openxmlformats.org/drawingml/2006/chart'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+XDR_NS = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+
+
+def sentence(rng, low=8, high=24):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    if rng.random() < 0.4:
+        words.insert(rng.randrange(len(words)), f"{rng.uniform(0.1, 999):.1f}%")
+    return ' '.join(words).capitalize() + '.'
+
+
+def relationships(rels):
+    items = ''.join(f'<Relationship Id="{rid}" Type="{REL_TYPE}{kind}" Target="{target}"/>'
+                    for rid, kind, target in rels)
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{PKG_REL_NS}">{items}</Relationships>'
+
+
+def content_types(defaults, overrides):
+    items = ''.join(f'<Default Extension="{ext}" ContentType="{ct}"/>' for ext, ct in defaults)
+    items += ''.join(f'<Override PartName="{part}" ContentType="{ct}"/>' for part, ct in overrides)
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Types xmlns="{CT_NS}">{items}</Types>'
+
+
+# --- XLSX ---
+
+def col_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+
+def num_cache(values):
+    """A c:numCache holding `values`, as Excel caches the cells a chart range refers to."""
+    points = ''.join(f'<c:pt idx="{i}"><c:v>{value}</c:v></c:pt>' for i, value in enumerate(values))
+    return f'<c:numCache><c:formatCode>General</c:formatCode><c:ptCount val="{len(values)}"/>{points}</c:numCache>'
+
+
+def xlsx_bytes(rng, rows=200, sheets=2, strings=50, formulas=2, charts=1):
+    """A workbook: per sheet a label column, a year column, value columns and filled-down formulas."""
+    labels = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).title() + f" {i}"
+              for i in range(max(1, strings))]
+    values = 3
+    parts = {}
+    sheet_names = [f"Sheet{n}" if n else 'Data' for n in range(sheets)]
+    data_rows = []  # (year, values) of the Data sheet, for the chart caches
+    for n, sheet_name in enumerate(sheet_names):
+        first_formula = 2 + values
+        header = ['Label', 'Year'] + [f"Series {v + 1}" for v in range(values)] + \
+                 [f"Calc {f + 1}" for f in range(formulas)]
+        out = [f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{S_NS}" '
+               f'xmlns:r="{R_NS}"><dimension ref="A1:{col_name(len(header) - 1)}{rows + 1}"/><sheetData>',
+               '<row r="1">' + ''.join(f'<c r="{col_name(i)}1" t="inlineStr"><is><t>{escape(h)}</t></is></c>'
+                                       for i, h in enumerate(header)) + '</row>']
+        level = [rng.uniform(50, 500) for _ in range(values)]
+        first = None
+        for r in range(2, rows + 2):
+            year = 1990 + (r - 2) % 40
+            cells = [f'<c r="A{r}" t="s"><v>{rng.randrange(len(labels))}</v></c>',
+                     f'<c r="B{r}"><v>{year}</v></c>']
+            row = []
+            for v in range(values):
+                level[v] *= 1 + rng.gauss(0.01, 0.02)
+                row.append(round(level[v], 4))  # the value as written, so cached results match a recalculation
+                cells.append(f'<c r="{col_name(2 + v)}{r}"><v>{row[v]:.4f}</v></c>')
+            first = first or row
+            if n == 0:
+                data_rows.append((year, row))
+            for f in range(formulas):
+                col = col_name(first_formula + f)
+                src = col_name(2 + f % values)
+                if f % 2 == 0:
+                    text, result = f"{src}{r}*1.05", row[f % values] * 1.05
+                else:
+                    text, result = f"{src}{r}/{src}$2-1", row[f % values] / first[f % values] - 1
+                if r == 2:
+                    formula = f'<f t="shared" ref="{col}2:{col}{rows + 1}" si="{f}">{text}</f>'
+                else:
+                    formula = f'<f t="shared" si="{f}"/>'
+                cells.append(f'<c r="{col}{r}">{formula}<v>{result!r}</v></c>')
+            out.append(f'<row r="{r}">' + ''.join(cells) + '</row>')
+        out.append('</sheetData>')
+        if n == 0 and charts:
+            out.append('<drawing r:id="rId1"/>')
+        out.append('</worksheet>')
+        parts[f'xl/worksheets/sheet{n + 1}.xml'] = ''.join(out)
+
+    sst = ''.join(f'<si><t>{escape(label)}</t></si>' for label in labels)
+    parts['xl/sharedStrings.xml'] = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><sst xmlns="{S_NS}" '
+                                     f'count="{rows * sheets}" uniqueCount="{len(labels)}">{sst}</sst>')
+    parts['xl/workbook.xml'] = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook xmlns="{S_NS}" xmlns:r="{R_NS}"><sheets>'
+        + ''.join(f'<sheet name="{name}" sheetId="{i + 1}" r:id="rId{i + 1}"/>' for i, name in enumerate(sheet_names))
+        + '</sheets></workbook>')
+    rels = [(f"rId{i + 1}", 'worksheet', f"worksheets/sheet{i + 1}.xml") for i in range(sheets)]
+    rels.append((f"rId{sheets + 1}", 'sharedStrings', 'sharedStrings.xml'))
+    parts['xl/_rels/workbook.xml.rels'] = relationships(rels)
+
+    overrides = [('/xl/workbook.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml'),
+                 ('/xl/sharedStrings.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml')]
+    overrides += [(f'/xl/worksheets/sheet{i + 1}.xml',
+                   'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml') for i in range(sheets)]
+    if charts:
+        parts['xl/worksheets/_rels/sheet1.xml.rels'] = relationships([('rId1', 'drawing', '../drawings/drawing1.xml')])
+        parts['xl/drawings/drawing1.xml'] = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                                             f'<xdr:wsDr xmlns:xdr="{XDR_NS}"/>')
+        parts['xl/drawings/_rels/drawing1.xml.rels'] = relationships(
+            [(f"rId{c + 1}", 'chart', f"../charts/chart{c + 1}.xml") for c in range(charts)])
+        overrides.append(('/xl/drawings/drawing1.xml', 'application/vnd.openxmlformats-officedocument.drawing+xml'))
+        last = min(rows + 1, 41)
+        shown = data_rows[:last - 1]
+        years = num_cache([year for year, _row in shown])
+        for c in range(charts):
+            col = col_name(2 + c % values)
+            series = f"Series {c % values + 1}"
+            parts[f'xl/charts/chart{c + 1}.xml'] = (
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><c:chartSpace xmlns:c="{C_NS}" '
+                f'xmlns:a="{A_NS}"><c:chart><c:title><c:tx><c:rich><a:p><a:r><a:t>{series} over time'
+                f'</a:t></a:r></a:p></c:rich></c:tx></c:title><c:plotArea><c:lineChart><c:ser>'
+                f'<c:tx><c:strRef><c:f>Data!${col}$1</c:f><c:strCache><c:ptCount val="1"/>'
+                f'<c:pt idx="0"><c:v>{series}</c:v></c:pt></c:strCache></c:strRef></c:tx>'
+                f'<c:cat><c:numRef><c:f>Data!$B$2:$B${last}</c:f>{years}</c:numRef></c:cat>'
+                f'<c:val><c:numRef><c:f>Data!${col}$2:${col}${last}</c:f>'
+                f'{num_cache([row[c % values] for _year, row in shown])}'
+                f'</c:numRef></c:val></c:ser></c:lineChart></c:plotArea></c:chart></c:chartSpace>')
+            overrides.append((f'/xl/charts/chart{c + 1}.xml',
+                              'application/vnd.openxmlformats-officedocument.drawingml.chart+xml'))
+    parts['[Content_Types].xml'] = content_types(
+        [('rels', 'application/vnd.openxmlformats-package.relationships+xml'), ('xml', 'application/xml')], overrides)
+    parts['_rels/.rels'] = relationships([('rId1', 'officeDocument', 'xl/workbook.xml')])
+    return zip_bytes(parts)
+
+
+def zip_bytes(parts):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name in sorted(parts, key=lambda n: (n != '[Content_Types].xml', n)):
+            info = zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0))  # fixed time: reproducible bytes
+            info.compress_type = zipfile.ZIP_DEFLATED
+            data = parts[name]
+            z.writestr(info, data.encode('utf-8') if isinstance(data, str) else data)
+    return buf.getvalue()
+
+
+# --- OLE (compound file) wrapper for embedded objects ---
+
+SECTOR = 512
+ENDOFCHAIN, FATSECT, FREESECT, NOSTREAM = 0xFFFFFFFE, 0xFFFFFFFD, 0xFFFFFFFF, 0xFFFFFFFF
+
+
+def ole10_native(filename, data):
+    """An \\x01Ole10Native stream: the Packager layout Word uses for embedded files."""
+    name = filename.encode('latin1') + b'\x00'
+    temp = b'C:\\Temp\\' + name
+    body = (struct.pack('<H', 2) + name + name + struct.pack('<HH', 0, 3) + struct.pack('<I', len(temp)) + temp
+            + struct.pack('<I', len(data)) + data)
+    return struct.pack('<I', len(body)) + body
+
+
+def _dir_entry(name, kind, child=NOSTREAM, start=ENDOFCHAIN, size=0):
+    encoded = (name + '\x00').encode('utf-16-le') if name else b''
+    return (encoded.ljust(64, b'\x00') + struct.pack('<HBB', len(encoded), kind, 1)
+            + struct.pack('<III', NOSTREAM, NOSTREAM, child) + b'\x00' * 16 + struct.pack('<I', 0)
+            + b'\x00' * 16 + struct.pack('<II', start, size) + b'\x00' * 4)
+
+
+def ole_file(stream_name, stream):
+    """A minimal version-3 compound file holding one stream in regular sectors."""
+    stream = stream.ljust(4096, b'\x00')  # stay above the mini-stream cutoff
+    data_sectors = -(-len(stream) // SECTOR)
+    fat_sectors = 1
+    while fat_sectors * (SECTOR // 4) < fat_sectors + 1 + data_sectors:
+        fat_sectors += 1
+    if fat_sectors > 109:
+        raise ValueError('embedded object too large for the synthetic OLE writer')
+    dir_sector = fat_sectors
+    first_data = fat_sectors + 1
+    fat = [FATSECT] * fat_sectors + [ENDOFCHAIN]
+    fat += [first_data + i + 1 for i in range(data_sectors - 1)] + [ENDOFCHAIN]
+    fat += [FREESECT] * (fat_sectors * (SECTOR // 4) - len(fat))
+    difat = list(range(fat_sectors)) + [FREESECT] * (109 - fat_sectors)
+    header = (bytes.fromhex('D0CF11E0A1B11AE1') + b'\x00' * 16
+              + struct.pack('<HHHHH', 0x3E, 3, 0xFFFE, 9, 6) + b'\x00' * 6
+              + struct.pack('<IIIIIIIII', 0, fat_sectors, dir_sector, 0, 4096, ENDOFCHAIN, 0, ENDOFCHAIN, 0)
+              + struct.pack('<109I', *difat))
+    directory = (_dir_entry('Root Entry', 5, child=1) + _dir_entry(stream_name, 2, start=first_data, size=len(stream))
+                 + _dir_entry('', 0) * 2)
+    return header + struct.pack(f'<{len(fat)}I', *fat) + directory + stream.ljust(data_sectors * SECTOR, b'\x00')
+
+
+# --- DOCX ---
+
+def docx_bytes(rng, paragraphs=60, track_changes=0.1, comments=5, embedded=1, embed_format='ole', workbook=None):
+    comment_at = set(rng.sample(range(paragraphs), min(comments, paragraphs)))
+    body = []
+    change_id = 0
+    for p in range(paragraphs):
+        parts = []
+        if p in comment_at:
+            parts.append(f'<w:commentRangeStart w:id="{p}"/>')
+        parts.append(f'<w:r><w:t xml:space="preserve">{escape(sentence(rng))} </w:t></w:r>')
+        if rng.random() < track_changes:
+            change_id += 2
+            parts.append(f'<w:ins w:id="{change_id}" w:author="Writer" w:date="2024-01-01T00:00:00Z"><w:r>'
+                         f'<w:t xml:space="preserve">{escape(sentence(rng, 3, 8))} </w:t></w:r></w:ins>'
+                         f'<w:del w:id="{change_id + 1}" w:author="Writer" w:date="2024-01-01T00:00:00Z"><w:r>'
+                         f'<w:delText>{escape(sentence(rng, 3, 8))}</w:delText></w:r></w:del>')
+        parts.append(f'<w:r><w:t>{escape(sentence(rng))}</w:t></w:r>')
+        if p in comment_at:
+            parts.append(f'<w:commentRangeEnd w:id="{p}"/><w:r><w:commentReference w:id="{p}"/></w:r>')
+        style = '<w:pPr><w:pStyle w:val="Heading1"/></w:pPr>' if p % 25 == 0 else ''
+        body.append(f'<w:p>{style}{"".join(parts)}</w:p>')
+    parts = {'word/document.xml': (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document '
+                                   f'xmlns:w="{W_NS}" xmlns:r="{R_NS}"><w:body>{"".join(body)}</w:body></w:document>')}
+    rels = []
+    overrides = [('/word/document.xml',
+                  'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml')]
+    if comment_at:
+        parts['word/comments.xml'] = (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:comments xmlns:w="{W_NS}">'
+            + ''.join(f'<w:comment w:id="{p}" w:author="Reviewer" w:date="2024-01-02T00:00:00Z"><w:p><w:r>'
+                      f'<w:t>{escape(sentence(rng, 4, 12))}</w:t></w:r></w:p></w:comment>' for p in sorted(comment_at))
+            + '</w:comments>')
+        rels.append(('rId1', 'comments', 'comments.xml'))
+        overrides.append(('/word/comments.xml',
+                          'application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml'))
+    defaults = [('rels', 'application/vnd.openxmlformats-package.relationships+xml'), ('xml', 'application/xml')]
+    for e in range(embedded):
+        data = workbook if workbook is not None else xlsx_bytes(rng, rows=60, sheets=1, strings=20, formulas=1, charts=1)
+        if embed_format == 'ole':
+            name = f'word/embeddings/oleObject{e + 1}.bin'
+            parts[name] = ole_file('\x01Ole10Native', ole10_native(f'Worksheet{e + 1}.xlsx', data))
+            rels.append((f"rId{e + 10}", 'oleObject', f"embeddings/oleObject{e + 1}.bin"))
+        else:
+            name = f'word/embeddings/Microsoft_Excel_Worksheet{e + 1}.xlsx'
+            parts[name] = data
+            rels.append((f"rId{e + 10}", 'package', f"embeddings/Microsoft_Excel_Worksheet{e + 1}.xlsx"))
+    if embedded:
+        defaults += [('bin', 'application/vnd.openxmlformats-officedocument.oleObject'),
+                     ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')]
+    parts['word/_rels/document.xml.rels'] = relationships(rels)
+    parts['[Content_Types].xml'] = content_types(defaults, overrides)
+    parts['_rels/.rels'] = relationships([('rId1', 'officeDocument', 'word/document.xml')])
+    return zip_bytes(parts)
+
+
+# --- PDF ---
+
+def _text_page(rng):
+    lines = []
+    for _ in range(rng.randint(35, 45)):
+        text = sentence(rng, 8, 13)[:90]
+        lines.append('(' + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ") '")
+    return ('BT /F1 10 Tf 14 TL 72 740 Td ' + ' '.join(lines) + ' ET').encode('latin1')
+
+
+def _image(rng, width=850, height=1100):
+    """A grey page bitmap with dark bars standing in for scanned lines of text."""
+    white = b'\xff' * width
+    rows = []
+    y = 90
+    while len(rows) < height:
+        if y <= len(rows) < y + 14 and y < height - 90:
+            line = bytearray(white)
+            x = 100
+            while x < width - 100:
+                word = rng.randint(20, 70)
+                line[x:min(x + word, width - 100)] = b'\x20' * (min(x + word, width - 100) - x)
+                x += word + rng.randint(8, 14)
+            rows.extend([bytes(line)] * 14)
+            y += 24
+        else:
+            rows.append(white)
+    return zlib.compress(b''.join(rows[:height]), 6), width, height
+
+
+def pdf_bytes(rng, pages=3, kind='text'):
+    objects = []  # object number = index + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    page_ids = []
+    for n in range(pages):
+        scanned = kind == 'image' or (kind == 'mixed' and n % 2)
+        if scanned:
+            data, width, height = _image(rng)
+            image = add(b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+                        b'/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n' % (width, height, len(data))
+                        + data + b'\nendstream')
+            content = b'q 612 0 0 792 0 0 cm /Im1 Do Q'
+            resources = b'<< /XObject << /Im1 %d 0 R >> >>' % image
+        else:
+            content = _text_page(rng)
+            resources = b'<< /Font << /F1 %d 0 R >> >>' % font
+        stream = add(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        page_ids.append(add(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources %s /Contents %d 0 R >>'
+                            % (pages_obj, resources, stream)))
+    objects[catalog - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % pages_obj
+    objects[pages_obj - 1] = (b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % p for p in page_ids)
+                              + b'] /Count %d >>' % len(page_ids))
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def generate(out_dir, spec, seed=0, pdf_kinds=PDF_KINDS, embed_format='ole'):
+    """Write the corpus described by `spec` (see PRESETS) and return the file list."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = []
+    for n in range(spec['docx']):
+        rng = random.Random(f"{seed}-docx-{n}")
+        path = out_dir / f"w{n:04d}_100_{1000 + n}_report.docx"
+        path.write_bytes(docx_bytes(rng, spec['paragraphs'], spec['track_changes'], spec['comments'],
+                                    spec['embedded'], embed_format))
+        files.append(path)
+    for n in range(spec['xlsx']):
+        rng = random.Random(f"{seed}-xlsx-{n}")
+        path = out_dir / f"w{n:04d}_100_{2000 + n}_model.xlsx"
+        path.write_bytes(xlsx_bytes(rng, spec['rows'], spec['sheets'], spec['strings'], spec['formulas'],
+                                    spec['charts']))
+        files.append(path)
+    for n in range(spec['pdf']):
+        rng = random.Random(f"{seed}-pdf-{n}")
+        kind = pdf_kinds[n % len(pdf_kinds)]
+        path = out_dir / f"w{n:04d}_100_{3000 + n}_{kind}.pdf"
+        path.write_bytes(pdf_bytes(rng, spec['pages'], kind))
+        files.append(path)
+    manifest = {'seed': seed, 'embed_format': embed_format, 'pdf_kinds': list(pdf_kinds), **spec,
+                'files': {p.name: p.stat().st_size for p in files}}
+    (out_dir / 'corpus.json').write_text(json.dumps(manifest, indent=2) + '\n', encoding='utf-8')
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic submission corpus.')
+    parser.add_argument('--out', required=True, help='Output directory')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small',
+                        help='Base sizes; the options below override single values (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--docx', type=int, help='Number of DOCX files')
+    parser.add_argument('--paragraphs', type=int, help='Paragraphs per document')
+    parser.add_argument('--track-changes', type=float, help='Share of paragraphs with a tracked insertion and deletion')
+    parser.add_argument('--comments', type=int, help='Comments per document')
+    parser.add_argument('--embedded', type=int, help='Embedded workbooks per document')
+    parser.add_argument('--embed-format', choices=['ole', 'package'], default='ole',
+                        help='Embed workbooks wrapped in an OLE object (as pasted from Excel) or as .xlsx parts')
+    parser.add_argument('--xlsx', type=int, help='Number of XLSX files')
+    parser.add_argument('--rows', type=int, help='Rows per sheet')
+    parser.add_argument('--sheets', type=int, help='Sheets per workbook')
+    parser.add_argument('--strings', type=int, help='Distinct shared strings per workbook')
+    parser.add_argument('--formulas', type=int, help='Filled-down formula columns per sheet')
+    parser.add_argument('--charts', type=int, help='Charts per workbook')
+    parser.add_argument('--pdf', type=int, help='Number of PDF files')
+    parser.add_argument('--pages', type=int, help='Pages per PDF')
+    parser.add_argument('--pdf-kinds', default=','.join(PDF_KINDS),
+                        help='Comma-separated PDF kinds to cycle through (default: %(default)s)')
+    args = parser.parse_args()
+
+    spec = dict(PRESETS[args.preset])
+    for key in spec:
+        value = getattr(args, key)
+        if value is not None:
+            spec[key] = value
+    kinds = tuple(kind.strip() for kind in args.pdf_kinds.split(',') if kind.strip())
+    if not kinds or set(kinds) - set(PDF_KINDS):
+        parser.error(f"--pdf-kinds must be drawn from {', '.join(PDF_KINDS)}")
+
+    files = generate(Path(args.out), spec, args.seed, kinds, args.embed_format)
+    total = sum(p.stat().st_size for p in files)
+    print(f"Done: {len(files)} files, {total / 1e6:.1f} MB in {args.out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
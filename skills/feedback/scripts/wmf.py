@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Run the pre-review stages from one process, with settings from wmf-config.yaml.
+
+    wmf check      dependency check (check_dependencies.py)
+    wmf extract    extract text from the submissions folder
+    wmf render     render the charts of the submitted workbooks
+    wmf run        all of the above: a quick dependency check, then extract
+                   and render with the job journal (see pipeline.py)
+
+Folders come from wmf-config.yaml ('submissions.folder', 'output.extracted',
+'output.rendered', relative to the config file), and so do the worker
+counts and the chart renderer ('pipeline.jobs', 'pipeline.render_jobs',
+'pipeline.renderer'; 'auto' is the fastest working one, see backends.py);
+command-line flags override them. With
+'submissions.rounds.enabled', pass --round N to work on submissions/roundN
+(into feedback_extracted_roundN and feedback_rendered_roundN).
+
+Each stage imports its modules when it starts, so `wmf check` does not load
+the extractor, and `wmf run` loads each stage once instead of starting an
+interpreter per script. PyYAML is used to read the config if installed;
+otherwise a small reader for the subset of YAML the config uses.
+
+Usage:
+    wmf run
+    wmf extract --jobs 4
+    wmf run --round 2 --metrics metrics.jsonl
+    wmf render --config ~/course/wmf-config.yaml --renderer libreoffice
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+CONFIG_NAME = 'wmf-config.yaml'
+DEFAULT_CONFIG = {
+    'submissions': {'folder': 'submissions', 'rounds': {'enabled': False}},
+    'output': {'extracted': 'feedback_extracted', 'rendered': 'feedback_rendered', 'feedback': 'feedback'},
+    'pipeline': {'jobs': None, 'render_jobs': 2, 'renderer': 'auto'},
+}
+RENDERERS = ('auto', 'libreoffice', 'excel', 'quicklook')
+EXTRACT_SUFFIXES = {'.docx', '.doc', '.xlsx', '.xls', '.pdf'}
+
+
+def _scalar(text):
+    if text[:1] in ('"', "'") and text[-1:] == text[0] and len(text) > 1:
+        return text[1:-1]
+    lowered = text.lower()
+    if lowered in ('null', '~'):
+        return None
+    if lowered in ('true', 'yes', 'on'):
+        return True
+    if lowered in ('false', 'no', 'off'):
+        return False
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_simple_yaml(text):
+    """Nested mappings of scalars: the part of YAML that wmf-config.yaml uses."""
+    root = {}
+    stack = [(-1, root)]
+    for number, line in enumerate(text.splitlines(), 1):
+        if line.lstrip().startswith('#') or not line.strip():
+            continue
+        quote = None
+        for i, char in enumerate(line):  # drop a trailing comment outside quotes
+            if char in ('"', "'"):
+                quote = None if quote == char else quote or char
+            elif char == '#' and quote is None and line[i - 1] in ' \t':
+                line = line[:i]
+                break
+        line = line.rstrip()
+        indent = len(line) - len(line.lstrip(' '))
+        key, sep, value = line.strip().partition(':')
+        if not sep or not key:
+            raise ValueError(f"line {number}: expected 'key: value'")
+        while indent <= stack[-1][0]:
+            stack.pop()
+        parent = stack[-1][1]
+        if value.strip():
+            parent[key.strip()] = _scalar(value.strip())
+        else:
+            parent[key.strip()] = {}
+            stack.append((indent, parent[key.strip()]))
+    return root
+
+
+def _merge(defaults, values):
+    if not isinstance(values, dict):
+        return defaults if values is None else values
+    merged = dict(defaults)
+    for key, value in values.items():
+        merged[key] = _merge(defaults[key], value) if isinstance(defaults.get(key), dict) else value
+    return merged
+
+
+def load_config(path=None):
+    """(settings, folder they are relative to) from wmf-config.yaml.
+
+    Without `path`, wmf-config.yaml in the current folder is used if there
+    is one; anything the file leaves out takes its DEFAULT_CONFIG value.
+    """
+    path = Path(path).expanduser() if path else Path(CONFIG_NAME)
+    if not path.exists():
+        if path.name == CONFIG_NAME and path.parent == Path('.'):
+            return _merge(DEFAULT_CONFIG, {}), Path.cwd()
+        raise ValueError(f"{path} not found")
+    text = path.read_text(encoding='utf-8')
+    try:
+        import yaml
+    except ImportError:
+        values = parse_simple_yaml(text)
+    else:
+        values = yaml.safe_load(text) or {}
+    if not isinstance(values, dict):
+        raise ValueError(f"{path}: expected a mapping of settings")
+    return _merge(DEFAULT_CONFIG, values), path.resolve().parent
+
+
+def stage_folders(config, base, round_number=None):
+    """(submissions, extracted, rendered) folders, with the round applied when rounds are enabled."""
+    submissions = base / Path(config['submissions']['folder']).expanduser()
+    extracted = base / Path(config['output']['extracted']).expanduser()
+    rendered = base / Path(config['output']['rendered']).expanduser()
+    rounds = config['submissions'].get('rounds') or {}
+    if rounds.get('enabled'):
+        if round_number is None:
+            raise ValueError(f"rounds are enabled in {CONFIG_NAME}: pass --round N")
+        submissions = submissions / f"round{round_number}"
+        extracted = extracted.with_name(f"{extracted.name}_round{round_number}")
+        rendered = rendered.with_name(f"{rendered.name}_round{round_number}")
+    elif round_number is not None:
+        raise ValueError(f"--round needs submissions.rounds.enabled in {CONFIG_NAME}")
+    return submissions, extracted, rendered
+
+
+def pick_renderer(name):
+    """The renderer to use for `name` ('auto' picks the fastest that works, see backends.py), or None."""
+    from backends import choose
+
+    try:
+        return choose('render', name)
+    except RuntimeError:
+        if name == 'auto':
+            return None
+        raise
+
+
+def quick_check():
+    """One warning line for missing optional dependencies, instead of the full report."""
+    from check_dependencies import missing_dependencies
+
+    missing = missing_dependencies()
+    if missing:
+        print(f"WARNING: missing {', '.join(missing)}; some files may not extract fully "
+              f"(`wmf check` shows how to install)", file=sys.stderr)
+
+
+def extract_stage(paths, extracted_dir, settings, journal, metrics):
+    """{path: failure message} for the files that could not be extracted."""
+    from pipeline import run_pipeline
+
+    failures = run_pipeline(paths, extracted_dir, None, journal, stages=('extract',), jobs=settings['jobs'],
+                            metrics=metrics)
+    return failures['extract']
+
+
+def render_stage(paths, rendered_dir, settings, journal, metrics):
+    """{path: failure message} for the workbooks that could not be rendered."""
+    workbooks = [path for path in paths if path.suffix.lower() == '.xlsx']
+    if not workbooks:
+        return {}
+    renderer = pick_renderer(settings['renderer'])
+    if renderer is None:
+        print("Rendered: skipped, no renderer found (install LibreOffice; `python backends.py` lists what was found)",
+              file=sys.stderr)
+        return {}
+    if renderer == 'libreoffice':
+        from pipeline import run_pipeline
+
+        failures = run_pipeline(workbooks, None, rendered_dir, journal, stages=('render',),
+                                render_jobs=settings['render_jobs'], metrics=metrics)
+        return failures['render']
+
+    from backends import record_speed
+
+    if renderer == 'excel':
+        from render_xlsx_excel import render_xlsx
+    else:
+        from render_xlsx_quicklook import render_xlsx
+    failures = {}
+    start = time.perf_counter()
+    for path in workbooks:
+        try:
+            render_xlsx(path, rendered_dir)
+        except Exception as exc:
+            failures[path] = str(exc)
+    if len(workbooks) > len(failures):
+        record_speed('render', renderer, (time.perf_counter() - start) / (len(workbooks) - len(failures)))
+    print(f"Rendered: {len(workbooks) - len(failures)} rendered with {renderer}, {len(failures)} failed",
+          file=sys.stderr)
+    return failures
+
+
+def main():
+    config_help = f'Config file (default: ./{CONFIG_NAME} if present)'
+    parser = argparse.ArgumentParser(description='Pre-review stages driven by wmf-config.yaml.')
+    parser.add_argument('--config', help=config_help)
+    # Also accepted after the command (wmf run --config X); SUPPRESS keeps a
+    # --config given before the command from being reset to None
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default=argparse.SUPPRESS, help=config_help)
+    sub = parser.add_subparsers(dest='command_name', required=True)
+    sub.add_parser('check', help='Check dependencies and show how to install missing ones')
+    for name, help_text in (('extract', 'Extract text from the submissions'),
+                            ('render', 'Render the charts of the submitted workbooks'),
+                            ('run', 'Check, extract and render in one process')):
+        p = sub.add_parser(name, help=help_text, parents=[common])
+        p.add_argument('--round', type=int, help='Round to work on when rounds are enabled')
+        p.add_argument('--metrics', metavar='FILE',
+                       help='Append per-file, per-stage timings to this JSONL file and print where the time went')
+        if name != 'render':
+            p.add_argument('--jobs', '-j', type=int, help='Extraction worker processes (default: pipeline.jobs, '
+                                                          'or the CPU count)')
+        if name != 'extract':
+            p.add_argument('--render-jobs', type=int,
+                           help='Concurrent LibreOffice processes (default: pipeline.render_jobs)')
+            p.add_argument('--renderer', choices=RENDERERS, help='Chart renderer (default: pipeline.renderer)')
+    args = parser.parse_args()
+
+    if args.command_name == 'check':
+        from check_dependencies import main as check_main
+
+        sys.exit(check_main())
+
+    try:
+        config, base = load_config(args.config)
+        in_path, extracted_dir, rendered_dir = stage_folders(config, base, args.round)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    settings = dict(config['pipeline'])
+    for key in ('jobs', 'render_jobs', 'renderer'):
+        if getattr(args, key, None) is not None:
+            settings[key] = getattr(args, key)
+    settings['jobs'] = settings['jobs'] or os.cpu_count() or 1
+    if settings['renderer'] not in RENDERERS:
+        print(f"ERROR: pipeline.renderer must be one of {', '.join(RENDERERS)}", file=sys.stderr)
+        sys.exit(1)
+    if not in_path.is_dir():
+        print(f"ERROR: {in_path} is not a directory", file=sys.stderr)
+        sys.exit(1)
+
+    from journal import Journal
+    from metrics import MetricsLog
+
+    paths = [p for p in sorted(in_path.iterdir()) if p.suffix.lower() in EXTRACT_SUFFIXES]
+    journal = Journal(extracted_dir / '.journal.jsonl')
+    metrics = MetricsLog(args.metrics) if args.metrics else None
+    failures = {}
+    try:
+        if args.command_name == 'run':
+            quick_check()
+        if args.command_name in ('extract', 'run'):
+            failures['extract'] = extract_stage(paths, extracted_dir, settings, journal, metrics)
+        if args.command_name in ('render', 'run'):
+            failures['render'] = render_stage(paths, rendered_dir, settings, journal, metrics)
+    except RuntimeError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    if metrics:
+        print(metrics.summary(), file=sys.stderr)
+    for stage, failed in failures.items():
+        for path, error in sorted(failed.items()):
+            print(f"  FAILED {stage} {path.name}: {error}", file=sys.stderr)
+    if any(failures.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
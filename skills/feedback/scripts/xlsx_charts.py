@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Read chart definitions straight from xl/charts/chartN.xml.
+
+Each chart yields its type, title, axis titles and series. For each series
+it records the `c:f` range references and the values Excel cached when it
+last saved the file (`c:numCache` / `c:strCache`). Those cached values
+are what the chart displays, so they can be compared with the worksheet
+data directly, without rendering anything.
+
+Usage:
+    python xlsx_charts.py workbook.xlsx
+"""
+
+import argparse
+import json
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+
+from ooxml import sheet_charts
+
+C = '{http://schemas.openxmlformats.org/drawingml/2006/chart}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+AXIS_TAGS = ('catAx', 'valAx', 'dateAx', 'serAx')
+DATA_TAGS = ('cat', 'val', 'xVal', 'yVal', 'bubbleSize')
+
+
+def _cache_values(cache):
+    """Cached points in index order; gaps (blank cells) become None."""
+    count = cache.find(C + 'ptCount')
+    points = {}
+    for pt in cache.findall(C + 'pt'):
+        v = pt.find(C + 'v')
+        points[int(pt.attrib.get('idx', len(points)))] = v.text if v is not None else None
+    size = int(count.attrib.get('val', 0)) if count is not None else 0
+    size = max(size, max(points) + 1 if points else 0)
+    values = [points.get(i) for i in range(size)]
+    if cache.tag == C + 'numCache':
+        values = [float(v) if v not in (None, '') else None for v in values]
+    return values
+
+
+def _data_ref(node):
+    """Reference and cached values from a c:tx / c:cat / c:val style node."""
+    if node is None:
+        return None
+    for ref_tag in ('numRef', 'strRef', 'multiLvlStrRef'):
+        ref = node.find(C + ref_tag)
+        if ref is not None:
+            f = ref.find(C + 'f')
+            cache = ref.find(C + ('numCache' if ref_tag == 'numRef' else 'strCache'))
+            if cache is None:
+                cache = ref.find(C + 'multiLvlStrCache')
+            out = {'ref': f.text if f is not None else None, 'values': []}
+            if cache is not None and cache.tag != C + 'multiLvlStrCache':
+                out['values'] = _cache_values(cache)
+                fmt = cache.find(C + 'formatCode')
+                if fmt is not None and fmt.text:
+                    out['format'] = fmt.text
+            return out
+    for lit_tag in ('numLit', 'strLit'):
+        lit = node.find(C + lit_tag)
+        if lit is not None:
+            return {'ref': None, 'values': _cache_values(lit)}
+    v = node.find(C + 'v')
+    if v is not None:
+        return {'ref': None, 'values': [v.text]}
+    return None
+
+
+def _title_text(title):
+    if title is None:
+        return None
+    tx = title.find(C + 'tx')
+    if tx is None:
+        return None
+    rich = tx.find(C + 'rich')
+    if rich is not None:
+        paragraphs = [''.join(t.text or '' for t in p.iter(A + 't')) for p in rich.iter(A + 'p')]
+        return '\n'.join(p for p in paragraphs if p) or None
+    ref = _data_ref(tx)
+    if ref and ref['values']:
+        return ' '.join(str(v) for v in ref['values'] if v is not None)
+    return None
+
+
+def parse_chart(f):
+    """Parse one chartN.xml into a dict: types, title, axes and series."""
+    root = ET.parse(f).getroot()
+    chart = root.find(C + 'chart')
+    spec = {'types': [], 'title': None, 'axes': [], 'series': []}
+    if chart is None:
+        return spec
+    spec['title'] = _title_text(chart.find(C + 'title'))
+    plot = chart.find(C + 'plotArea')
+    if plot is None:
+        return spec
+    for group in plot:
+        kind = group.tag[len(C):] if group.tag.startswith(C) else group.tag
+        if kind.endswith('Chart'):
+            spec['types'].append(kind)
+            for ser in group.findall(C + 'ser'):
+                name = _data_ref(ser.find(C + 'tx'))
+                series = {
+                    'type': kind,
+                    'index': int(ser.find(C + 'idx').attrib['val']) if ser.find(C + 'idx') is not None else None,
+                    'name': ' '.join(str(v) for v in name['values'] if v is not None) if name else None,
+                    'name_ref': name['ref'] if name else None,
+                }
+                for data_tag in DATA_TAGS:
+                    ref = _data_ref(ser.find(C + data_tag))
+                    if ref is not None:
+                        series[data_tag] = ref
+                spec['series'].append(series)
+        elif kind in AXIS_TAGS:
+            ax_id = group.find(C + 'axId')
+            pos = group.find(C + 'axPos')
+            spec['axes'].append({
+                'kind': kind,
+                'id': ax_id.attrib.get('val') if ax_id is not None else None,
+                'position': pos.attrib.get('val') if pos is not None else None,
+                'title': _title_text(group.find(C + 'title')),
+            })
+    return spec
+
+
+def workbook_charts(z):
+    """Parse every chart in an open workbook zip, linked to its host sheet."""
+    hosts = {}
+    for sheet_name, parts in sheet_charts(z).items():
+        for part in parts:
+            hosts[part] = sheet_name
+    charts = []
+    for name in sorted(n for n in z.namelist() if n.startswith('xl/charts/chart') and n.endswith('.xml')):
+        with z.open(name) as f:
+            spec = parse_chart(f)
+        spec['part'] = name
+        spec['sheet'] = hosts.get(name)
+        charts.append(spec)
+    return charts
+
+
+def _preview(values, limit=12):
+    shown = ', '.join('' if v is None else f"{v:g}" if isinstance(v, float) else str(v) for v in values[:limit])
+    if len(values) > limit:
+        shown += f", ... ({len(values)} points)"
+    return shown
+
+
+def format_charts(charts):
+    """Text rendering used in the extraction output."""
+    out = []
+    for spec in charts:
+        host = f" on sheet {spec['sheet']}" if spec.get('sheet') else ""
+        title = f' "{spec["title"]}"' if spec.get('title') else ""
+        out.append(f"[Chart] {spec['part']}{host}: {', '.join(spec['types']) or 'unknown type'}{title}")
+        for axis in spec['axes']:
+            if axis['title']:
+                position = f" ({axis['position']})" if axis['position'] else ""
+                out.append(f"  axis {axis['kind']}{position}: \"{axis['title']}\"")
+        for series in spec['series']:
+            name = series['name'] or '(unnamed)'
+            ref = f" ({series['name_ref']})" if series.get('name_ref') else ""
+            out.append(f"  series \"{name}\"{ref} [{series['type']}]")
+            for data_tag in DATA_TAGS:
+                data = series.get(data_tag)
+                if data:
+                    out.append(f"    {data_tag}: {data['ref'] or 'literal'} = {_preview(data['values'])}")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print chart specs from an XLSX workbook as JSON.')
+    parser.add_argument('workbook', help='XLSX file')
+    args = parser.parse_args()
+    with zipfile.ZipFile(args.workbook) as z:
+        json.dump(workbook_charts(z), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()